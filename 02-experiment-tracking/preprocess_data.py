@@ -5,6 +5,9 @@ import click
 import pandas as pd
 from sklearn.feature_extraction import DictVectorizer
 
+from encoder import ZonePairEncoder
+from taxi_data import read_trips
+
 
 def dump_pickle(obj, filename: str):
     with open(filename, "wb") as f_out:
@@ -12,27 +15,22 @@ def dump_pickle(obj, filename: str):
 
 
 def read_dataframe(filename: str):
-    df = pd.read_parquet(filename)
-
-    df["duration"] = df["lpep_dropoff_datetime"] - df["lpep_pickup_datetime"]
-    df.duration = df.duration.apply(lambda td: td.total_seconds() / 60.0)
-    df = df[(df.duration >= 1) & (df.duration <= 60)]
-
-    categorical = ["PULocationID", "DOLocationID"]
-    df[categorical] = df[categorical].astype(str)
+    df = read_trips(filename, columns=["tip_amount"])
 
     return df
 
 
 def preprocess(df: pd.DataFrame, dv: DictVectorizer, fit_dv: bool = False):
-    df["PU_DO"] = df["PULocationID"] + "_" + df["DOLocationID"]
-    categorical = ["PU_DO"]
-    numerical = ["trip_distance"]
-    dicts = df[categorical + numerical].to_dict(orient="records")
+    # same matrix as the DictVectorizer on PU_DO + trip_distance dicts,
+    # built straight from the columns
     if fit_dv:
-        X = dv.fit_transform(dicts)
+        encoder = ZonePairEncoder.fit(
+            df["PULocationID"], df["DOLocationID"], sparse=dv.sparse
+        )
+        dv = encoder.to_dict_vectorizer()
     else:
-        X = dv.transform(dicts)
+        encoder = ZonePairEncoder.from_dict_vectorizer(dv)
+    X = encoder.transform(df["PULocationID"], df["DOLocationID"], df["trip_distance"])
     return X, dv
 
 
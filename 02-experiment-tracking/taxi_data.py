@@ -0,0 +1,156 @@
+import os
+import shutil
+import tempfile
+import urllib.request
+from typing import Iterator, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+PICKUP_COLUMN = "lpep_pickup_datetime"
+DROPOFF_COLUMN = "lpep_dropoff_datetime"
+FEATURE_COLUMNS = ["PULocationID", "DOLocationID", "trip_distance"]
+
+# rides per record batch when scanning, the scanner's own default
+BATCH_SIZE = 131_072
+
+UNITS_PER_MINUTE = {"s": 60, "ms": 60_000, "us": 60_000_000, "ns": 60_000_000_000}
+
+DATA_CACHE_DIR = os.getenv(
+    "TAXI_DATA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "taxi_data")
+)
+
+
+def local_path(source: str, cache_dir: str = DATA_CACHE_DIR) -> str:
+    """Download an http(s) parquet file once, other paths are used as is.
+
+    pyarrow reads local and S3 files lazily but has no http filesystem.
+    The download is streamed to disk and renamed into place when complete.
+    """
+    if not source.startswith(("http://", "https://")):
+        return source
+
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, os.path.basename(source))
+    if not os.path.exists(path):
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".part")
+        try:
+            with urllib.request.urlopen(source) as response, os.fdopen(
+                fd, "wb"
+            ) as f_out:
+                shutil.copyfileobj(response, f_out)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return path
+
+
+def duration_filter(
+    schema: pa.Schema,
+    min_duration: float = 1,
+    max_duration: float = 60,
+    pickup_column: str = PICKUP_COLUMN,
+    dropoff_column: str = DROPOFF_COLUMN,
+) -> ds.Expression:
+    """Dataset expression keeping rides of [min_duration, max_duration] minutes."""
+    unit = schema.field(pickup_column).type.unit
+    duration_type = pa.duration(unit)
+    units_per_minute = UNITS_PER_MINUTE[unit]
+    duration = pc.field(dropoff_column) - pc.field(pickup_column)
+    return (
+        duration >= pa.scalar(int(min_duration * units_per_minute), duration_type)
+    ) & (duration <= pa.scalar(int(max_duration * units_per_minute), duration_type))
+
+
+def to_trips(
+    df: pd.DataFrame,
+    columns: List[str],
+    pickup_column: str = PICKUP_COLUMN,
+    dropoff_column: str = DROPOFF_COLUMN,
+) -> pd.DataFrame:
+    """Add the duration in minutes and keep the feature columns plus `columns`."""
+    duration = df[dropoff_column] - df[pickup_column]
+    df = df[list(dict.fromkeys(FEATURE_COLUMNS + columns))].copy()
+    df["duration"] = duration.dt.total_seconds() / 60.0
+    for column in ["PULocationID", "DOLocationID"]:
+        df[column] = pd.to_numeric(df[column], downcast="integer")
+    return df
+
+
+def trips_scanner(
+    filename: str,
+    columns: List[str],
+    min_duration: float = 1,
+    max_duration: float = 60,
+    batch_size: int = BATCH_SIZE,
+    pickup_column: str = PICKUP_COLUMN,
+    dropoff_column: str = DROPOFF_COLUMN,
+) -> ds.Scanner:
+    """Scanner reading only the needed columns of the rides in range."""
+    dataset = ds.dataset(local_path(filename), format="parquet")
+    return dataset.scanner(
+        columns=list(
+            dict.fromkeys(FEATURE_COLUMNS + columns + [pickup_column, dropoff_column])
+        ),
+        filter=duration_filter(
+            dataset.schema, min_duration, max_duration, pickup_column, dropoff_column
+        ),
+        batch_size=batch_size,
+    )
+
+
+def scan_trips(
+    filename: str,
+    columns: Optional[List[str]] = None,
+    min_duration: float = 1,
+    max_duration: float = 60,
+    batch_size: int = BATCH_SIZE,
+    pickup_column: str = PICKUP_COLUMN,
+    dropoff_column: str = DROPOFF_COLUMN,
+) -> Iterator[pd.DataFrame]:
+    """Like read_trips, but yield the rides one record batch at a time."""
+    columns = list(columns or [])
+    scanner = trips_scanner(
+        filename,
+        columns,
+        min_duration,
+        max_duration,
+        batch_size,
+        pickup_column,
+        dropoff_column,
+    )
+    for batch in scanner.to_batches():
+        if batch.num_rows > 0:
+            yield to_trips(batch.to_pandas(), columns, pickup_column, dropoff_column)
+
+
+def read_trips(
+    filename: str,
+    columns: Optional[List[str]] = None,
+    min_duration: float = 1,
+    max_duration: float = 60,
+    pickup_column: str = PICKUP_COLUMN,
+    dropoff_column: str = DROPOFF_COLUMN,
+) -> pd.DataFrame:
+    """Read the feature columns plus `columns` and the duration in minutes.
+
+    Only the needed parquet columns are read. The scan goes through the
+    file row group by row group and drops rides outside
+    [min_duration, max_duration] minutes before they are turned into a
+    DataFrame. The location ids come back as the smallest integer type
+    that holds them.
+    """
+    columns = list(columns or [])
+    scanner = trips_scanner(
+        filename,
+        columns,
+        min_duration,
+        max_duration,
+        pickup_column=pickup_column,
+        dropoff_column=dropoff_column,
+    )
+    table = scanner.to_table()
+    return to_trips(table.to_pandas(), columns, pickup_column, dropoff_column)
@@ -11,17 +11,13 @@ import xgboost as xgb
 from sklearn.feature_extraction import DictVectorizer
 from sklearn.metrics import mean_squared_error
 
+from encoder import ZonePairEncoder
+from taxi_data import read_trips
+
 
 def read_data(filename: str) -> pd.DataFrame:
     """Read data into DataFrame."""
-    df = pd.read_parquet(filename)
-
-    df["duration"] = df["lpep_dropoff_datetime"] - df["lpep_pickup_datetime"]
-    df.duration = df.duration.apply(lambda td: td.total_seconds() / 60.0)
-    df = df[(df.duration >= 1) & (df.duration <= 60)]
-
-    categorical = ["PULocationID", "DOLocationID"]
-    df[categorical] = df[categorical].astype(str)
+    df = read_trips(filename)
 
     return df
 
@@ -38,19 +34,17 @@ def add_features(
     ]
 ):
     """Add features to the model"""
-    df_train["PU_DO"] = df_train["PULocationID"] + "_" + df_train["DOLocationID"]
-    df_val["PU_DO"] = df_val["PULocationID"] + "_" + df_val["DOLocationID"]
-
-    categorical = ["PU_DO"]
-    numerical = ["trip_distance"]
-
-    dv = DictVectorizer()
-
-    train_dicts = df_train[categorical + numerical].to_dict(orient="records")
-    X_train = dv.fit_transform(train_dicts)
-
-    val_dicts = df_val[categorical + numerical].to_dict(orient="records")
-    X_val = dv.transform(val_dicts)
+    # PU_DO one-hot + trip_distance, the same matrix and vocabulary as a
+    # DictVectorizer on the dicts, built straight from the columns
+    encoder = ZonePairEncoder.fit(df_train["PULocationID"], df_train["DOLocationID"])
+    dv = encoder.to_dict_vectorizer()
+
+    X_train = encoder.transform(
+        df_train["PULocationID"], df_train["DOLocationID"], df_train["trip_distance"]
+    )
+    X_val = encoder.transform(
+        df_val["PULocationID"], df_val["DOLocationID"], df_val["trip_distance"]
+    )
 
     y_train = df_train["duration"].values
     y_val = df_val["duration"].values
@@ -0,0 +1,226 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import uuid
+
+ARTIFACT_ROOT = os.getenv("MODEL_ARTIFACT_ROOT", "s3://taxi-mlops/1")
+MODEL_CACHE_DIR = os.getenv(
+    "MODEL_CACHE_DIR", os.path.join(tempfile.gettempdir(), "model_cache")
+)
+MODEL_CACHE_MAX_BYTES = int(os.getenv("MODEL_CACHE_MAX_BYTES", str(2 * 1024**3)))
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def model_uri(run_id, artifact_root=ARTIFACT_ROOT):
+    return f"{artifact_root}/{run_id}/artifacts/model"
+
+
+def file_checksum(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f_in:
+        for chunk in iter(lambda: f_in.read(CHUNK_SIZE), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def tree_checksums(root):
+    """sha256 of every file below root, keyed by its relative path."""
+    checksums = {}
+    for dir_path, _, file_names in os.walk(root):
+        for file_name in file_names:
+            path = os.path.join(dir_path, file_name)
+            checksums[os.path.relpath(path, root)] = file_checksum(path)
+    return dict(sorted(checksums.items()))
+
+
+def download_artifacts(artifact_uri, dst_path):
+    """Copy the artifact directory into dst_path and return the local copy.
+
+    S3 and local directories are handled with boto3 and shutil, importing
+    mlflow costs seconds of cold start and is only done for other stores.
+    """
+    local_path = os.path.join(dst_path, os.path.basename(artifact_uri.rstrip("/")))
+
+    if artifact_uri.startswith("s3://"):
+        import boto3
+
+        bucket, _, prefix = artifact_uri[len("s3://") :].partition("/")
+        prefix = prefix.rstrip("/") + "/"
+        s3_client = boto3.client("s3")
+        paginator = s3_client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for s3_object in page.get("Contents", []):
+                key = s3_object["Key"]
+                path = os.path.join(local_path, key[len(prefix) :])
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                s3_client.download_file(bucket, key, path)
+        if not os.path.isdir(local_path):
+            raise FileNotFoundError(f"No artifacts found at {artifact_uri}")
+        return local_path
+
+    if artifact_uri.startswith("file://"):
+        artifact_uri = artifact_uri[len("file://") :]
+    if os.path.isdir(artifact_uri):
+        shutil.copytree(artifact_uri, local_path)
+        return local_path
+
+    from mlflow.artifacts import download_artifacts as mlflow_download_artifacts
+
+    return mlflow_download_artifacts(artifact_uri=artifact_uri, dst_path=dst_path)
+
+
+def load_sklearn_model(path):
+    """Unpickle the sklearn flavor of a logged model without importing mlflow.
+
+    Same object as mlflow.sklearn.load_model, cloudpickle output is read
+    by the standard pickle module.
+    """
+    import yaml
+
+    with open(os.path.join(path, "MLmodel")) as f_in:
+        flavor = yaml.safe_load(f_in)["flavors"]["sklearn"]
+
+    serialization_format = flavor.get("serialization_format", "cloudpickle")
+    if serialization_format not in ("pickle", "cloudpickle"):
+        raise ValueError(f"Unsupported serialization format {serialization_format}")
+
+    with open(os.path.join(path, flavor["pickled_model"]), "rb") as f_in:
+        return pickle.load(f_in)
+
+
+def tree_size(root):
+    return sum(
+        os.path.getsize(os.path.join(dir_path, file_name))
+        for dir_path, _, file_names in os.walk(root)
+        for file_name in file_names
+    )
+
+
+class ModelCache:
+    """On-disk cache of logged model artifacts, keyed by run id.
+
+    The artifacts of a run are stored once under `objects/<digest>`, the
+    digest being the sha256 of their file checksums, and `runs/<run_id>.json`
+    points at it. Downloads go to a staging directory that is renamed into
+    place, so a crashed or concurrent download never leaves half a model
+    behind. Files are checked against their checksums before every load and
+    the least recently used objects are dropped beyond max_bytes.
+
+    Loaded models are also memoized per process, so calling load again for
+    the same run and loader is free.
+    """
+
+    def __init__(
+        self,
+        cache_dir=MODEL_CACHE_DIR,
+        max_bytes=MODEL_CACHE_MAX_BYTES,
+        artifact_root=ARTIFACT_ROOT,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.artifact_root = artifact_root
+        self.memo = {}
+        self.lock = threading.Lock()
+
+    def index_path(self, run_id):
+        return os.path.join(self.cache_dir, "runs", f"{run_id}.json")
+
+    def object_path(self, digest):
+        return os.path.join(self.cache_dir, "objects", digest)
+
+    def download(self, run_id):
+        staging_dir = os.path.join(self.cache_dir, "staging", uuid.uuid4().hex)
+        os.makedirs(staging_dir)
+        try:
+            local_path = download_artifacts(
+                artifact_uri=model_uri(run_id, self.artifact_root),
+                dst_path=staging_dir,
+            )
+            checksums = tree_checksums(local_path)
+            digest = hashlib.sha256(
+                json.dumps(checksums, sort_keys=True).encode()
+            ).hexdigest()
+
+            object_path = self.object_path(digest)
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            try:
+                os.rename(local_path, object_path)
+            except OSError:
+                # another process stored the same content first
+                if not os.path.isdir(object_path):
+                    raise
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+        self.write_index(run_id, {"digest": digest, "files": checksums})
+        return digest
+
+    def write_index(self, run_id, index):
+        index_path = self.index_path(run_id)
+        os.makedirs(os.path.dirname(index_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(index_path))
+        with os.fdopen(fd, "w") as f_out:
+            json.dump(index, f_out)
+        os.replace(tmp_path, index_path)
+
+    def read_index(self, run_id):
+        try:
+            with open(self.index_path(run_id)) as f_in:
+                return json.load(f_in)
+        except (OSError, ValueError):
+            return None
+
+    def is_valid(self, index):
+        object_path = self.object_path(index["digest"])
+        try:
+            return tree_checksums(object_path) == index["files"]
+        except OSError:
+            return False
+
+    def get_path(self, run_id):
+        """Local directory with the model artifacts of run_id."""
+        index = self.read_index(run_id)
+        if index is None or not self.is_valid(index):
+            if index is not None:
+                shutil.rmtree(self.object_path(index["digest"]), ignore_errors=True)
+            digest = self.download(run_id)
+        else:
+            digest = index["digest"]
+
+        object_path = self.object_path(digest)
+        os.utime(object_path)
+        self.evict(keep=digest)
+        return object_path
+
+    def evict(self, keep=None):
+        """Drop the least recently used objects until max_bytes is respected."""
+        objects_dir = os.path.join(self.cache_dir, "objects")
+        objects = []
+        for digest in os.listdir(objects_dir):
+            path = os.path.join(objects_dir, digest)
+            objects.append((os.path.getmtime(path), tree_size(path), digest, path))
+
+        total = sum(size for _, size, _, _ in objects)
+        for _, size, digest, path in sorted(objects):
+            if total <= self.max_bytes:
+                break
+            if digest == keep:
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def load(self, run_id, loader):
+        """loader(local_path) for the model of run_id, once per process."""
+        key = (loader.__module__, loader.__qualname__, run_id)
+        with self.lock:
+            if key not in self.memo:
+                self.memo[key] = loader(self.get_path(run_id))
+            return self.memo[key]
+
+
+model_cache = ModelCache()
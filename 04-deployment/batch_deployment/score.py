@@ -5,16 +5,25 @@ import argparse
 import os
 import uuid
 from datetime import datetime
-from typing import Dict, List, Tuple
+from typing import List, Tuple
 
 import mlflow
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import scipy.sparse as sp
+from pyarrow import fs
+from sklearn.base import BaseEstimator
 
 # from dateutil.relativedelta import relativedelta
 from prefect import flow, get_run_logger, task
 from prefect.artifacts import create_markdown_artifact
 from prefect.context import get_run_context
 
+from encoder import ZonePairEncoder
+from model_cache import model_cache
+from taxi_data import read_trips, scan_trips
+
 
 def generate_uuids(length: int) -> List[str]:
     """Generate uuid for each record."""
@@ -23,73 +32,108 @@ def generate_uuids(length: int) -> List[str]:
 
 def read_dataframe(filename: str) -> pd.DataFrame:
     """Read DataFrame and target column from secs to mins."""
-    df = pd.read_parquet(filename)
-
-    df["duration"] = df["lpep_dropoff_datetime"] - df["lpep_pickup_datetime"]
-    df.duration = df.duration.apply(lambda td: td.total_seconds() / 60.0)
-    df = df[(df.duration >= 1) & (df.duration <= 60)]
+    df = read_trips(filename, columns=["lpep_pickup_datetime"])
 
     df["ride_id"] = generate_uuids(len(df))
     return df
 
 
-def prepare_dictionaries(df: pd.DataFrame) -> List[Dict]:
-    """Turn DataFrame into list of dictionary."""
-    # convert data type
-    categorical_str = ["PULocationID", "DOLocationID"]
-    df[categorical_str] = df[categorical_str].astype(str)
+def prepare_features(df: pd.DataFrame, encoder: ZonePairEncoder) -> sp.csr_matrix:
+    """Encode the PU_DO and trip_distance features straight from the columns."""
+    return encoder.transform(
+        df["PULocationID"], df["DOLocationID"], df["trip_distance"]
+    )
 
-    # Feature engineering
-    df["PU_DO"] = df["PULocationID"] + "_" + df["DOLocationID"]
-    categorical = ["PU_DO"]
-    numerical = ["trip_distance"]
-    dicts = df[categorical + numerical].to_dict(orient="records")
-    return dicts
 
+def load_model(run_id: str) -> Tuple[BaseEstimator, ZonePairEncoder]:
+    """Load model from S3 bucket, the DictVectorizer becomes an encoder.
 
-def load_model(run_id):
-    """Load model from S3 bucket."""
-    logged_model = f"s3://taxi-mlops/1/{run_id}/artifacts/model"
-    model = mlflow.pyfunc.load_model(logged_model)
-    return model
+    The artifacts are downloaded once into the local model cache and shared
+    by every backfill worker on the machine.
+    """
+    pipeline = model_cache.load(run_id, mlflow.sklearn.load_model)
 
+    dv = pipeline.steps[0][1]
+    if len(pipeline.steps) != 2 or not hasattr(dv, "vocabulary_"):
+        raise ValueError(
+            f"Expected a DictVectorizer + estimator pipeline, got {pipeline.steps}"
+        )
 
-def save_results(
-    df: pd.DataFrame, y_pred: List[float], run_id: str, output_file: str
-) -> pd.DataFrame:
-    """Create result dataframe and save it to parquet."""
+    model = pipeline.steps[-1][1]
+    encoder = ZonePairEncoder.from_dict_vectorizer(dv)
+    return model, encoder
+
+
+def make_results(df: pd.DataFrame, y_pred: List[float], run_id: str) -> pd.DataFrame:
+    """Create result dataframe."""
     df_result = pd.DataFrame()
     df_result["ride_id"] = df["ride_id"]
     df_result["lpep_pickup_datetime"] = df["lpep_pickup_datetime"]
-    df_result["PULocationID"] = df["PULocationID"]
-    df_result["DOLocationID"] = df["DOLocationID"]
+    # location ids are written as strings, like in the earlier outputs
+    df_result["PULocationID"] = df["PULocationID"].astype(str)
+    df_result["DOLocationID"] = df["DOLocationID"].astype(str)
     df_result["actual_duration"] = df["duration"]
     df_result["predicted_duration"] = y_pred
     df_result["diff"] = df_result["actual_duration"] - df_result["predicted_duration"]
     df_result["model_version"] = run_id
-
-    df_result.to_parquet(output_file, index=False)
     return df_result
 
 
-@task
-def apply_model(input_file, run_id, output_file):
-    logger = get_run_logger()
-
-    logger.info(f"Reading the data from {input_file}...")
-    df = read_dataframe(input_file)
-    dicts = prepare_dictionaries(df)
-
-    logger.info(f"Loading the model with RUN_ID={run_id}...")
-    model = load_model(run_id)
-
-    logger.info("applying the model...")
-    y_pred = model.predict(dicts)
-
-    logger.info(f"Saving the result to {output_file}...")
+def save_results(
+    df: pd.DataFrame, y_pred: List[float], run_id: str, output_file: str
+) -> pd.DataFrame:
+    """Create result dataframe and save it to parquet."""
+    df_result = make_results(df, y_pred, run_id)
+    df_result.to_parquet(output_file, index=False)
+    return df_result
 
-    result = save_results(df, y_pred, run_id, output_file)
 
+def score_in_batches(
+    input_file: str,
+    model: BaseEstimator,
+    encoder: ZonePairEncoder,
+    run_id: str,
+    output_file: str,
+    batch_size: int,
+) -> float:
+    """Score the month one record batch at a time and return the mean diff.
+
+    Every batch is read, featurized, predicted and appended to the output
+    parquet before the next one is read, so memory is bounded by the batch
+    size instead of the size of the month.
+    """
+    writer = None
+    diff_sum = 0.0
+    n_rides = 0
+
+    try:
+        for df in scan_trips(
+            input_file, columns=["lpep_pickup_datetime"], batch_size=batch_size
+        ):
+            df["ride_id"] = generate_uuids(len(df))
+            y_pred = model.predict(prepare_features(df, encoder))
+            df_result = make_results(df, y_pred, run_id)
+
+            table = pa.Table.from_pandas(df_result, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(output_file, table.schema)
+            writer.write_table(table.cast(writer.schema))
+
+            diff_sum += df_result["diff"].sum()
+            n_rides += len(df_result)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        # no ride in range, still leave an (empty) output behind
+        save_results(read_dataframe(input_file), [], run_id, output_file)
+
+    return diff_sum / n_rides if n_rides > 0 else float("nan")
+
+
+def create_report(input_file: str, mean_diff: float) -> None:
+    """Publish the mean difference of the month as a markdown artifact."""
     start_index = (
         input_file.rfind("_") + 1
     )  # Find the index of the underscore before the desired portion
@@ -108,12 +152,91 @@ def apply_model(input_file, run_id, output_file):
         ## Random Forest Model
         |   Year/Month    | Mean difference |
         |:----------------|----------------:|
-        |    {year_month}      |          {result["diff"].mean():.2f} |
+        |    {year_month}      |          {mean_diff:.2f} |
         """
 
     create_markdown_artifact(key="duration-report", markdown=markdown_report)
 
 
+def output_filesystem(output_file: str) -> Tuple[fs.FileSystem, str]:
+    """Filesystem and path of an s3:// (or other) URI or a local path."""
+    if "://" in output_file:
+        return fs.FileSystem.from_uri(output_file)
+    return fs.LocalFileSystem(), os.path.abspath(output_file)
+
+
+def output_exists(output_file: str) -> bool:
+    filesystem, path = output_filesystem(output_file)
+    return filesystem.get_file_info(path).type != fs.FileType.NotFound
+
+
+def remove_output(output_file: str) -> None:
+    filesystem, path = output_filesystem(output_file)
+    if filesystem.get_file_info(path).type != fs.FileType.NotFound:
+        filesystem.delete_file(path)
+
+
+def staging_output(output_file: str) -> str:
+    """A unique file next to output_file, hidden from dataset readers by its _."""
+    head, sep, name = output_file.rpartition("/")
+    return f"{head}{sep}_{name}.{uuid.uuid4().hex}.tmp"
+
+
+def commit_output(staging_file: str, output_file: str) -> None:
+    filesystem, staging_path = output_filesystem(staging_file)
+    _, path = output_filesystem(output_file)
+    filesystem.move(staging_path, path)
+
+
+def score_file(
+    input_file: str,
+    model: BaseEstimator,
+    encoder: ZonePairEncoder,
+    run_id: str,
+    output_file: str,
+    batch_size: int = None,
+) -> float:
+    """Score one month into output_file and return its mean diff.
+
+    The month is written to a staging file that replaces output_file only
+    once scoring succeeded. A failed run deletes the staging file and keeps
+    the output of an earlier run, and the batches written so far never show
+    up as a valid output a backfill would skip as done.
+    """
+    staging_file = staging_output(output_file)
+    try:
+        if batch_size:
+            mean_diff = score_in_batches(
+                input_file, model, encoder, run_id, staging_file, batch_size
+            )
+        else:
+            df = read_dataframe(input_file)
+            y_pred = model.predict(prepare_features(df, encoder))
+            mean_diff = save_results(df, y_pred, run_id, staging_file)["diff"].mean()
+        commit_output(staging_file, output_file)
+    except BaseException:
+        remove_output(staging_file)
+        raise
+    return mean_diff
+
+
+@task
+def apply_model(input_file, run_id, output_file, batch_size=None):
+    logger = get_run_logger()
+
+    logger.info(f"Loading the model with RUN_ID={run_id}...")
+    model, encoder = load_model(run_id)
+
+    if batch_size:
+        logger.info(f"Scoring {input_file} in batches of {batch_size}...")
+    else:
+        logger.info(f"Scoring {input_file}...")
+    mean_diff = score_file(input_file, model, encoder, run_id, output_file, batch_size)
+    logger.info(f"Saved the result to {output_file}")
+
+    create_report(input_file, mean_diff)
+
+
 def get_paths(run_date: datetime, taxi_type: str, run_id: str) -> Tuple[str]:
     """Getting the path for input and ouput file"""
     # prev_month = run_date - relativedelta(months=1)
@@ -127,7 +250,9 @@ def get_paths(run_date: datetime, taxi_type: str, run_id: str) -> Tuple[str]:
 
 
 @flow(name="inference")
-def ride_duration_prediction(taxi_type: str, run_id: str, run_date: datetime = None):
+def ride_duration_prediction(
+    taxi_type: str, run_id: str, run_date: datetime = None, batch_size: int = None
+):
     if run_date is None:
         ctx = get_run_context()
         run_date = ctx.flow_run.expected_start_time
@@ -135,7 +260,12 @@ def ride_duration_prediction(taxi_type: str, run_id: str, run_date: datetime = N
     input_file, output_file = get_paths(run_date, taxi_type, run_id)
     os.environ["AWS_PROFILE"] = "Profile1"
 
-    apply_model(input_file=input_file, run_id=run_id, output_file=output_file)
+    apply_model(
+        input_file=input_file,
+        run_id=run_id,
+        output_file=output_file,
+        batch_size=batch_size,
+    )
 
 
 if __name__ == "__main__":
@@ -151,6 +281,12 @@ if __name__ == "__main__":
     parser.add_argument(
         "--run_id", type=str, help="MLflow run id for model in S3 bucket"
     )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        help="Score the month in record batches of this size, all at once when empty",
+        default=None,
+    )
 
     args = parser.parse_args()
 
@@ -163,4 +299,5 @@ if __name__ == "__main__":
         taxi_type=args.taxi_type,
         run_id=args.run_id,
         run_date=run_date,
+        batch_size=args.batch_size,
     )
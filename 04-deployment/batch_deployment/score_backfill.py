@@ -1,26 +1,169 @@
-import score
+import argparse
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime
+from typing import List
+
 from dateutil.relativedelta import relativedelta
 
-from prefect import flow
+from prefect import flow, get_run_logger
+from prefect.artifacts import create_markdown_artifact
 
+import score
 
-@flow
-def ride_duration_prediction_backfill():
-    start_date = datetime(year=2021, month=3, day=1)
-    end_date = datetime(year=2022, month=4, day=1)
+# (model, encoder) of a worker process, loaded once by init_worker
+worker_model = None
 
-    d = start_date
 
-    while d <= end_date:
-        score.ride_duration_prediction(
-            taxi_type='green',
-            run_id='95c848791a7642ff8c26794d43e410a8',
-            run_date=d
-        )
+def init_worker(run_id: str) -> None:
+    """Load the model once per worker instead of once per month."""
+    global worker_model
+    os.environ["AWS_PROFILE"] = "Profile1"
+    worker_model = score.load_model(run_id)
+
 
+def score_month(
+    input_file: str, output_file: str, run_id: str, batch_size: int = None
+) -> float:
+    model, encoder = worker_model
+    return score.score_file(input_file, model, encoder, run_id, output_file, batch_size)
+
+
+def get_run_dates(start_date: datetime, end_date: datetime) -> List[datetime]:
+    run_dates = []
+    d = start_date
+    while d <= end_date:
+        run_dates.append(d)
         d = d + relativedelta(months=1)
+    return run_dates
+
+
+def create_backfill_report(mean_diffs: dict) -> None:
+    rows = "\n".join(
+        f"        |    {year_month}      |          {mean_diff:.2f} |"
+        for year_month, mean_diff in sorted(mean_diffs.items())
+    )
+    markdown_report = f"""# Backfill Prediction Report
+        ## Summary
+
+        Duration Prediction
+
+        ## Random Forest Model
+        |   Year/Month    | Mean difference |
+        |:----------------|----------------:|
+{rows}
+        """
+
+    create_markdown_artifact(key="duration-backfill-report", markdown=markdown_report)
+
+
+@flow
+def ride_duration_prediction_backfill(
+    taxi_type: str = "green",
+    run_id: str = "95c848791a7642ff8c26794d43e410a8",
+    start_date: datetime = datetime(year=2021, month=3, day=1),
+    end_date: datetime = datetime(year=2022, month=4, day=1),
+    workers: int = None,
+    batch_size: int = None,
+    overwrite: bool = False,
+):
+    """Score every month from start_date to end_date in a process pool.
+
+    Months whose output already exists are skipped unless overwrite is set,
+    so a failed backfill can simply be started again. A month that fails
+    keeps the output it had before, or none, so it is scored again on the
+    next run.
+    """
+    logger = get_run_logger()
+    os.environ["AWS_PROFILE"] = "Profile1"
+
+    months = {}
+    for run_date in get_run_dates(start_date, end_date):
+        input_file, output_file = score.get_paths(run_date, taxi_type, run_id)
+        if not overwrite and score.output_exists(output_file):
+            logger.info(f"Skipping {run_date:%Y-%m}, {output_file} already exists")
+            continue
+        months[f"{run_date:%Y-%m}"] = (input_file, output_file)
+
+    if not months:
+        logger.info("Nothing to backfill")
+        return
+
+    workers = min(workers or os.cpu_count(), len(months))
+    logger.info(f"Scoring {len(months)} months with {workers} workers...")
+
+    # download the model once, the workers then load it from the local cache
+    # instead of all fetching the same artifacts at the same time
+    logger.info(f"Downloading the model with RUN_ID={run_id}...")
+    score.model_cache.get_path(run_id)
+
+    mean_diffs = {}
+    failed = []
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(run_id,),
+    ) as executor:
+        futures = {
+            executor.submit(
+                score_month, input_file, output_file, run_id, batch_size
+            ): year_month
+            for year_month, (input_file, output_file) in months.items()
+        }
+        for future in as_completed(futures):
+            year_month = futures[future]
+            try:
+                mean_diffs[year_month] = future.result()
+            except Exception as e:
+                logger.error(f"Scoring {year_month} failed: {e!r}")
+                failed.append(year_month)
+            else:
+                logger.info(f"Scored {year_month}")
+
+    if mean_diffs:
+        create_backfill_report(mean_diffs)
+    if failed:
+        raise RuntimeError(f"Backfill failed for {sorted(failed)}")
+
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--taxi_type", type=str, help="The taxi type", default="green")
+    parser.add_argument(
+        "--run_id",
+        type=str,
+        help="MLflow run id for model in S3 bucket",
+        default="95c848791a7642ff8c26794d43e410a8",
+    )
+    parser.add_argument(
+        "--start", type=str, help="First month, YYYY-MM", default="2021-03"
+    )
+    parser.add_argument(
+        "--end", type=str, help="Last month, YYYY-MM", default="2022-04"
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Worker processes, one per core when empty"
+    )
+    parser.add_argument(
+        "--batch_size",
+        type=int,
+        help="Score each month in record batches of this size, all at once when empty",
+    )
+    parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Score months whose output already exists again",
+    )
+    args = parser.parse_args()
 
-if __name__ == '__main__':
-    ride_duration_prediction_backfill()
\ No newline at end of file
+    ride_duration_prediction_backfill(
+        taxi_type=args.taxi_type,
+        run_id=args.run_id,
+        start_date=datetime.strptime(args.start, "%Y-%m"),
+        end_date=datetime.strptime(args.end, "%Y-%m"),
+        workers=args.workers,
+        batch_size=args.batch_size,
+        overwrite=args.overwrite,
+    )
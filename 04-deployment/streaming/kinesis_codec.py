@@ -0,0 +1,73 @@
+import base64
+import binascii
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# base64, UTF-8 and JSON errors, and events without a ride or ride_id
+DECODE_ERRORS = (binascii.Error, ValueError, KeyError, TypeError)
+
+RIDE_FIELDS = ("PULocationID", "DOLocationID", "trip_distance")
+
+
+if orjson is not None:
+    json_loads = orjson.loads
+
+    def json_dumps(obj):
+        return orjson.dumps(obj)
+
+else:
+    # json.loads also takes the bytes as they are, without a str copy
+    json_loads = json.loads
+
+    def json_dumps(obj):
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def decode_data(encoded_data):
+    return json_loads(base64.b64decode(encoded_data, validate=True))
+
+
+def is_ride(ride):
+    # a null or string field would fail the encoder and drift monitor later
+    return isinstance(ride, dict) and all(
+        isinstance(ride.get(field), (int, float)) and not isinstance(ride[field], bool)
+        for field in RIDE_FIELDS
+    )
+
+
+def decode_records(records):
+    """Rides, ride ids and batchItemFailures of the records of a Lambda event.
+
+    A record that does not decode to a ride event is reported by its
+    sequence number instead of failing the whole batch, so only the shard
+    from that record on is retried. A malformed record without a sequence
+    number is dropped: a null itemIdentifier makes Lambda retry the batch.
+
+    Lambda retries from the lowest reported sequence number, so the rides
+    after a malformed record are scored again on every retry. The
+    prediction stream is at least once, consumers dedupe on ride_id.
+    """
+    rides = []
+    ride_ids = []
+    failures = []
+    for record in records:
+        kinesis = record["kinesis"]
+        try:
+            ride_event = decode_data(kinesis["data"])
+            ride = ride_event["ride"]
+            ride_id = ride_event["ride_id"]
+        except DECODE_ERRORS:
+            ride = None
+        # a ride the model cannot score would fail the whole batch later
+        if not is_ride(ride):
+            sequence_number = kinesis.get("sequenceNumber")
+            if sequence_number is not None:
+                failures.append({"itemIdentifier": sequence_number})
+            continue
+        rides.append(ride)
+        ride_ids.append(ride_id)
+    return rides, ride_ids, failures
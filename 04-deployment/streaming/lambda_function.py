@@ -1,18 +1,34 @@
-import base64
-import json
 import os
+import time
 
-import boto3
-import mlflow
+from kinesis_codec import decode_records, json_dumps
+from model_cache import load_sklearn_model, model_cache
 
 RUN_ID = os.getenv("RUN_ID")
 PREDICTIONS_STREAM_NAME = os.getenv("PREDICTIONS_STREAM_NAME", "ride-predictions")
 TEST_RUN = os.getenv("TEST_RUN", False) == "True"
 
-logged_model = f"s3://taxi-mlops/1/{RUN_ID}/artifacts/model"
-model = mlflow.pyfunc.load_model(logged_model)
+# downloaded once into the local model cache, /tmp survives warm starts.
+# The sklearn pipeline is unpickled directly, importing mlflow (and boto3
+# for the client below) would cost seconds of cold start.
+model = model_cache.load(RUN_ID, load_sklearn_model)
 
-kinesis_client = boto3.client("kinesis")
+kinesis_client = None
+
+
+def get_kinesis_client():
+    global kinesis_client
+    if kinesis_client is None:
+        import boto3
+
+        kinesis_client = boto3.client("kinesis")
+    return kinesis_client
+
+
+# Kinesis PutRecords limits: 500 records and 5 MiB per request
+PUT_RECORDS_MAX_COUNT = 500
+PUT_RECORDS_MAX_BYTES = 5 * 1024 * 1024
+PUT_RECORDS_MAX_RETRIES = 3
 
 
 def prepare_features(ride):
@@ -27,20 +43,58 @@ def predict(features):
     return float(pred[0])
 
 
+def chunk_records(records):
+    chunk = []
+    chunk_bytes = 0
+    for record in records:
+        record_bytes = len(record["Data"]) + len(record["PartitionKey"])
+        if chunk and (
+            len(chunk) == PUT_RECORDS_MAX_COUNT
+            or chunk_bytes + record_bytes > PUT_RECORDS_MAX_BYTES
+        ):
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(record)
+        chunk_bytes += record_bytes
+    if chunk:
+        yield chunk
+
+
+def put_records(records):
+    for attempt in range(PUT_RECORDS_MAX_RETRIES + 1):
+        if attempt > 0:
+            time.sleep(0.1 * 2 ** (attempt - 1))
+
+        response = get_kinesis_client().put_records(
+            StreamName=PREDICTIONS_STREAM_NAME,
+            Records=records,
+        )
+        if response["FailedRecordCount"] == 0:
+            return
+
+        # only the entries with an ErrorCode need to be sent again
+        records = [
+            record
+            for record, result in zip(records, response["Records"])
+            if "ErrorCode" in result
+        ]
+
+    raise RuntimeError(
+        f"Failed to put {len(records)} records to {PREDICTIONS_STREAM_NAME}"
+    )
+
+
 def lambda_handler(event, context):
     # print(json.dumps(event))
 
     predictions_events = []
+    output_records = []
 
-    for record in event["Records"]:
-        encoded_data = record["kinesis"]["data"]
-        decoded_data = base64.b64decode(encoded_data).decode("utf-8")
-        ride_event = json.loads(decoded_data)
-
-        # print(ride_event)
-        ride = ride_event["ride"]
-        ride_id = ride_event["ride_id"]
+    # malformed records are reported back instead of failing the batch
+    rides, ride_ids, failures = decode_records(event["Records"])
 
+    for ride, ride_id in zip(rides, ride_ids):
         features = prepare_features(ride)
         prediction = predict(features)
 
@@ -51,14 +105,19 @@ def lambda_handler(event, context):
         }
 
         if not TEST_RUN:
-            kinesis_client.put_record(
-                StreamName=PREDICTIONS_STREAM_NAME,
-                Data=json.dumps(prediction_event),
-                PartitionKey=str(ride_id),
+            output_records.append(
+                {
+                    "Data": json_dumps(prediction_event),
+                    "PartitionKey": str(ride_id),
+                }
             )
 
         predictions_events.append(prediction_event)
 
+    for chunk in chunk_records(output_records):
+        put_records(chunk)
+
     return {
         "predictions": predictions_events,
+        "batchItemFailures": failures,
     }
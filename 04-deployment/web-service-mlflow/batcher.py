@@ -0,0 +1,91 @@
+import asyncio
+
+
+class MicroBatcher:
+    """Collect concurrent requests and score them with one predict_batch call.
+
+    A batch is sent to the model when it holds max_batch_size rides or when
+    max_wait_ms have passed since its first ride arrived. The model runs in
+    a worker thread so the event loop keeps accepting requests meanwhile.
+    """
+
+    def __init__(self, predict_batch, max_batch_size=64, max_wait_ms=5):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.queue = None
+        self.worker = None
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.worker = asyncio.create_task(self.run())
+
+    async def stop(self):
+        self.worker.cancel()
+        try:
+            await self.worker
+        except asyncio.CancelledError:
+            pass
+
+    async def submit(self, ride):
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((ride, future))
+        return await future
+
+    async def collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.max_wait_ms / 1000
+
+        while len(batch) < self.max_batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    @staticmethod
+    def fail(batch, error):
+        """Fail every caller of the batch.
+
+        Rides are validated before they are submitted, so this only happens
+        when the model fails, never for one caller's bad input.
+        """
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.collect()
+            rides = [ride for ride, _ in batch]
+
+            try:
+                preds = await loop.run_in_executor(None, self.predict_batch, rides)
+            except Exception as e:
+                self.fail(batch, e)
+                continue
+
+            if len(preds) != len(batch):
+                self.fail(
+                    batch,
+                    RuntimeError(
+                        f"predict_batch returned {len(preds)} predictions "
+                        f"for {len(batch)} rides"
+                    ),
+                )
+                continue
+
+            for (_, future), pred in zip(batch, preds):
+                # the caller may have gone away in the meantime
+                if not future.done():
+                    future.set_result(pred)
@@ -0,0 +1,72 @@
+"""Latency of the sklearn random forest vs its ModelBundle array engine.
+
+sklearn is called the way the pyfunc model is, with feature dicts going
+through the DictVectorizer, the array engine with the rides themselves.
+Every batch size is timed `--repeat` times and the median is reported.
+"""
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from measure_memory import (
+    generate_rides,
+    ride_features,
+    train_synthetic_pipeline,
+)
+from model_bundle import ModelBundle
+
+BATCH_SIZES = [1, 32, 10_000]
+
+
+def median_seconds(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--run_id", type=str, help="MLflow run id, a synthetic model when empty"
+    )
+    parser.add_argument("--n_rides", type=int, default=100_000)
+    parser.add_argument("--n_estimators", type=int, default=100)
+    parser.add_argument("--max_depth", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=BATCH_SIZES)
+    args = parser.parse_args()
+
+    if args.run_id:
+        import mlflow
+
+        logged_model = f"s3://taxi-mlops/1/{args.run_id}/artifacts/model"
+        pipeline = mlflow.sklearn.load_model(logged_model)
+    else:
+        pipeline = train_synthetic_pipeline(
+            args.n_rides, args.n_estimators, args.max_depth
+        )
+    bundle = ModelBundle.from_pipeline(pipeline)
+
+    print(f"{'batch':>8}{'sklearn ms':>12}{'engine ms':>12}{'speedup':>10}  exact")
+    for batch_size in args.batch_sizes:
+        rides = generate_rides(batch_size, seed=batch_size)
+        dicts = ride_features(rides)
+
+        expected = pipeline.predict(dicts)
+        exact = np.array_equal(bundle.predict_rides(rides), expected)
+
+        sklearn_seconds = median_seconds(lambda: pipeline.predict(dicts), args.repeat)
+        engine_seconds = median_seconds(
+            lambda: bundle.predict_rides(rides), args.repeat
+        )
+        print(
+            f"{batch_size:>8}{sklearn_seconds * 1000:>12.3f}"
+            f"{engine_seconds * 1000:>12.3f}"
+            f"{sklearn_seconds / engine_seconds:>10.1f}  {exact}"
+        )
@@ -0,0 +1,121 @@
+"""Compare the memory of N workers holding an unpickled vs a memory-mapped model.
+
+Every worker is a freshly spawned process, like a gunicorn worker without
+--preload. RSS also counts the shared page cache pages, USS is what the
+worker holds privately and PSS splits the shared pages between workers.
+"""
+
+import argparse
+import multiprocessing
+import os
+import pickle
+import sys
+import tempfile
+
+import psutil
+
+from model_bundle import ModelBundle
+
+MB = 1024 * 1024
+
+# the synthetic rides and target are shared with the 06-best-practices
+# benchmarks, that folder only goes at the end of sys.path
+BEST_PRACTICES_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "06-best-practices"
+)
+sys.path.append(BEST_PRACTICES_DIR)
+from synthetic_data import (  # noqa: E402
+    generate_rides,
+    ride_durations,
+    ride_features,
+)
+
+
+def train_synthetic_pipeline(n_rides, n_estimators, max_depth):
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.feature_extraction import DictVectorizer
+    from sklearn.pipeline import make_pipeline
+
+    rides = generate_rides(n_rides)
+    pipeline = make_pipeline(
+        DictVectorizer(),
+        RandomForestRegressor(
+            n_estimators=n_estimators, max_depth=max_depth, random_state=0, n_jobs=-1
+        ),
+    )
+    pipeline.fit(ride_features(rides), ride_durations(rides))
+    return pipeline
+
+
+def worker(mode, model_path, barrier, results):
+    rides = generate_rides(1000, seed=os.getpid())
+    if mode == "pickle":
+        with open(model_path, "rb") as f_in:
+            model = pickle.load(f_in)
+        model.predict(ride_features(rides))
+    else:
+        bundle = ModelBundle.load(model_path)
+        bundle.predict_rides(rides)
+
+    # measure once every worker holds its model
+    barrier.wait()
+    memory = psutil.Process().memory_full_info()
+    results.put((mode, memory.rss, memory.uss, memory.pss))
+    barrier.wait()
+
+
+def measure(mode, model_path, n_workers):
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(n_workers)
+    results = ctx.Queue()
+
+    processes = [
+        ctx.Process(target=worker, args=(mode, model_path, barrier, results))
+        for _ in range(n_workers)
+    ]
+    for process in processes:
+        process.start()
+    measurements = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    return measurements
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument(
+        "--run_id", type=str, help="MLflow run id, a synthetic model when empty"
+    )
+    parser.add_argument("--n_rides", type=int, default=100_000)
+    parser.add_argument("--n_estimators", type=int, default=100)
+    parser.add_argument("--max_depth", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.run_id:
+        import mlflow
+
+        logged_model = f"s3://taxi-mlops/1/{args.run_id}/artifacts/model"
+        pipeline = mlflow.sklearn.load_model(logged_model)
+    else:
+        pipeline = train_synthetic_pipeline(
+            args.n_rides, args.n_estimators, args.max_depth
+        )
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pickle_path = os.path.join(tmp_dir, "model.pkl")
+        with open(pickle_path, "wb") as f_out:
+            pickle.dump(pipeline, f_out)
+        bundle_path = os.path.join(tmp_dir, "model.bundle")
+        ModelBundle.from_pipeline(pipeline).save(bundle_path)
+
+        print(f"pickle size: {os.path.getsize(pickle_path) / MB:.1f} MB")
+        print(f"{'mode':<8}{'worker':>8}{'RSS MB':>10}{'USS MB':>10}{'PSS MB':>10}")
+        for mode, model_path in [("pickle", pickle_path), ("mmap", bundle_path)]:
+            measurements = measure(mode, model_path, args.workers)
+            for i, (_, rss, uss, pss) in enumerate(measurements):
+                print(
+                    f"{mode:<8}{i:>8}{rss / MB:>10.1f}{uss / MB:>10.1f}{pss / MB:>10.1f}"
+                )
+            total_pss = sum(pss for _, _, _, pss in measurements)
+            print(f"{mode:<8}{'total':>8}{'':>10}{'':>10}{total_pss / MB:>10.1f}")
@@ -0,0 +1,47 @@
+import argparse
+
+from model_bundle import ModelBundle
+
+
+def export_model(pipeline, path):
+    """Write a DictVectorizer + RandomForestRegressor pipeline as .npy files."""
+    ForestStore.from_pipeline(pipeline).save(path)
+
+
+class ForestStore(ModelBundle):
+    """Random forest scored from memory-mapped node arrays.
+
+    The forest case of ModelBundle. Every gunicorn worker maps the same
+    files, so the weights live once in the page cache instead of once per
+    unpickled model. A store directory is a bundle, so it loads through
+    MODEL_STORE or MODEL_BUNDLE alike.
+
+    Superseded by `python model_bundle.py`, kept for the existing
+    model_store exports and scripts.
+    """
+
+    @classmethod
+    def from_pipeline(cls, pipeline):
+        estimator = pipeline.steps[-1][1]
+        if type(estimator).__name__ != "RandomForestRegressor":
+            raise ValueError(f"Expected a random forest, got {estimator}")
+        return cls.from_forest(pipeline.steps[0][1], estimator)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export a logged DictVectorizer + random forest pipeline"
+    )
+    parser.add_argument(
+        "--run_id", type=str, help="MLflow run id for model in S3 bucket"
+    )
+    parser.add_argument("--output_path", type=str, default="model_store")
+    args = parser.parse_args()
+
+    import mlflow
+
+    from model_cache import model_cache
+
+    export_model(
+        model_cache.load(args.run_id, mlflow.sklearn.load_model), args.output_path
+    )
@@ -1,14 +1,66 @@
+import json
 import os
 
-import mlflow
 from flask import Flask, jsonify, request
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+
+from model_bundle import ModelBundle, can_bundle
+from prediction_cache import PredictionCache, ride_key
 
 app = Flask("duration-prediction")
 
 
 RUN_ID = os.getenv("RUN_ID")
-logged_model = f"s3://taxi-mlops/1/{RUN_ID}/artifacts/model"
-model = mlflow.pyfunc.load_model(logged_model)
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "1000"))
+RIDE_FIELDS = ("PULocationID", "DOLocationID", "trip_distance")
+# exported with `python model_bundle.py`, memory-mapped and shared by all workers,
+# MODEL_STORE is the name it had for `python model_store.py` output
+MODEL_BUNDLE = os.getenv("MODEL_BUNDLE") or os.getenv("MODEL_STORE")
+
+# score forests and linear models from flattened arrays instead of sklearn
+ARRAY_ENGINE = os.getenv("ARRAY_ENGINE", "True") == "True"
+
+# in-process cache in front of predict(), off unless a size is given
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "0"))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", "0")) or None
+
+cache = None
+if PREDICTION_CACHE_SIZE > 0:
+    cache = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL)
+
+bundle = None
+model = None
+
+
+def load_model(run_id=RUN_ID, model_bundle=MODEL_BUNDLE):
+    """Serve another model, the cached predictions of the previous one go."""
+    global bundle, model
+
+    new_bundle = new_model = None
+    if model_bundle:
+        new_bundle = ModelBundle.load(model_bundle)
+    else:
+        import mlflow
+
+        from model_cache import model_cache
+
+        if ARRAY_ENGINE:
+            pipeline = model_cache.load(run_id, mlflow.sklearn.load_model)
+            if can_bundle(pipeline.steps[-1][1]):
+                try:
+                    new_bundle = ModelBundle.from_pipeline(pipeline)
+                except ValueError:
+                    # features the bundle cannot encode, served by pyfunc
+                    new_bundle = None
+        if new_bundle is None:
+            new_model = model_cache.load(run_id, mlflow.pyfunc.load_model)
+
+    bundle, model = new_bundle, new_model
+    if cache is not None:
+        cache.set_model_version(model_bundle or run_id)
+
+
+load_model()
 
 
 def prepare_features(ride):
@@ -18,21 +70,106 @@ def prepare_features(ride):
     return features
 
 
-def predict(features):
+def predict(ride):
+    if cache is None:
+        return score(ride)
+
+    key = ride_key(ride)
+    pred = cache.get(key)
+    if pred is None:
+        pred = score(ride)
+        cache.put(key, pred)
+    return pred
+
+
+def score(ride):
+    if bundle is not None:
+        return bundle.predict_ride(ride)
+
+    features = prepare_features(ride)
     preds = model.predict(features)
     return preds[0]
 
 
+def predict_batch(rides):
+    if bundle is not None:
+        return bundle.predict_rides(rides).tolist()
+
+    features = [prepare_features(ride) for ride in rides]
+    preds = model.predict(features)
+    return preds.tolist()
+
+
+def is_ride(ride):
+    return isinstance(ride, dict) and all(
+        isinstance(ride.get(field), (int, float)) and not isinstance(ride[field], bool)
+        for field in RIDE_FIELDS
+    )
+
+
+def read_ride():
+    ride = request.get_json()
+    if not is_ride(ride):
+        raise BadRequest(f"Expected a ride with numeric {', '.join(RIDE_FIELDS)}")
+    return ride
+
+
+def read_rides():
+    """Rides from a JSON array or a newline-delimited JSON body."""
+    if request.mimetype == "application/x-ndjson":
+        rides = []
+        for line in request.stream:
+            if not line.strip():
+                continue
+            try:
+                rides.append(json.loads(line))
+            except ValueError:
+                raise BadRequest("Malformed newline-delimited JSON")
+            # stop reading the stream as soon as the limit is exceeded
+            if len(rides) > MAX_BATCH_SIZE:
+                break
+    else:
+        rides = request.get_json()
+        if not isinstance(rides, list):
+            raise BadRequest("Expected a JSON array of rides")
+
+    if len(rides) > MAX_BATCH_SIZE:
+        raise RequestEntityTooLarge(f"At most {MAX_BATCH_SIZE} rides per batch")
+    for i, ride in enumerate(rides):
+        if not is_ride(ride):
+            raise BadRequest(
+                f"Ride {i} is not an object with numeric {', '.join(RIDE_FIELDS)}"
+            )
+    return rides
+
+
 @app.route("/predict", methods=["POST"])
 def predict_endpoint():
-    ride = request.get_json()
-    features = prepare_features(ride)
-    pred = predict(features)
+    ride = read_ride()
+    pred = predict(ride)
 
     result = {"duration": pred}
     return jsonify(result)
 
 
+@app.route("/predict/batch", methods=["POST"])
+def predict_batch_endpoint():
+    rides = read_rides()
+    preds = predict_batch(rides) if rides else []
+
+    result = {"durations": preds}
+    return jsonify(result)
+
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats_endpoint():
+    if cache is None:
+        return jsonify({"enabled": False})
+
+    result = {"enabled": True, **cache.stats()}
+    return jsonify(result)
+
+
 @app.route("/", methods=["GET"])
 def index():
     return "The server is running!"
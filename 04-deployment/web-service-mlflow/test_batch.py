@@ -0,0 +1,20 @@
+import json
+
+import requests
+
+rides = [
+    {"PULocationID": 10, "DOLocationID": 50, "trip_distance": 40},
+    {"PULocationID": 130, "DOLocationID": 205, "trip_distance": 3.66},
+    {"PULocationID": 43, "DOLocationID": 151, "trip_distance": 1.01},
+]
+url = "http://127.0.0.1:4444/predict/batch"
+
+response = requests.post(url, json=rides)
+print(response.json())
+
+# the same rides as newline-delimited JSON
+data = "\n".join(json.dumps(ride) for ride in rides)
+response = requests.post(
+    url, data=data, headers={"Content-Type": "application/x-ndjson"}
+)
+print(response.json())
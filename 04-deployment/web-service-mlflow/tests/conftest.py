@@ -0,0 +1,35 @@
+import importlib
+
+import pytest
+from sklearn.feature_extraction import DictVectorizer
+from sklearn.linear_model import LinearRegression
+
+from model_bundle import ModelBundle
+
+# the zone pairs the test model is fitted on
+TRAINING_RIDES = [
+    {"PULocationID": 130, "DOLocationID": 205, "trip_distance": 3.66},
+    {"PULocationID": 43, "DOLocationID": 151, "trip_distance": 1.0},
+]
+
+
+@pytest.fixture(scope="session")
+def predict(tmp_path_factory):
+    # a bundle of a PU_DO linear model, without mlflow or a tracking server
+    dv = DictVectorizer()
+    X = dv.fit_transform(
+        [
+            {
+                "PU_DO": f"{ride['PULocationID']}_{ride['DOLocationID']}",
+                "trip_distance": ride["trip_distance"],
+            }
+            for ride in TRAINING_RIDES
+        ]
+    )
+    model = LinearRegression().fit(X, [15.0, 5.0])
+    bundle_path = str(tmp_path_factory.mktemp("model") / "lin_reg.bundle")
+    ModelBundle.from_linear(dv, model).save(bundle_path)
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv("MODEL_BUNDLE", bundle_path)
+        return importlib.import_module("predict")
@@ -0,0 +1,215 @@
+import numpy as np
+import scipy.sparse as sp
+
+# Taxi zone ids go from 1 to 265, the table is indexed by the raw id
+NUM_ZONES = 266
+
+
+class ZonePairEncoder:
+    """Encode rides into the feature space of a fitted DictVectorizer.
+
+    The DictVectorizer sees `{"PU_DO": "130_205", "trip_distance": 3.66}` per
+    ride. Here the `PU_DO` column index is looked up in a
+    `(PULocationID, DOLocationID)` table instead, so no strings or dicts are
+    built and the output is identical to `DictVectorizer.transform`.
+    """
+
+    def __init__(self, pu_do_columns, trip_distance_column, n_features, sparse=True):
+        self.pu_do_columns = pu_do_columns
+        self.trip_distance_column = trip_distance_column
+        self.n_features = n_features
+        self.sparse = sparse
+
+    @classmethod
+    def from_dict_vectorizer(cls, dv, num_zones=NUM_ZONES):
+        """Raises ValueError if dv has features other than `PU_DO=<pu>_<do>`
+        and `trip_distance`, those would silently never be set."""
+        prefix = f"PU_DO{dv.separator}"
+
+        pairs = []
+        unknown = []
+        for feature_name, column in dv.vocabulary_.items():
+            if feature_name == "trip_distance":
+                continue
+            pu_id, _, do_id = feature_name[len(prefix) :].partition("_")
+            if feature_name.startswith(prefix) and pu_id.isdigit() and do_id.isdigit():
+                pairs.append((int(pu_id), int(do_id), column))
+            else:
+                unknown.append(feature_name)
+
+        if unknown:
+            raise ValueError(
+                f"The DictVectorizer has {len(unknown)} features the zone pair "
+                f"encoder cannot produce, e.g. {sorted(unknown)[:3]}"
+            )
+
+        num_zones = max([num_zones] + [max(pu, do) + 1 for pu, do, _ in pairs])
+        pu_do_columns = np.full((num_zones, num_zones), -1, dtype=np.int32)
+        for pu_id, do_id, column in pairs:
+            pu_do_columns[pu_id, do_id] = column
+
+        return cls(
+            pu_do_columns=pu_do_columns,
+            trip_distance_column=dv.vocabulary_.get("trip_distance", -1),
+            n_features=len(dv.feature_names_),
+            sparse=dv.sparse,
+        )
+
+    @classmethod
+    def fit(cls, pu_location_ids, do_location_ids, num_zones=NUM_ZONES, sparse=True):
+        """Learn the vocabulary DictVectorizer.fit would learn from the rides.
+
+        The zone pairs are deduplicated as integer codes, only the distinct
+        pairs get a `PU_DO=<pu>_<do>` name, and the columns follow the
+        sorted feature names like they do in the DictVectorizer.
+        """
+        pu_location_ids = np.asarray(pu_location_ids, dtype=np.int64)
+        do_location_ids = np.asarray(do_location_ids, dtype=np.int64)
+        if len(pu_location_ids) > 0:
+            num_zones = max(
+                num_zones,
+                int(pu_location_ids.max()) + 1,
+                int(do_location_ids.max()) + 1,
+            )
+
+        pair_codes = np.unique(pu_location_ids * num_zones + do_location_ids)
+        pu_ids, do_ids = np.divmod(pair_codes, num_zones)
+        names = [f"PU_DO={pu_id}_{do_id}" for pu_id, do_id in zip(pu_ids, do_ids)]
+        names.append("trip_distance")
+        order = sorted(range(len(names)), key=names.__getitem__)
+        columns = np.empty(len(names), dtype=np.int32)
+        columns[order] = np.arange(len(names), dtype=np.int32)
+
+        pu_do_columns = np.full((num_zones, num_zones), -1, dtype=np.int32)
+        pu_do_columns[pu_ids, do_ids] = columns[:-1]
+        return cls(
+            pu_do_columns=pu_do_columns,
+            trip_distance_column=int(columns[-1]),
+            n_features=len(names),
+            sparse=sparse,
+        )
+
+    def to_dict_vectorizer(self):
+        """A fitted DictVectorizer with the same features, e.g. to pickle."""
+        from sklearn.feature_extraction import DictVectorizer
+
+        feature_names = [None] * self.n_features
+        for pu_id, do_id in zip(*np.nonzero(self.pu_do_columns >= 0)):
+            feature_names[self.pu_do_columns[pu_id, do_id]] = f"PU_DO={pu_id}_{do_id}"
+        if self.trip_distance_column >= 0:
+            feature_names[self.trip_distance_column] = "trip_distance"
+
+        dv = DictVectorizer(sparse=self.sparse)
+        dv.feature_names_ = feature_names
+        dv.vocabulary_ = {name: column for column, name in enumerate(feature_names)}
+        return dv
+
+    def save(self, path):
+        np.savez(
+            path,
+            pu_do_columns=self.pu_do_columns,
+            header=np.array(
+                [self.trip_distance_column, self.n_features, self.sparse],
+                dtype=np.int64,
+            ),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            trip_distance_column, n_features, is_sparse = arrays["header"].tolist()
+            return cls(
+                pu_do_columns=arrays["pu_do_columns"],
+                trip_distance_column=trip_distance_column,
+                n_features=n_features,
+                sparse=bool(is_sparse),
+            )
+
+    def lookup(self, pu_location_ids, do_location_ids):
+        """Return the PU_DO column of every ride, -1 for unseen pairs."""
+        pu_location_ids = np.asarray(pu_location_ids, dtype=np.int64)
+        do_location_ids = np.asarray(do_location_ids, dtype=np.int64)
+
+        num_zones = self.pu_do_columns.shape[0]
+        known = (
+            (pu_location_ids >= 0)
+            & (pu_location_ids < num_zones)
+            & (do_location_ids >= 0)
+            & (do_location_ids < num_zones)
+        )
+        columns = np.full(pu_location_ids.shape, -1, dtype=np.int32)
+        columns[known] = self.pu_do_columns[
+            pu_location_ids[known], do_location_ids[known]
+        ]
+        return columns
+
+    def transform(self, pu_location_ids, do_location_ids, trip_distances):
+        pu_do_columns = self.lookup(pu_location_ids, do_location_ids)
+        trip_distances = np.asarray(trip_distances, dtype=np.float64)
+        n_rows = len(pu_do_columns)
+
+        # same entry order as the DictVectorizer: PU_DO first, then trip_distance
+        columns = np.empty((n_rows, 2), dtype=np.int32)
+        columns[:, 0] = pu_do_columns
+        columns[:, 1] = self.trip_distance_column
+        values = np.empty((n_rows, 2), dtype=np.float64)
+        values[:, 0] = 1.0
+        values[:, 1] = trip_distances
+
+        present = columns >= 0
+        if not self.sparse:
+            X = np.zeros((n_rows, self.n_features), dtype=np.float64)
+            rows = np.repeat(np.arange(n_rows), 2).reshape(n_rows, 2)
+            X[rows[present], columns[present]] = values[present]
+            return X
+
+        indptr = np.zeros(n_rows + 1, dtype=np.int32)
+        np.cumsum(present.sum(axis=1), out=indptr[1:])
+        return sp.csr_matrix(
+            (values[present], columns[present], indptr),
+            shape=(n_rows, self.n_features),
+        )
+
+    def transform_ride(self, ride):
+        """Single ride fast path, skips the batch array bookkeeping."""
+        pu_location_id = int(ride["PULocationID"])
+        do_location_id = int(ride["DOLocationID"])
+        num_zones = self.pu_do_columns.shape[0]
+
+        columns = []
+        values = []
+        if 0 <= pu_location_id < num_zones and 0 <= do_location_id < num_zones:
+            column = self.pu_do_columns[pu_location_id, do_location_id]
+            if column >= 0:
+                columns.append(column)
+                values.append(1.0)
+        if self.trip_distance_column >= 0:
+            columns.append(self.trip_distance_column)
+            values.append(float(ride["trip_distance"]))
+
+        if not self.sparse:
+            X = np.zeros((1, self.n_features), dtype=np.float64)
+            X[0, columns] = values
+            return X
+
+        return sp.csr_matrix(
+            (
+                np.array(values, dtype=np.float64),
+                np.array(columns, dtype=np.int32),
+                np.array([0, len(columns)], dtype=np.int32),
+            ),
+            shape=(1, self.n_features),
+        )
+
+    def transform_rides(self, rides):
+        n_rides = len(rides)
+        pu_location_ids = np.fromiter(
+            (ride["PULocationID"] for ride in rides), dtype=np.int64, count=n_rides
+        )
+        do_location_ids = np.fromiter(
+            (ride["DOLocationID"] for ride in rides), dtype=np.int64, count=n_rides
+        )
+        trip_distances = np.fromiter(
+            (ride["trip_distance"] for ride in rides), dtype=np.float64, count=n_rides
+        )
+        return self.transform(pu_location_ids, do_location_ids, trip_distances)
@@ -0,0 +1,34 @@
+import argparse
+import pickle
+
+from model_bundle import ModelBundle
+
+
+class LinearKernel(ModelBundle):
+    """Score the DictVectorizer + LinearRegression pair of lin_reg.bin.
+
+    The linear case of ModelBundle: a lookup of the `PU_DO` coefficient plus
+    one multiply-add, from memory-mapped arrays. A kernel directory is a
+    linear bundle, so it loads through MODEL_KERNEL or MODEL_BUNDLE alike.
+
+    Superseded by `python model_bundle.py`, kept for the existing
+    lin_reg.kernel exports and scripts.
+    """
+
+    @classmethod
+    def compile(cls, dv, model):
+        return cls.from_linear(dv, model)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compile the pickled (dv, model) pair into a LinearKernel"
+    )
+    parser.add_argument("--model_path", type=str, default="lin_reg.bin")
+    parser.add_argument("--output_path", type=str, default="lin_reg.kernel")
+    args = parser.parse_args()
+
+    with open(args.model_path, "rb") as f_in:
+        dv, model = pickle.load(f_in)
+
+    LinearKernel.compile(dv, model).save(args.output_path)
@@ -1,36 +1,184 @@
+import json
+import os
 import pickle
 
 from flask import Flask, jsonify, request
+from werkzeug.exceptions import BadRequest, RequestEntityTooLarge
+
+from encoder import ZonePairEncoder
+from model_bundle import ModelBundle
+from prediction_cache import PredictionCache, ride_key
 
 app = Flask("duration-prediction")
 
-with open("lin_reg.bin", "rb") as f_in:
-    dv, model = pickle.load(f_in)
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "1000"))
+RIDE_FIELDS = ("PULocationID", "DOLocationID", "trip_distance")
+
+# exported with `python model_bundle.py`, skips sklearn entirely when set,
+# MODEL_KERNEL is the name it had for `python linear_kernel.py` output
+MODEL_BUNDLE = os.getenv("MODEL_BUNDLE") or os.getenv("MODEL_KERNEL")
+
+# in-process cache in front of predict(), off unless a size is given
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "0"))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", "0")) or None
+
+cache = None
+if PREDICTION_CACHE_SIZE > 0:
+    cache = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL)
+
+bundle = None
+dv = None
+model = None
+encoder = None
+
+
+def load_model(model_bundle=MODEL_BUNDLE, model_path="lin_reg.bin"):
+    """Serve another model, the cached predictions of the previous one go."""
+    global bundle, dv, model, encoder
+
+    new_bundle = new_dv = new_model = new_encoder = None
+    if model_bundle:
+        new_bundle = ModelBundle.load(model_bundle)
+    else:
+        with open(model_path, "rb") as f_in:
+            new_dv, new_model = pickle.load(f_in)
+
+        try:
+            # same features as dv.transform({"PU_DO": ..., "trip_distance": ...})
+            new_encoder = ZonePairEncoder.from_dict_vectorizer(new_dv)
+        except ValueError:
+            # e.g. the PULocationID=/DOLocationID= one-hot features of
+            # lin_reg.bin, scored through dv.transform(prepare_features(ride))
+            new_encoder = None
+
+    bundle, dv, model, encoder = new_bundle, new_dv, new_model, new_encoder
+    if cache is not None:
+        cache.set_model_version(model_bundle or model_path)
+
+
+load_model()
 
 
 def prepare_features(ride):
+    # PU_DO for the zone pair models, the zone ids as categories for models
+    # with separate PULocationID/DOLocationID features, dv.transform ignores
+    # the features a vectorizer was not fitted on
+    pu_location_id = int(ride["PULocationID"])
+    do_location_id = int(ride["DOLocationID"])
     features = {}
-    features["PU_DO"] = f"{ride['PULocationID']}_{ride['DOLocationID']}"
+    features["PU_DO"] = f"{pu_location_id}_{do_location_id}"
+    features["PULocationID"] = str(pu_location_id)
+    features["DOLocationID"] = str(do_location_id)
     features["trip_distance"] = ride["trip_distance"]
     return features
 
 
-def predict(features):
-    X = dv.transform(features)
+def predict(ride):
+    if cache is None:
+        return score(ride)
+
+    key = ride_key(ride)
+    pred = cache.get(key)
+    if pred is None:
+        pred = score(ride)
+        cache.put(key, pred)
+    return pred
+
+
+def score(ride):
+    if bundle is not None:
+        return bundle.predict_ride(ride)
+
+    if encoder is None:
+        X = dv.transform(prepare_features(ride))
+    else:
+        X = encoder.transform_ride(ride)
     preds = model.predict(X)
     return preds[0]
 
 
+def predict_batch(rides):
+    if bundle is not None:
+        return bundle.predict_rides(rides).tolist()
+
+    if encoder is None:
+        X = dv.transform([prepare_features(ride) for ride in rides])
+    else:
+        X = encoder.transform_rides(rides)
+    preds = model.predict(X)
+    return preds.tolist()
+
+
+def is_ride(ride):
+    return isinstance(ride, dict) and all(
+        isinstance(ride.get(field), (int, float)) and not isinstance(ride[field], bool)
+        for field in RIDE_FIELDS
+    )
+
+
+def read_ride():
+    ride = request.get_json()
+    if not is_ride(ride):
+        raise BadRequest(f"Expected a ride with numeric {', '.join(RIDE_FIELDS)}")
+    return ride
+
+
+def read_rides():
+    """Rides from a JSON array or a newline-delimited JSON body."""
+    if request.mimetype == "application/x-ndjson":
+        rides = []
+        for line in request.stream:
+            if not line.strip():
+                continue
+            try:
+                rides.append(json.loads(line))
+            except ValueError:
+                raise BadRequest("Malformed newline-delimited JSON")
+            # stop reading the stream as soon as the limit is exceeded
+            if len(rides) > MAX_BATCH_SIZE:
+                break
+    else:
+        rides = request.get_json()
+        if not isinstance(rides, list):
+            raise BadRequest("Expected a JSON array of rides")
+
+    if len(rides) > MAX_BATCH_SIZE:
+        raise RequestEntityTooLarge(f"At most {MAX_BATCH_SIZE} rides per batch")
+    for i, ride in enumerate(rides):
+        if not is_ride(ride):
+            raise BadRequest(
+                f"Ride {i} is not an object with numeric {', '.join(RIDE_FIELDS)}"
+            )
+    return rides
+
+
 @app.route("/predict", methods=["POST"])
 def predict_endpoint():
-    ride = request.get_json()
-    features = prepare_features(ride)
-    pred = predict(features)
+    ride = read_ride()
+    pred = predict(ride)
 
     result = {"duration": pred}
     return jsonify(result)
 
 
+@app.route("/predict/batch", methods=["POST"])
+def predict_batch_endpoint():
+    rides = read_rides()
+    preds = predict_batch(rides) if rides else []
+
+    result = {"durations": preds}
+    return jsonify(result)
+
+
+@app.route("/cache/stats", methods=["GET"])
+def cache_stats_endpoint():
+    if cache is None:
+        return jsonify({"enabled": False})
+
+    result = {"enabled": True, **cache.stats()}
+    return jsonify(result)
+
+
 @app.route("/", methods=["GET"])
 def index():
     return "The server is running!"
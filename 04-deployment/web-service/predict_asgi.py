@@ -0,0 +1,73 @@
+import contextlib
+import os
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
+
+import predict
+from batcher import MicroBatcher
+from prediction_cache import ride_key
+
+# requests waiting for the same batch, and how long the first one may wait
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "64"))
+BATCH_WAIT_MS = float(os.getenv("BATCH_WAIT_MS", "5"))
+
+batcher = MicroBatcher(
+    predict.predict_batch, max_batch_size=BATCH_SIZE, max_wait_ms=BATCH_WAIT_MS
+)
+
+
+async def predict_ride(ride):
+    # same cache as the Flask /predict, a hit does not wait for a batch
+    if predict.cache is None:
+        return await batcher.submit(ride)
+
+    key = ride_key(ride)
+    pred = predict.cache.get(key)
+    if pred is None:
+        pred = await batcher.submit(ride)
+        predict.cache.put(key, pred)
+    return pred
+
+
+async def predict_endpoint(request):
+    try:
+        ride = await request.json()
+    except ValueError:
+        ride = None
+    # a bad ride is rejected here, it must not fail the batch it would join
+    if not predict.is_ride(ride):
+        fields = ", ".join(predict.RIDE_FIELDS)
+        error = {"error": f"Expected a ride with numeric {fields}"}
+        return JSONResponse(error, status_code=400)
+    pred = await predict_ride(ride)
+
+    result = {"duration": pred}
+    return JSONResponse(result)
+
+
+async def index(request):
+    return PlainTextResponse("The server is running!")
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    await batcher.start()
+    yield
+    await batcher.stop()
+
+
+app = Starlette(
+    routes=[
+        Route("/predict", predict_endpoint, methods=["POST"]),
+        Route("/", index, methods=["GET"]),
+    ],
+    lifespan=lifespan,
+)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=9999)
@@ -0,0 +1,77 @@
+import asyncio
+
+from batcher import MicroBatcher
+
+
+class ModelMock:
+    """predict_batch that doubles the rides and fails on a negative one."""
+
+    def __init__(self):
+        self.batches = []
+
+    def predict_batch(self, rides):
+        self.batches.append(list(rides))
+        if any(ride < 0 for ride in rides):
+            raise ValueError("negative ride")
+        return [2 * ride for ride in rides]
+
+
+def submit_all(batcher, rides):
+    async def run():
+        await batcher.start()
+        try:
+            return await asyncio.wait_for(
+                asyncio.gather(
+                    *(batcher.submit(ride) for ride in rides), return_exceptions=True
+                ),
+                5,
+            )
+        finally:
+            await batcher.stop()
+
+    return asyncio.run(run())
+
+
+def test_full_batch_is_sent_without_waiting():
+    model_mock = ModelMock()
+    # the timeout would fail the test long before the batch waited it out
+    batcher = MicroBatcher(
+        model_mock.predict_batch, max_batch_size=3, max_wait_ms=60_000
+    )
+
+    preds = submit_all(batcher, [1, 2, 3, 4, 5, 6])
+
+    assert preds == [2, 4, 6, 8, 10, 12]
+    assert model_mock.batches == [[1, 2, 3], [4, 5, 6]]
+
+
+def test_partial_batch_is_sent_after_max_wait_ms():
+    model_mock = ModelMock()
+    batcher = MicroBatcher(model_mock.predict_batch, max_batch_size=64, max_wait_ms=20)
+
+    preds = submit_all(batcher, [1, 2])
+
+    assert preds == [2, 4]
+    assert model_mock.batches == [[1, 2]]
+
+
+def test_model_error_fails_only_its_batch():
+    model_mock = ModelMock()
+    batcher = MicroBatcher(
+        model_mock.predict_batch, max_batch_size=2, max_wait_ms=60_000
+    )
+
+    preds = submit_all(batcher, [1, 2, -3, 4, 5, 6])
+
+    assert preds[:2] == [2, 4]
+    assert all(isinstance(pred, ValueError) for pred in preds[2:4])
+    assert preds[4:] == [10, 12]
+
+
+def test_wrong_number_of_predictions_fails_the_batch():
+    batcher = MicroBatcher(lambda rides: [0.0], max_batch_size=2, max_wait_ms=60_000)
+
+    preds = submit_all(batcher, [1, 2])
+
+    assert all(isinstance(pred, RuntimeError) for pred in preds)
+    assert "1 predictions for 2 rides" in str(preds[0])
@@ -0,0 +1,119 @@
+import json
+import os
+import pickle
+
+import pytest
+
+import predict
+
+RIDES = [
+    {"PULocationID": 130, "DOLocationID": 205, "trip_distance": 3.66},
+    {"PULocationID": 43, "DOLocationID": 151, "trip_distance": 1.0},
+]
+BAD_RIDE = {"PULocationID": "130", "DOLocationID": 205, "trip_distance": 3.66}
+
+
+@pytest.fixture
+def client():
+    return predict.app.test_client()
+
+
+def ndjson(rides):
+    return "".join(json.dumps(ride) + "\n" for ride in rides)
+
+
+def test_serves_lin_reg_through_its_dict_vectorizer():
+    model_path = os.path.join(os.path.dirname(predict.__file__), "lin_reg.bin")
+    with open(model_path, "rb") as f_in:
+        dv, model = pickle.load(f_in)
+    # lin_reg.bin is fitted on separate PULocationID/DOLocationID categories
+    expected = model.predict(
+        dv.transform(
+            [
+                {
+                    "PULocationID": str(ride["PULocationID"]),
+                    "DOLocationID": str(ride["DOLocationID"]),
+                }
+                for ride in RIDES
+            ]
+        )
+    )
+
+    predict.load_model(model_bundle=None, model_path=model_path)
+
+    assert predict.encoder is None
+    assert predict.predict_batch(RIDES) == pytest.approx(expected.tolist())
+    assert predict.predict(RIDES[1]) == pytest.approx(expected[1])
+    assert expected[0] != pytest.approx(expected[1])
+
+
+def test_predict_endpoint(client):
+    response = client.post("/predict", json=RIDES[0])
+
+    assert response.status_code == 200
+    assert response.get_json()["duration"] == pytest.approx(predict.predict(RIDES[0]))
+
+
+def test_predict_endpoint_rejects_a_bad_ride(client):
+    assert client.post("/predict", json=BAD_RIDE).status_code == 400
+
+
+def test_predict_batch_reads_a_json_array(client):
+    response = client.post("/predict/batch", json=RIDES)
+
+    assert response.status_code == 200
+    assert response.get_json()["durations"] == pytest.approx(
+        predict.predict_batch(RIDES)
+    )
+
+
+def test_predict_batch_reads_ndjson(client):
+    response = client.post(
+        "/predict/batch",
+        data=ndjson(RIDES) + "\n",
+        content_type="application/x-ndjson",
+    )
+
+    assert response.status_code == 200
+    assert response.get_json()["durations"] == pytest.approx(
+        predict.predict_batch(RIDES)
+    )
+
+
+def test_predict_batch_of_no_rides(client):
+    response = client.post("/predict/batch", json=[])
+
+    assert response.get_json() == {"durations": []}
+
+
+@pytest.mark.parametrize(
+    "data, content_type",
+    [
+        (json.dumps(RIDES), "application/json"),
+        (ndjson(RIDES), "application/x-ndjson"),
+    ],
+)
+def test_predict_batch_over_max_batch_size(client, monkeypatch, data, content_type):
+    monkeypatch.setattr(predict, "MAX_BATCH_SIZE", 1)
+
+    response = client.post("/predict/batch", data=data, content_type=content_type)
+
+    assert response.status_code == 413
+
+
+@pytest.mark.parametrize(
+    "data, content_type",
+    [
+        ("[{", "application/json"),
+        (json.dumps(RIDES[0]), "application/json"),
+        (json.dumps([RIDES[0], BAD_RIDE]), "application/json"),
+        (json.dumps([RIDES[0], None]), "application/json"),
+        (ndjson(RIDES) + "{\n", "application/x-ndjson"),
+        (ndjson([RIDES[0], BAD_RIDE]), "application/x-ndjson"),
+        (ndjson([RIDES[0], {"PULocationID": 130}]), "application/x-ndjson"),
+    ],
+)
+def test_predict_batch_rejects_malformed_rides(client, data, content_type):
+    response = client.post("/predict/batch", data=data, content_type=content_type)
+
+    assert response.status_code == 400
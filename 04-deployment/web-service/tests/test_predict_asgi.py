@@ -0,0 +1,52 @@
+import pytest
+from starlette.testclient import TestClient
+
+import predict
+import predict_asgi
+from prediction_cache import PredictionCache
+
+RIDE = {"PULocationID": 130, "DOLocationID": 205, "trip_distance": 3.66}
+
+
+@pytest.fixture
+def client():
+    # the lifespan starts and stops the batcher
+    with TestClient(predict_asgi.app) as client:
+        yield client
+
+
+def test_predict_endpoint(client):
+    response = client.post("/predict", json=RIDE)
+
+    assert response.status_code == 200
+    assert response.json()["duration"] == pytest.approx(predict.predict(RIDE))
+
+
+@pytest.mark.parametrize(
+    "content", [b"{", b"[]", b'{"PULocationID": 130, "DOLocationID": 205}']
+)
+def test_predict_endpoint_rejects_a_bad_ride(client, content):
+    response = client.post(
+        "/predict", content=content, headers={"content-type": "application/json"}
+    )
+
+    assert response.status_code == 400
+
+
+def test_predict_endpoint_uses_the_prediction_cache(client, monkeypatch):
+    monkeypatch.setattr(predict, "cache", PredictionCache(10))
+    submitted = []
+    submit = predict_asgi.batcher.submit
+
+    async def submit_mock(ride):
+        submitted.append(ride)
+        return await submit(ride)
+
+    monkeypatch.setattr(predict_asgi.batcher, "submit", submit_mock)
+
+    first = client.post("/predict", json=RIDE).json()
+    second = client.post("/predict", json={**RIDE, "trip_distance": 3.661}).json()
+
+    assert first == second
+    assert len(submitted) == 1
+    assert predict.cache.stats()["hits"] == 1
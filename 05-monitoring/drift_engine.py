@@ -0,0 +1,318 @@
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from scipy import stats
+from scipy.spatial import distance
+
+from reference_profile import clean_values
+
+# Evidently's defaults for ColumnDriftMetric and DatasetDriftMetric
+DRIFT_SHARE = 0.5
+DISTANCE_THRESHOLD = 0.1
+P_VALUE_THRESHOLD = 0.05
+SMALL_REFERENCE_ROWS = 1000
+HISTOGRAM_MIN_UNIQUE = 20
+
+
+def missing_values(data):
+    """Per-row count of the values DatasetMissingValuesMetric counts as missing.
+
+    These are nulls, "", inf and -inf, in every column of the frame.
+    """
+    counts = data.isna().sum(axis=1).to_numpy(dtype=np.int64, copy=True)
+    for _, column in data.items():
+        if pd.api.types.is_float_dtype(column):
+            counts += np.isinf(column.to_numpy())
+        elif column.dtype == object or pd.api.types.is_string_dtype(column):
+            counts += (column == "").to_numpy()
+    return counts
+
+
+def category_counts(values, categories):
+    """Counts of values per category, categories sorted and unique."""
+    unique, counts = np.unique(values, return_counts=True)
+    aligned = np.zeros(len(categories), dtype=np.int64)
+    aligned[np.searchsorted(categories, unique)] = counts
+    return aligned
+
+
+def wasserstein_distance(reference_values, reference_cumsum, current_sorted):
+    """scipy.stats.wasserstein_distance of a (value, count) reference sample
+    and an already sorted current sample."""
+    all_values = np.concatenate([reference_values, current_sorted])
+    all_values.sort(kind="stable")
+    deltas = np.diff(all_values)
+    reference_cdf = reference_cumsum[
+        np.searchsorted(reference_values, all_values[:-1], "right")
+    ]
+    current_cdf = np.searchsorted(current_sorted, all_values[:-1], "right")
+    return np.sum(
+        np.abs(reference_cdf / reference_cumsum[-1] - current_cdf / len(current_sorted))
+        * deltas
+    )
+
+
+def sturges_edges(minimum, maximum, n_rows):
+    """np.histogram_bin_edges(values, "sturges") from the size and range of values."""
+    first_edge, last_edge = float(minimum), float(maximum)
+    if first_edge == last_edge:
+        first_edge, last_edge = first_edge - 0.5, last_edge + 0.5
+    width = (float(maximum) - float(minimum)) / (np.log2(n_rows) + 1.0)
+    n_bins = int(np.ceil((last_edge - first_edge) / width)) if width else 1
+    return np.linspace(first_edge, last_edge, n_bins + 1, endpoint=True)
+
+
+class ReferenceColumn:
+    """Drift tests of one column against its ColumnProfile.
+
+    The tests run on the profile's (value, count) pairs, so a window costs
+    the same whatever the size of the reference. They give Evidently's
+    results exactly when the profile is exact, and approximate them for
+    numerical columns with more distinct values than the profile keeps.
+    """
+
+    def __init__(self, name, profile):
+        self.name = name
+        self.profile = profile
+        self.column_type = profile.column_type
+        self.values = profile.values
+        self.counts = profile.counts
+        self.cumsum = np.concatenate([[0], np.cumsum(profile.counts)])
+        if profile.column_type == "num":
+            self.std = max(profile.std, 0.001)
+
+    def __len__(self):
+        return self.profile.n_rows
+
+    def stattest(self, current_values):
+        """Name of the test Evidently picks by default for this column."""
+        n_values = self.profile.n_unique
+        if n_values <= 5:
+            n_values = len(np.union1d(self.values, current_values))
+
+        if len(self) <= SMALL_REFERENCE_ROWS:
+            if self.column_type == "num" and n_values > 5:
+                return "ks"
+            return "chisquare" if n_values > 2 else "z"
+        if self.column_type == "num" and n_values > 5:
+            return "wasserstein"
+        return "jensenshannon"
+
+    def drift(self, current_values):
+        """(stattest, drift_score, drift_detected) of a cleaned current column."""
+        if len(current_values) == 0:
+            raise ValueError(
+                f"An empty column '{self.name}' was provided for drift calculation "
+                "in the current dataset."
+            )
+
+        stattest = self.stattest(current_values)
+        if stattest == "wasserstein":
+            current_sorted = np.sort(current_values, kind="stable")
+            score = (
+                wasserstein_distance(self.values, self.cumsum, current_sorted)
+                / self.std
+            )
+            return stattest, score, score >= DISTANCE_THRESHOLD
+        if stattest == "jensenshannon":
+            reference_counts, current_counts = self.binned_counts(current_values)
+            score = distance.jensenshannon(
+                reference_counts / len(self), current_counts / len(current_values)
+            )
+            return stattest, score, score >= DISTANCE_THRESHOLD
+        if stattest == "ks":
+            # small references always have an exact profile
+            reference_values = np.repeat(self.values, self.counts)
+            score = stats.ks_2samp(reference_values, current_values)[1]
+            return stattest, score, score <= P_VALUE_THRESHOLD
+        if stattest == "chisquare":
+            reference_counts, current_counts = self.category_counts(current_values)
+            expected = reference_counts * (len(current_values) / len(self))
+            score = stats.chisquare(current_counts, expected)[1]
+            return stattest, score, score < P_VALUE_THRESHOLD
+        score = self.z_test(current_values)
+        return stattest, score, score < P_VALUE_THRESHOLD
+
+    def category_counts(self, current_values):
+        categories = np.union1d(self.values, current_values)
+        reference_counts = np.zeros(len(categories), dtype=np.int64)
+        reference_counts[np.searchsorted(categories, self.values)] = self.counts
+        return reference_counts, category_counts(current_values, categories)
+
+    def binned_counts(self, current_values):
+        if self.column_type == "num" and self.profile.n_unique > HISTOGRAM_MIN_UNIQUE:
+            # the sturges bins np.histogram_bin_edges gives both samples together
+            edges = sturges_edges(
+                min(self.profile.minimum, current_values.min()),
+                max(self.profile.maximum, current_values.max()),
+                len(self) + len(current_values),
+            )
+            cumulative = self.cumsum[
+                np.concatenate(
+                    [
+                        np.searchsorted(self.values, edges[:-1], "left"),
+                        np.searchsorted(self.values, edges[-1:], "right"),
+                    ]
+                )
+            ]
+            return np.diff(cumulative), np.histogram(current_values, edges)[0]
+        return self.category_counts(current_values)
+
+    def z_test(self, current_values):
+        current_categories = np.unique(current_values)
+        if (
+            len(self.values) == 1
+            and len(current_categories) == 1
+            and self.values[0] == current_categories[0]
+        ):
+            return 1.0
+
+        first = np.union1d(self.values, current_categories)[0]
+        p1 = 1 - self.counts[self.values == first].sum() / len(self)
+        p2 = np.mean(current_values != first)
+        n1 = len(self)
+        n2 = len(current_values)
+        p = (p1 * n1 + p2 * n2) / (n1 + n2)
+        z = (p1 - p2) / np.sqrt(p * (1 - p) * (1.0 / n1 + 1.0 / n2))
+        return 2 * (1 - stats.norm.cdf(np.abs(z)))
+
+
+class CurrentData:
+    """Current data sorted by time once, windows are row ranges of it."""
+
+    def __init__(self, data, columns, datetime_column):
+        data = data.sort_values(datetime_column, kind="stable", ignore_index=True)
+        self.timestamps = data[datetime_column].to_numpy()
+        self.columns = {name: data[name] for name in columns}
+        self.missing_cumsum = np.concatenate([[0], np.cumsum(missing_values(data))])
+        self.n_columns = len(data.columns)
+
+    def bounds(self, start, end):
+        return np.searchsorted(
+            self.timestamps, np.array([start, end], dtype=self.timestamps.dtype)
+        )
+
+    def share_missing_values(self, start_row, end_row):
+        n_missing = self.missing_cumsum[end_row] - self.missing_cumsum[start_row]
+        return n_missing / ((end_row - start_row) * self.n_columns)
+
+
+class DriftEngine:
+    """Evidently's ColumnDriftMetric on the prediction, DatasetDriftMetric and
+    DatasetMissingValuesMetric, for many windows against one reference.
+
+    The reference is a compiled ReferenceProfile. The current data is sorted
+    once and every window is a slice of it, so a window costs one drift test
+    per column instead of a full Report run.
+    """
+
+    def __init__(
+        self, reference_profile, prediction="prediction", drift_share=DRIFT_SHARE
+    ):
+        self.prediction = prediction
+        self.drift_share = drift_share
+        self.reference = {
+            name: ReferenceColumn(name, profile)
+            for name, profile in reference_profile.columns.items()
+        }
+
+    def current_data(self, data, datetime_column):
+        return CurrentData(data, list(self.reference), datetime_column)
+
+    def column_drift(self, current, start_row, end_row):
+        return {
+            name: reference.drift(
+                clean_values(current.columns[name].iloc[start_row:end_row])
+            )
+            for name, reference in self.reference.items()
+        }
+
+    def window_metrics(self, current, start, end):
+        """Metrics of the rows of current with start <= timestamp < end."""
+        start_row, end_row = current.bounds(start, end)
+        drift = self.column_drift(current, start_row, end_row)
+
+        num_drifted_columns = sum(drifted for _, _, drifted in drift.values())
+        return {
+            "prediction_drift": float(drift[self.prediction][1]),
+            "num_drifted_columns": int(num_drifted_columns),
+            "share_of_drifted_columns": num_drifted_columns / len(drift),
+            "dataset_drift": bool(num_drifted_columns / len(drift) >= self.drift_share),
+            "share_missing_values": float(
+                current.share_missing_values(start_row, end_row)
+            ),
+        }
+
+
+def write_ipc(data, path):
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    with pa.OSFile(path, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    return path
+
+
+def read_ipc(path):
+    # memory mapped, but to_pandas() copies the columns, every worker holds
+    # its own frame. The file only saves pickling it through the pool.
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
+
+
+# set in every worker process by init_window_worker
+_worker = {}
+
+
+def init_window_worker(reference_profile, current_path, datetime_column):
+    engine = DriftEngine(reference_profile)
+    _worker["engine"] = engine
+    _worker["current"] = engine.current_data(read_ipc(current_path), datetime_column)
+
+
+def worker_window_metrics(window):
+    start, end = window
+    return _worker["engine"].window_metrics(_worker["current"], start, end)
+
+
+def parallel_window_metrics(
+    reference_profile,
+    current_data,
+    windows,
+    datetime_column,
+    max_workers=None,
+):
+    """window_metrics of every (start, end) window, in window order.
+
+    The windows are spread over a process pool. The workers get the small
+    reference profile once and load the current data once from an Arrow IPC
+    file, so only the window bounds and the metrics go through pickling.
+    The workers are spawned, not forked, so they do not inherit the
+    caller's threads and locks (Prefect runs tasks in threads).
+    """
+    max_workers = max_workers or os.cpu_count()
+    if max_workers == 1:
+        engine = DriftEngine(reference_profile)
+        current = engine.current_data(current_data, datetime_column)
+        return [engine.window_metrics(current, start, end) for start, end in windows]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        initargs = (
+            reference_profile,
+            write_ipc(current_data, os.path.join(tmp_dir, "current.arrow")),
+            datetime_column,
+        )
+        with ProcessPoolExecutor(
+            max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_window_worker,
+            initargs=initargs,
+        ) as executor:
+            chunksize = max(1, len(windows) // (4 * max_workers))
+            return list(
+                executor.map(worker_window_metrics, windows, chunksize=chunksize)
+            )
@@ -1,14 +1,13 @@
 import datetime
-import io
 import logging
 import random
 import time
 import uuid
 
-import pandas as pd
-import psycopg2
 import pytz
 
+from metrics_sink import MetricsSink, connection_pool, prep_db
+
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s [%(levelname)s]: %(message)s"
 )
@@ -27,42 +26,27 @@ CREATE TABLE IF NOT EXISTS dummy_metrics (
 """
 
 
-def prep_db():
-    conn_string_default_db = (
-        "host=localhost port=5432 dbname=postgres user=postgres password=example"
-    )
-    conn = psycopg2.connect(conn_string_default_db)
-    conn.autocommit = True
-    cursor = conn.cursor()
-    cursor.execute("SELECT 1 FROM pg_database WHERE datname='test'")
-    if len(cursor.fetchall()) == 0:
-        cursor.execute("CREATE DATABASE test;")
-    cursor.close()
-    conn.close()
-    conn_string = "host=localhost port=5432 dbname=test user=postgres password=example"
-    with psycopg2.connect(conn_string) as conn:
-        with conn.cursor() as cursor:
-            cursor.execute(CREATE_TABLE_STATEMENT)
-
-
-def calculate_dummy_metrics_postgresql(curr):
+def calculate_dummy_metrics_postgresql(sink):
     value1 = random.randint(0, 1000)
     value2 = str(uuid.uuid4())
     value3 = random.random()
-    timestamp = datetime.datetime.now(pytz.timezone("Asia/Taipei"))
+    # Taipei wall clock time in the TIMESTAMP column, without the offset
+    timestamp = datetime.datetime.now(pytz.timezone("Asia/Taipei")).replace(tzinfo=None)
 
-    query = f"INSERT INTO dummy_metrics(timestamp, value1, value2, value3) VALUES ('{timestamp}', {value1}, '{value2}', {value3})"
-    curr.execute(query)
+    sink.add((timestamp, value1, value2, value3))
 
 
 def main():
-    prep_db()
+    prep_db(CREATE_TABLE_STATEMENT)
     last_send = datetime.datetime.now() - datetime.timedelta(seconds=10)
-    conn_string = "host=localhost port=5432 dbname=test user=postgres password=example"
-    with psycopg2.connect(conn_string) as conn:
+    with MetricsSink(
+        connection_pool(),
+        "dummy_metrics",
+        ["timestamp", "value1", "value2", "value3"],
+        flush_seconds=SEND_TIMEOUT,
+    ) as sink:
         for _ in range(0, 100):
-            with conn.cursor() as curr:
-                calculate_dummy_metrics_postgresql(curr)
+            calculate_dummy_metrics_postgresql(sink)
 
             new_send = datetime.datetime.now()
             seconds_elapsed = (new_send - last_send).total_seconds()
@@ -1,10 +1,10 @@
 import datetime
+import os
 import random
 import time
 
 import joblib
 import pandas as pd
-import psycopg2
 from evidently import ColumnMapping
 from evidently.metrics import (
     ColumnDriftMetric,
@@ -15,8 +15,18 @@ from evidently.report import Report
 
 from prefect import flow, get_run_logger, task
 
+from drift_engine import parallel_window_metrics
+from metrics_sink import MetricsSink, connection_pool, prep_db
+from reference_profile import ReferenceProfile
+
 SEND_TIMEOUT = 10
 rand = random.Random()
+# run the full Evidently Report per day instead of the drift engine
+USE_EVIDENTLY = os.getenv("USE_EVIDENTLY", "False") == "True"
+# worker processes for the drift engine windows, all cores by default
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", "0")) or None
+REFERENCE_DATA = "./data/reference.parquet"
+REFERENCE_PROFILE = os.getenv("REFERENCE_PROFILE", "./model/reference_profile.json")
 
 CREATE_TABLE_STATEMENT = """
 CREATE TABLE IF NOT EXISTS evidently_metrics (
@@ -26,17 +36,14 @@ CREATE TABLE IF NOT EXISTS evidently_metrics (
       num_drifted_columns INTEGER,
       SHARE_MISSING_VALUES FLOAT
 );
+CREATE INDEX IF NOT EXISTS evidently_metrics_timestamp_idx
+    ON evidently_metrics (timestamp);
 """
 
-reference_data = pd.read_parquet("./data/reference.parquet")
-with open("./model/lin_reg.bin", "rb") as f_in:
-    model = joblib.load(f_in)
-
-raw_data = pd.read_parquet("./data/green_tripdata_2022-02.parquet")
-
 begin = datetime.datetime(2022, 2, 1, 0, 0)
 num_features = ["passenger_count", "trip_distance", "fare_amount", "total_amount"]
 cat_features = ["PULocationID", "DOLocationID"]
+
 column_mapping = ColumnMapping(
     prediction="prediction",
     numerical_features=num_features,
@@ -53,36 +60,41 @@ report = Report(
 )
 
 
-@task
-def prep_db():
-    logger = get_run_logger()
-    conn_string_default_db = (
-        "host=localhost port=5432 dbname=postgres user=postgres password=example"
+def load_current_data():
+    """The February rides with the model's prediction, the month is predicted once."""
+    with open("./model/lin_reg.bin", "rb") as f_in:
+        model = joblib.load(f_in)
+
+    raw_data = pd.read_parquet("./data/green_tripdata_2022-02.parquet")
+    raw_data["prediction"] = model.predict(
+        raw_data[num_features + cat_features].fillna(0)
+    )
+    return raw_data
+
+
+def load_reference_profile():
+    """The drift engine only needs the profile, not the reference rows.
+
+    Compiled again, like `python reference_profile.py`, when it is missing
+    or stale against REFERENCE_DATA.
+    """
+    return ReferenceProfile.load_or_compile(
+        REFERENCE_PROFILE, REFERENCE_DATA, num_features, cat_features
     )
-    conn = psycopg2.connect(conn_string_default_db)
-    conn.autocommit = True
-    cursor = conn.cursor()
-    cursor.execute("SELECT 1 FROM pg_database WHERE datname='test'")
-    if len(cursor.fetchall()) == 0:
-        cursor.execute("CREATE DATABASE test;")
-    cursor.close()
-    conn.close()
-    conn_string = "host=localhost port=5432 dbname=test user=postgres password=example"
-    with psycopg2.connect(conn_string) as conn:
-        with conn.cursor() as cursor:
-            cursor.execute(CREATE_TABLE_STATEMENT)
+
+
+@task(name="prep_db")
+def prep_db_task():
+    logger = get_run_logger()
+    prep_db(CREATE_TABLE_STATEMENT)
     logger.info("Table created!")
 
 
-@task
-def calculate_metrics_postgresql(i):
+def calculate_metrics_evidently(i, raw_data, reference_data):
     current_data = raw_data[
         (raw_data.lpep_pickup_datetime >= (begin + datetime.timedelta(i)))
         & (raw_data.lpep_pickup_datetime < (begin + datetime.timedelta(i + 1)))
     ]
-    current_data["prediction"] = model.predict(
-        current_data[num_features + cat_features].fillna(0)
-    )
 
     report.run(
         reference_data=reference_data,
@@ -101,26 +113,60 @@ def calculate_metrics_postgresql(i):
     return prediction_drift, num_drifted_columns, share_missing_values
 
 
+@task
+def calculate_metrics_postgresql(num_days):
+    # loaded here and not at import, the spawned drift engine workers
+    # import this module again
+    raw_data = load_current_data()
+    if USE_EVIDENTLY:
+        reference_data = pd.read_parquet(REFERENCE_DATA)
+        return [
+            calculate_metrics_evidently(i, raw_data, reference_data)
+            for i in range(num_days)
+        ]
+
+    windows = [
+        (begin + datetime.timedelta(i), begin + datetime.timedelta(i + 1))
+        for i in range(num_days)
+    ]
+    return [
+        (
+            metrics["prediction_drift"],
+            metrics["num_drifted_columns"],
+            metrics["share_missing_values"],
+        )
+        for metrics in parallel_window_metrics(
+            load_reference_profile(),
+            raw_data,
+            windows,
+            "lpep_pickup_datetime",
+            max_workers=MAX_WORKERS,
+        )
+    ]
+
+
 @flow
-def batch_monitoring_backfill():
-    prep_db()
-    conn_string = "host=localhost port=5432 dbname=test user=postgres password=example"
+def batch_monitoring_backfill(num_days: int = 27):
+    prep_db_task()
+    # every window is computed before the single, ordered write phase
+    daily_metrics = calculate_metrics_postgresql(num_days)
+
     logger = get_run_logger()
-    with psycopg2.connect(conn_string) as conn:
-        for i in range(0, 27):
-            with conn.cursor() as cursor:
-                (
-                    prediction_drift,
-                    num_drifted_columns,
-                    share_missing_values,
-                ) = calculate_metrics_postgresql(i)
-                query = (
-                    f"INSERT INTO evidently_metrics(timestamp, prediction_drift, num_drifted_columns, "
-                    f"share_missing_values) VALUES ('{begin + datetime.timedelta(i)}', "
-                    f"{prediction_drift}, '{num_drifted_columns}', {share_missing_values});"
-                )
-                cursor.execute(query)
-            logger.info("data sent")
+    with MetricsSink(
+        connection_pool(),
+        "evidently_metrics",
+        [
+            "timestamp",
+            "prediction_drift",
+            "num_drifted_columns",
+            "share_missing_values",
+        ],
+    ) as sink:
+        sink.add_many(
+            (begin + datetime.timedelta(i), *metrics)
+            for i, metrics in enumerate(daily_metrics)
+        )
+    logger.info(f"{len(daily_metrics)} days of metrics sent")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,151 @@
+import datetime
+import io
+import threading
+
+import psycopg2
+from psycopg2 import pool, sql
+from psycopg2.extras import execute_values
+
+CONN_STRING_DEFAULT_DB = (
+    "host=localhost port=5432 dbname=postgres user=postgres password=example"
+)
+CONN_STRING = "host=localhost port=5432 dbname=test user=postgres password=example"
+
+
+def prep_db(create_statement, conn_string=CONN_STRING, dbname="test"):
+    """Create the database if it is missing, then run create_statement in it."""
+    conn = psycopg2.connect(CONN_STRING_DEFAULT_DB)
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_database WHERE datname=%s", (dbname,))
+        if len(cursor.fetchall()) == 0:
+            cursor.execute(
+                sql.SQL("CREATE DATABASE {};").format(sql.Identifier(dbname))
+            )
+    conn.close()
+
+    with psycopg2.connect(conn_string) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(create_statement)
+    conn.close()
+
+
+def connection_pool(conn_string=CONN_STRING, maxconn=4):
+    return pool.ThreadedConnectionPool(1, maxconn, conn_string)
+
+
+def copy_value(value):
+    """A value in the text format of COPY FROM."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=" ")
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+class MetricsSink:
+    """Buffers the metric rows of one table and writes them in batches.
+
+    Rows are written with one parameterized execute_values, or with COPY FROM
+    an in-memory buffer, once max_rows are buffered or flush_seconds after
+    the first buffered row. A timer thread writes them when no further row
+    comes in. The connection comes from a pool, anything with getconn,
+    putconn and closeall works, and goes back to it after every batch.
+
+    The sink owns its pool: close(), or leaving the with block, writes the
+    last buffered rows and closes the pool's connections.
+    """
+
+    def __init__(
+        self,
+        connection_pool,
+        table,
+        columns,
+        max_rows=1000,
+        flush_seconds=10.0,
+        use_copy=False,
+    ):
+        self.connection_pool = connection_pool
+        self.table = table
+        self.columns = columns
+        self.max_rows = max_rows
+        self.flush_seconds = flush_seconds
+        self.use_copy = use_copy
+        self.rows = []
+        # add runs from the caller's thread, the timed flush from the timer's
+        self.lock = threading.RLock()
+        self.timer = None
+
+        table_columns = sql.SQL("{} ({})").format(
+            sql.Identifier(table), sql.SQL(", ").join(map(sql.Identifier, columns))
+        )
+        self.insert_statement = sql.SQL("INSERT INTO {} VALUES %s").format(
+            table_columns
+        )
+        self.copy_statement = sql.SQL("COPY {} FROM STDIN").format(table_columns)
+
+    def add(self, row):
+        with self.lock:
+            self.rows.append(tuple(row))
+            if len(self.rows) >= self.max_rows:
+                self.flush()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.flush_seconds, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def add_many(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def flush(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not self.rows:
+                return
+
+            conn = self.connection_pool.getconn()
+            try:
+                # commits the batch, or rolls it back and keeps the rows buffered
+                with conn:
+                    with conn.cursor() as cursor:
+                        if self.use_copy:
+                            self.copy_rows(cursor, self.rows)
+                        else:
+                            execute_values(
+                                cursor,
+                                self.insert_statement,
+                                self.rows,
+                                page_size=len(self.rows),
+                            )
+            finally:
+                self.connection_pool.putconn(conn)
+            self.rows = []
+
+    def copy_rows(self, cursor, rows):
+        buffer = io.StringIO()
+        for row in rows:
+            buffer.write("\t".join(map(copy_value, row)))
+            buffer.write("\n")
+        buffer.seek(0)
+        cursor.copy_expert(self.copy_statement, buffer)
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.connection_pool.closeall()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
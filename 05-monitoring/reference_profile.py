@@ -0,0 +1,239 @@
+import argparse
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+FORMAT_VERSION = 1
+# larger numerical supports are kept as this many equally weighted groups
+MAX_VALUES = 1000
+QUANTILES = [0.0, 0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99, 1.0]
+
+
+def clean_values(column):
+    """Column values without nulls, inf and -inf, like Evidently drops them."""
+    values = column.to_numpy()
+    if pd.api.types.is_numeric_dtype(column):
+        return values[np.isfinite(values)]
+    return column.dropna().to_numpy()
+
+
+class ColumnProfile:
+    """Distribution of one reference column as (value, count) pairs.
+
+    Categorical columns and numerical columns with up to max_values distinct
+    values keep their exact value counts. Other numerical columns keep the
+    means of max_values groups of equally many sorted values. Size, range,
+    std and distinct count are always exact.
+
+    The group means move the reference by quantization_error, the
+    Wasserstein distance between the raw values and the profile, in units
+    of the column. The Wasserstein drift score of any window is then within
+    quantization_error / std of the score against the raw reference. It is
+    0.0 for exact profiles and grows with the spread inside the groups, long
+    tails of outliers make it largest.
+    """
+
+    def __init__(
+        self,
+        column_type,
+        n_rows,
+        n_missing,
+        n_unique,
+        minimum,
+        maximum,
+        std,
+        values,
+        counts,
+        quantiles,
+        quantization_error=0.0,
+    ):
+        self.column_type = column_type
+        self.n_rows = n_rows
+        self.n_missing = n_missing
+        self.n_unique = n_unique
+        self.minimum = minimum
+        self.maximum = maximum
+        self.std = std
+        self.values = np.asarray(values)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.quantiles = quantiles
+        self.quantization_error = quantization_error
+
+    @classmethod
+    def compile(cls, column, column_type, max_values=MAX_VALUES):
+        values = clean_values(column)
+        if len(values) == 0:
+            raise ValueError(f"Column '{column.name}' has no values to profile")
+
+        unique, counts = np.unique(values, return_counts=True)
+        n_unique = len(unique)
+        minimum = maximum = std = quantiles = None
+        quantization_error = 0.0
+        if column_type == "num":
+            minimum, maximum = unique[0].item(), unique[-1].item()
+            std = float(np.std(values))
+            quantiles = np.quantile(values, QUANTILES).tolist()
+            if n_unique > max_values:
+                sorted_values = np.sort(values)
+                bounds = np.linspace(0, len(values), max_values + 1).astype(np.int64)
+                counts = np.diff(bounds)
+                means = np.add.reduceat(sorted_values, bounds[:-1]) / counts
+                # rounding must not break the sort order of the group means
+                unique = np.maximum.accumulate(means)
+                quantization_error = float(
+                    np.mean(np.abs(sorted_values - np.repeat(unique, counts)))
+                )
+
+        return cls(
+            column_type,
+            n_rows=len(values),
+            n_missing=len(column) - len(values),
+            n_unique=n_unique,
+            minimum=minimum,
+            maximum=maximum,
+            std=std,
+            values=unique,
+            counts=counts,
+            quantiles=quantiles,
+            quantization_error=quantization_error,
+        )
+
+    def to_dict(self):
+        profile = dict(vars(self))
+        profile["values"] = self.values.tolist()
+        profile["counts"] = self.counts.tolist()
+        return profile
+
+
+def reference_fingerprint(path):
+    """Rows and sha256 of a reference parquet file."""
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f_in:
+        for chunk in iter(lambda: f_in.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return {
+        "n_rows": pq.ParquetFile(path).metadata.num_rows,
+        "sha256": sha256.hexdigest(),
+    }
+
+
+class ReferenceProfile:
+    """Compiled reference dataset of the drift engine, one ColumnProfile per
+    drift column, small enough to live next to the model.
+
+    A profile compiled from a file keeps the file's fingerprint, so a
+    profile of an older reference is detected as stale.
+    """
+
+    def __init__(self, columns, n_rows, fingerprint=None):
+        self.columns = columns
+        self.n_rows = n_rows
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def compile(
+        cls,
+        reference_data,
+        numerical_features,
+        categorical_features,
+        prediction="prediction",
+        max_values=MAX_VALUES,
+        fingerprint=None,
+    ):
+        column_types = {prediction: "num"}
+        column_types.update((name, "num") for name in numerical_features)
+        column_types.update((name, "cat") for name in categorical_features)
+        columns = {
+            name: ColumnProfile.compile(reference_data[name], column_type, max_values)
+            for name, column_type in column_types.items()
+        }
+        return cls(columns, len(reference_data), fingerprint)
+
+    @classmethod
+    def compile_file(cls, path, numerical_features, categorical_features, **kwargs):
+        return cls.compile(
+            pd.read_parquet(path),
+            numerical_features,
+            categorical_features,
+            fingerprint=reference_fingerprint(path),
+            **kwargs,
+        )
+
+    @classmethod
+    def load_or_compile(
+        cls, path, reference_path, numerical_features, categorical_features
+    ):
+        """The profile at path, compiled and saved again when it is missing or
+        was not compiled from the current reference_path file."""
+        if os.path.exists(path):
+            profile = cls.load(path)
+            if profile.fingerprint == reference_fingerprint(reference_path):
+                return profile
+        profile = cls.compile_file(
+            reference_path, numerical_features, categorical_features
+        )
+        profile.save(path)
+        return profile
+
+    def save(self, path):
+        with open(path, "w") as f_out:
+            json.dump(
+                {
+                    "format_version": FORMAT_VERSION,
+                    "n_rows": self.n_rows,
+                    "fingerprint": self.fingerprint,
+                    "columns": {
+                        name: column.to_dict() for name, column in self.columns.items()
+                    },
+                },
+                f_out,
+            )
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f_in:
+            profile = json.load(f_in)
+        if profile["format_version"] != FORMAT_VERSION:
+            raise ValueError(
+                f"{path} has profile format {profile['format_version']}, "
+                f"expected {FORMAT_VERSION}"
+            )
+        columns = {
+            name: ColumnProfile(**column) for name, column in profile["columns"].items()
+        }
+        return cls(columns, profile["n_rows"], profile.get("fingerprint"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compile the reference dataset into a drift reference profile"
+    )
+    parser.add_argument(
+        "--reference_data", type=str, default="./data/reference.parquet"
+    )
+    parser.add_argument(
+        "--output_path", type=str, default="./model/reference_profile.json"
+    )
+    parser.add_argument(
+        "--numerical_features",
+        nargs="+",
+        default=["passenger_count", "trip_distance", "fare_amount", "total_amount"],
+    )
+    parser.add_argument(
+        "--categorical_features", nargs="+", default=["PULocationID", "DOLocationID"]
+    )
+    parser.add_argument("--max_values", type=int, default=MAX_VALUES)
+    args = parser.parse_args()
+
+    profile = ReferenceProfile.compile_file(
+        args.reference_data,
+        args.numerical_features,
+        args.categorical_features,
+        max_values=args.max_values,
+    )
+    profile.save(args.output_path)
+    print(f"Profile of {profile.n_rows} reference rows saved to {args.output_path}")
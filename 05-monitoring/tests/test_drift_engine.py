@@ -0,0 +1,243 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+from scipy.spatial import distance
+
+from drift_engine import DriftEngine, parallel_window_metrics
+from reference_profile import ReferenceProfile
+
+NUM_FEATURES = ["passenger_count", "trip_distance"]
+CAT_FEATURES = ["PULocationID", "payment_type"]
+BEGIN = pd.Timestamp("2022-02-01")
+
+
+def make_rides(n_rows, seed, shift=0.0):
+    """Rides with a stattest of every kind, the numerical columns with less
+    than 1000 distinct values, so the reference profile is exact."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "lpep_pickup_datetime": BEGIN
+            + pd.to_timedelta(rng.uniform(0, 3 * 86400, n_rows), unit="s"),
+            "passenger_count": rng.integers(1, 5, n_rows).astype(float),
+            "trip_distance": np.round(rng.exponential(3.0 + shift, n_rows), 1),
+            "PULocationID": rng.integers(1, 30, n_rows),
+            "payment_type": rng.choice(
+                [1, 2], n_rows, p=[0.6 + shift / 100, 0.4 - shift / 100]
+            ),
+            "prediction": np.round(rng.normal(15.0 + shift, 5.0, n_rows), 1),
+        }
+    )
+
+
+def category_percents(reference, current):
+    categories = np.union1d(reference, current)
+    return (
+        pd.Series(reference).value_counts().reindex(categories, fill_value=0)
+        / len(reference),
+        pd.Series(current).value_counts().reindex(categories, fill_value=0)
+        / len(current),
+    )
+
+
+def chisquare_p_value(reference, current):
+    reference_percents, current_percents = category_percents(reference, current)
+    return stats.chisquare(
+        current_percents * len(current), reference_percents * len(current)
+    )[1]
+
+
+def z_test_p_value(reference, current):
+    first = min(np.union1d(reference, current))
+    p1, p2 = np.mean(reference != first), np.mean(current != first)
+    n1, n2 = len(reference), len(current)
+    p = (p1 * n1 + p2 * n2) / (n1 + n2)
+    z = (p1 - p2) / np.sqrt(p * (1 - p) * (1.0 / n1 + 1.0 / n2))
+    return 2 * (1 - stats.norm.cdf(np.abs(z)))
+
+
+# Evidently's default stattest per column for references of up to 1000 rows
+# and for larger ones
+SMALL_STATTESTS = {
+    "passenger_count": "chisquare",
+    "trip_distance": "ks",
+    "PULocationID": "chisquare",
+    "payment_type": "z",
+    "prediction": "ks",
+}
+LARGE_STATTESTS = {
+    "passenger_count": "jensenshannon",
+    "trip_distance": "wasserstein",
+    "PULocationID": "jensenshannon",
+    "payment_type": "jensenshannon",
+    "prediction": "wasserstein",
+}
+SCIPY_STATTESTS = {
+    "ks": lambda reference, current: stats.ks_2samp(reference, current)[1],
+    "chisquare": chisquare_p_value,
+    "z": z_test_p_value,
+    "wasserstein": lambda reference, current: (
+        stats.wasserstein_distance(reference, current) / np.std(reference)
+    ),
+    "jensenshannon": lambda reference, current: distance.jensenshannon(
+        *category_percents(reference, current)
+    ),
+}
+
+
+def scipy_drift(reference, current):
+    """(stattest, drift_score) of every column, computed on the raw reference."""
+    stattests = SMALL_STATTESTS if len(reference) <= 1000 else LARGE_STATTESTS
+    return {
+        name: (stattest, SCIPY_STATTESTS[stattest](reference[name], current[name]))
+        for name, stattest in stattests.items()
+    }
+
+
+def engine_drift(reference, current):
+    engine = DriftEngine(
+        ReferenceProfile.compile(reference, NUM_FEATURES, CAT_FEATURES)
+    )
+    current_data = engine.current_data(current, "lpep_pickup_datetime")
+    return engine.column_drift(current_data, 0, len(current))
+
+
+@pytest.mark.parametrize("n_reference", [800, 5000])
+@pytest.mark.parametrize("shift", [0.0, 2.0])
+def test_column_drift_matches_scipy(n_reference, shift):
+    reference = make_rides(n_reference, seed=1)
+    current = make_rides(700, seed=2, shift=shift)
+
+    drift = engine_drift(reference, current)
+    for name, (stattest, score) in scipy_drift(reference, current).items():
+        assert drift[name][0] == stattest, name
+        assert drift[name][1] == pytest.approx(score, rel=1e-9, abs=1e-12), name
+
+
+def test_small_reference_detects_drift_by_p_value():
+    reference = make_rides(800, seed=1)
+
+    assert not engine_drift(reference, make_rides(700, seed=3))["prediction"][2]
+    assert engine_drift(reference, make_rides(700, seed=3, shift=2.0))["prediction"][2]
+
+
+def test_large_reference_detects_drift_by_distance():
+    reference = make_rides(5000, seed=1)
+
+    assert not engine_drift(reference, make_rides(700, seed=3))["prediction"][2]
+    assert engine_drift(reference, make_rides(700, seed=3, shift=2.0))["prediction"][2]
+
+
+def test_share_missing_values_counts_nulls_inf_and_empty_strings():
+    reference = make_rides(800, seed=1)
+    current = make_rides(10, seed=2)
+    current["store_and_fwd_flag"] = ["N"] * 8 + ["", None]
+    current.loc[0, "trip_distance"] = np.nan
+    current.loc[1, "trip_distance"] = np.inf
+    current.loc[2, "prediction"] = -np.inf
+
+    engine = DriftEngine(
+        ReferenceProfile.compile(reference, NUM_FEATURES, CAT_FEATURES)
+    )
+    metrics = engine.window_metrics(
+        engine.current_data(current, "lpep_pickup_datetime"),
+        BEGIN,
+        BEGIN + pd.Timedelta(days=3),
+    )
+
+    assert metrics["share_missing_values"] == 5 / (10 * len(current.columns))
+
+
+def test_window_metrics_of_day_slices():
+    reference = make_rides(800, seed=1)
+    current = make_rides(2100, seed=2)
+    engine = DriftEngine(
+        ReferenceProfile.compile(reference, NUM_FEATURES, CAT_FEATURES)
+    )
+    current_data = engine.current_data(current, "lpep_pickup_datetime")
+
+    start = BEGIN + pd.Timedelta(days=1)
+    metrics = engine.window_metrics(current_data, start, start + pd.Timedelta(days=1))
+
+    day = current[
+        (current.lpep_pickup_datetime >= start)
+        & (current.lpep_pickup_datetime < start + pd.Timedelta(days=1))
+    ]
+    expected = scipy_drift(reference, day)
+    assert metrics["prediction_drift"] == pytest.approx(expected["prediction"][1])
+
+
+def test_parallel_window_metrics_matches_serial():
+    reference_profile = ReferenceProfile.compile(
+        make_rides(800, seed=1), NUM_FEATURES, CAT_FEATURES
+    )
+    current = make_rides(2100, seed=2, shift=1.0)
+    windows = [
+        (BEGIN + pd.Timedelta(hours=6 * i), BEGIN + pd.Timedelta(hours=6 * (i + 1)))
+        for i in range(12)
+    ]
+
+    serial = parallel_window_metrics(
+        reference_profile, current, windows, "lpep_pickup_datetime", max_workers=1
+    )
+    parallel = parallel_window_metrics(
+        reference_profile, current, windows, "lpep_pickup_datetime", max_workers=2
+    )
+
+    assert parallel == serial
+
+
+def test_matches_evidently_report():
+    pytest.importorskip("evidently")
+    from evidently import ColumnMapping
+    from evidently.metrics import (
+        ColumnDriftMetric,
+        DatasetDriftMetric,
+        DatasetMissingValuesMetric,
+    )
+    from evidently.report import Report
+
+    for n_reference in [800, 5000]:
+        reference = make_rides(n_reference, seed=1)
+        current = make_rides(700, seed=2, shift=1.0)
+        current.loc[:9, "trip_distance"] = np.nan
+
+        report = Report(
+            metrics=[
+                ColumnDriftMetric(column_name="prediction"),
+                DatasetDriftMetric(),
+                DatasetMissingValuesMetric(),
+            ]
+        )
+        report.run(
+            reference_data=reference,
+            current_data=current,
+            column_mapping=ColumnMapping(
+                prediction="prediction",
+                numerical_features=NUM_FEATURES,
+                categorical_features=CAT_FEATURES,
+                target=None,
+            ),
+        )
+        result = report.as_dict()["metrics"]
+
+        engine = DriftEngine(
+            ReferenceProfile.compile(reference, NUM_FEATURES, CAT_FEATURES)
+        )
+        metrics = engine.window_metrics(
+            engine.current_data(current, "lpep_pickup_datetime"),
+            BEGIN,
+            BEGIN + pd.Timedelta(days=3),
+        )
+
+        assert metrics["prediction_drift"] == pytest.approx(
+            result[0]["result"]["drift_score"]
+        )
+        assert (
+            metrics["num_drifted_columns"]
+            == result[1]["result"]["number_of_drifted_columns"]
+        )
+        assert metrics["share_missing_values"] == pytest.approx(
+            result[2]["result"]["current"]["share_of_missing_values"]
+        )
@@ -0,0 +1,139 @@
+import datetime
+import threading
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+import metrics_sink  # noqa: E402
+from metrics_sink import MetricsSink  # noqa: E402
+
+COLUMNS = ["timestamp", "value1", "value2"]
+
+
+class CursorMock:
+    def __init__(self, batches):
+        self.batches = batches
+
+    def copy_expert(self, statement, buffer):
+        self.batches.append(buffer.read().splitlines())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class FailingCursorMock(CursorMock):
+    def copy_expert(self, statement, buffer):
+        raise RuntimeError("connection lost")
+
+
+class ConnectionMock:
+    def __init__(self, cursor_class, batches):
+        self.cursor_class = cursor_class
+        self.batches = batches
+
+    def cursor(self):
+        return self.cursor_class(self.batches)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class PoolMock:
+    def __init__(self, cursor_class=CursorMock):
+        self.cursor_class = cursor_class
+        self.batches = []
+        self.written = threading.Event()
+        self.checked_out = 0
+        self.closed = False
+
+    def getconn(self):
+        self.checked_out += 1
+        return ConnectionMock(self.cursor_class, self.batches)
+
+    def putconn(self, conn):
+        self.checked_out -= 1
+        self.written.set()
+
+    def closeall(self):
+        self.closed = True
+
+
+def rows(n):
+    timestamp = datetime.datetime(2022, 2, 1)
+    return [(timestamp + datetime.timedelta(minutes=i), i, None) for i in range(n)]
+
+
+def test_rows_are_written_in_batches_of_max_rows():
+    pool = PoolMock()
+    sink = MetricsSink(pool, "metrics", COLUMNS, max_rows=3, use_copy=True)
+
+    sink.add_many(rows(7))
+
+    assert [len(batch) for batch in pool.batches] == [3, 3]
+    assert pool.batches[0][1] == "2022-02-01 00:01:00\t1\t\\N"
+    assert pool.checked_out == 0
+    sink.close()
+
+
+def test_buffered_rows_are_flushed_after_flush_seconds():
+    pool = PoolMock()
+    sink = MetricsSink(
+        pool, "metrics", COLUMNS, max_rows=100, flush_seconds=0.05, use_copy=True
+    )
+
+    sink.add_many(rows(2))
+
+    # no further row comes in, the timer writes the buffered ones
+    assert pool.written.wait(5)
+    assert [len(batch) for batch in pool.batches] == [2]
+    assert sink.rows == []
+    assert sink.timer is None
+    sink.close()
+
+
+def test_close_flushes_the_last_rows_and_closes_the_pool():
+    pool = PoolMock()
+
+    with MetricsSink(
+        pool, "metrics", COLUMNS, max_rows=3, flush_seconds=60, use_copy=True
+    ) as sink:
+        sink.add_many(rows(4))
+        assert [len(batch) for batch in pool.batches] == [3]
+
+    assert [len(batch) for batch in pool.batches] == [3, 1]
+    assert sink.timer is None
+    assert pool.closed
+
+
+def test_execute_values_gets_the_whole_batch(monkeypatch):
+    pool = PoolMock()
+    calls = []
+    monkeypatch.setattr(
+        metrics_sink,
+        "execute_values",
+        lambda cursor, statement, rows, page_size: calls.append((rows, page_size)),
+    )
+
+    with MetricsSink(pool, "metrics", COLUMNS, max_rows=2) as sink:
+        sink.add_many(rows(3))
+
+    assert [(len(batch), page_size) for batch, page_size in calls] == [(2, 2), (1, 1)]
+
+
+def test_failed_batch_stays_buffered_and_the_pool_is_closed():
+    pool = PoolMock(FailingCursorMock)
+    sink = MetricsSink(pool, "metrics", COLUMNS, flush_seconds=60, use_copy=True)
+    sink.add_many(rows(2))
+
+    with pytest.raises(RuntimeError):
+        sink.close()
+
+    assert len(sink.rows) == 2
+    assert pool.closed
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from drift_engine import ReferenceColumn
+from reference_profile import ColumnProfile, ReferenceProfile, reference_fingerprint
+
+NUM_FEATURES = ["trip_distance"]
+CAT_FEATURES = ["PULocationID"]
+
+
+def make_reference(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "trip_distance": rng.lognormal(1.0, 0.8, n_rows),
+            "PULocationID": rng.integers(1, 30, n_rows),
+            "prediction": rng.normal(15.0, 5.0, n_rows),
+        }
+    )
+
+
+def raw_wasserstein(reference, current):
+    return stats.wasserstein_distance(reference, current) / np.std(reference)
+
+
+def test_small_support_is_exact():
+    column = pd.Series(np.round(make_reference(5000)["prediction"]))
+    profile = ColumnProfile.compile(column, "num")
+
+    assert profile.quantization_error == 0.0
+    assert np.repeat(profile.values, profile.counts).tolist() == sorted(column)
+
+
+@pytest.mark.parametrize("shift", [0.0, 0.05, 0.2, 1.0])
+def test_group_means_keep_wasserstein_within_quantization_error(shift):
+    reference = make_reference(20_000)["trip_distance"]
+    # a long tail of outliers, like the trip distances of the taxi data
+    reference.iloc[:20] = np.linspace(100, 5000, 20)
+    current = make_reference(700, seed=1)["trip_distance"].to_numpy() * (1 + shift)
+    profile = ColumnProfile.compile(reference, "num")
+
+    score = ReferenceColumn("trip_distance", profile).drift(current)[1]
+    raw_score = raw_wasserstein(reference, current)
+
+    assert len(profile.values) == 1000
+    assert profile.quantization_error == pytest.approx(
+        stats.wasserstein_distance(reference, profile.values, None, profile.counts)
+    )
+    assert abs(score - raw_score) <= profile.quantization_error / profile.std + 1e-12
+
+
+def test_quantization_error_is_small_for_smooth_columns():
+    reference = make_reference(20_000)["trip_distance"]
+    profile = ColumnProfile.compile(reference, "num")
+
+    assert 0 < profile.quantization_error / profile.std < 0.01
+
+
+def test_fingerprint_is_saved_with_the_profile(tmp_path):
+    reference_path = str(tmp_path / "reference.parquet")
+    make_reference(2000).to_parquet(reference_path)
+    profile_path = str(tmp_path / "reference_profile.json")
+
+    ReferenceProfile.compile_file(reference_path, NUM_FEATURES, CAT_FEATURES).save(
+        profile_path
+    )
+    profile = ReferenceProfile.load(profile_path)
+
+    assert profile.fingerprint == reference_fingerprint(reference_path)
+    assert profile.fingerprint["n_rows"] == 2000
+
+
+def test_load_or_compile_rebuilds_a_stale_profile(tmp_path):
+    reference_path = str(tmp_path / "reference.parquet")
+    profile_path = str(tmp_path / "reference_profile.json")
+    make_reference(2000).to_parquet(reference_path)
+    first = ReferenceProfile.load_or_compile(
+        profile_path, reference_path, NUM_FEATURES, CAT_FEATURES
+    )
+
+    assert (
+        ReferenceProfile.load_or_compile(
+            profile_path, reference_path, NUM_FEATURES, CAT_FEATURES
+        ).fingerprint
+        == first.fingerprint
+    )
+
+    make_reference(3000, seed=1).to_parquet(reference_path)
+    rebuilt = ReferenceProfile.load_or_compile(
+        profile_path, reference_path, NUM_FEATURES, CAT_FEATURES
+    )
+
+    assert rebuilt.n_rows == 3000
+    assert rebuilt.fingerprint != first.fingerprint
+    assert ReferenceProfile.load(profile_path).fingerprint == rebuilt.fingerprint
+
+
+def test_profile_without_fingerprint_is_rebuilt(tmp_path):
+    reference_path = str(tmp_path / "reference.parquet")
+    profile_path = str(tmp_path / "reference_profile.json")
+    reference = make_reference(2000)
+    reference.to_parquet(reference_path)
+    ReferenceProfile.compile(reference, NUM_FEATURES, CAT_FEATURES).save(profile_path)
+
+    profile = ReferenceProfile.load_or_compile(
+        profile_path, reference_path, NUM_FEATURES, CAT_FEATURES
+    )
+
+    assert profile.fingerprint == reference_fingerprint(reference_path)
@@ -0,0 +1,48 @@
+import pytest
+
+from conftest import BATCH_DEPLOYMENT_DIR, ORCHESTRATION_DIR, import_from
+from encoder import ZonePairEncoder
+
+
+def test_read_trips(benchmark, month_file):
+    taxi_data = import_from(BATCH_DEPLOYMENT_DIR, "taxi_data")
+    df = benchmark(taxi_data.read_trips, month_file)
+    assert len(df) > 0
+
+
+def test_encoder_transform(benchmark, month_file):
+    taxi_data = import_from(BATCH_DEPLOYMENT_DIR, "taxi_data")
+    df = taxi_data.read_trips(month_file)
+
+    def fit_transform():
+        encoder = ZonePairEncoder.fit(df["PULocationID"], df["DOLocationID"])
+        return encoder.transform(
+            df["PULocationID"], df["DOLocationID"], df["trip_distance"]
+        )
+
+    benchmark(fit_transform)
+
+
+def test_score_read_dataframe(benchmark, month_file, pipeline):
+    pytest.importorskip("prefect")
+    score = import_from(BATCH_DEPLOYMENT_DIR, "score")
+    encoder = ZonePairEncoder.from_dict_vectorizer(pipeline.steps[0][1])
+
+    def read_and_prepare():
+        df = score.read_dataframe(month_file)
+        return score.prepare_features(df, encoder)
+
+    benchmark(read_and_prepare)
+
+
+def test_add_features(benchmark, month_file):
+    pytest.importorskip("prefect")
+    orchestrate = import_from(ORCHESTRATION_DIR, "orchestrate")
+    df = orchestrate.read_data.fn(month_file)
+    df_train, df_val = df.iloc[: len(df) // 2], df.iloc[len(df) // 2 :]
+
+    X_train, y_train, X_val, y_val, _ = benchmark(
+        orchestrate.add_features.fn, df_train, df_val
+    )
+    assert X_train.shape[0] == len(y_train)
+    assert X_val.shape[0] == len(y_val)
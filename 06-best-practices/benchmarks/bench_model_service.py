@@ -0,0 +1,39 @@
+import pytest
+
+import model
+from model_bundle import ModelBundle
+from synthetic_data import generate_rides, kinesis_event
+
+BATCH_SIZES = [1, 32, 500]
+
+RIDE = {"PULocationID": 130, "DOLocationID": 205, "trip_distance": 3.66}
+FEATURES = {"PU_DO": "130_205", "trip_distance": 3.66}
+
+
+@pytest.fixture(scope="module", params=["pipeline", "array_engine"])
+def model_service(request, pipeline):
+    if request.param == "array_engine":
+        bundle = ModelBundle.from_pipeline(pipeline)
+        return model.ModelService(bundle, encoder=bundle.encoder)
+    return model.ModelService(pipeline)
+
+
+def test_base64_decode(benchmark):
+    encoded_data = kinesis_event([RIDE])["Records"][0]["kinesis"]["data"]
+    benchmark(model.base64_decode, encoded_data)
+
+
+def test_prepare_features(benchmark):
+    model_service = model.ModelService(None)
+    benchmark(model_service.prepare_features, RIDE)
+
+
+def test_predict(benchmark, model_service):
+    benchmark(model_service.predict, FEATURES)
+
+
+@pytest.mark.parametrize("batch_size", BATCH_SIZES)
+def test_lambda_handler(benchmark, model_service, batch_size):
+    event = kinesis_event(generate_rides(batch_size))
+    result = benchmark(model_service.lambda_handler, event)
+    assert len(result["predictions"]) == batch_size
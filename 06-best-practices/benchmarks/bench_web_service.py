@@ -0,0 +1,41 @@
+import pytest
+from sklearn.feature_extraction import DictVectorizer
+from sklearn.linear_model import LinearRegression
+
+from conftest import WEB_SERVICE_DIR, import_from
+from model_bundle import ModelBundle
+from synthetic_data import generate_rides, ride_durations, ride_features
+
+BATCH_SIZES = [32, 500]
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    pytest.importorskip("flask")
+
+    # lin_reg.bin has no PU_DO features, serve a linear model that has them
+    rides = generate_rides(20_000)
+    dv = DictVectorizer()
+    model = LinearRegression().fit(
+        dv.fit_transform(ride_features(rides)), ride_durations(rides)
+    )
+    bundle_path = str(tmp_path_factory.mktemp("model") / "lin_reg.bundle")
+    ModelBundle.from_linear(dv, model).save(bundle_path)
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setenv("MODEL_BUNDLE", bundle_path)
+        predict = import_from(WEB_SERVICE_DIR, "predict")
+    return predict.app.test_client()
+
+
+def test_predict_endpoint(benchmark, client):
+    ride = generate_rides(1)[0]
+    response = benchmark(client.post, "/predict", json=ride)
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize("batch_size", BATCH_SIZES)
+def test_predict_batch_endpoint(benchmark, client, batch_size):
+    rides = generate_rides(batch_size)
+    response = benchmark(client.post, "/predict/batch", json=rides)
+    assert len(response.get_json()["durations"]) == batch_size
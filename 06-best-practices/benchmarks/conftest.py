@@ -0,0 +1,54 @@
+import importlib
+import os
+import sys
+
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.feature_extraction import DictVectorizer
+from sklearn.pipeline import make_pipeline
+
+from synthetic_data import generate_rides, ride_durations, ride_features, write_trips
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(SERVICE_DIR)
+
+BATCH_DEPLOYMENT_DIR = os.path.join(REPO_DIR, "04-deployment", "batch_deployment")
+ORCHESTRATION_DIR = os.path.join(REPO_DIR, "03-orchestration")
+WEB_SERVICE_DIR = os.path.join(REPO_DIR, "04-deployment", "web-service")
+
+# a green taxi month is 60-80k trips
+MONTH_ROWS = int(os.getenv("BENCHMARK_MONTH_ROWS", "70000"))
+
+
+def import_from(directory, module_name):
+    """Import a script of another week folder.
+
+    The folders are flat script directories, the modules they share with
+    this one (encoder.py, model_cache.py, ...) are identical copies, so
+    they only go at the end of sys.path.
+    """
+    if directory not in sys.path:
+        sys.path.append(directory)
+    return importlib.import_module(module_name)
+
+
+@pytest.fixture(scope="session")
+def pipeline():
+    """DictVectorizer + random forest with the rf-best-model parameters."""
+    rides = generate_rides(20_000)
+    dicts = ride_features(rides)
+    pipeline = make_pipeline(
+        DictVectorizer(),
+        RandomForestRegressor(
+            max_depth=20, n_estimators=100, min_samples_leaf=10, random_state=0
+        ),
+    )
+    pipeline.fit(dicts, ride_durations(rides))
+    return pipeline
+
+
+@pytest.fixture(scope="session")
+def month_file(tmp_path_factory):
+    path = tmp_path_factory.mktemp("data") / "green_tripdata_2022-01.parquet"
+    write_trips(str(path), MONTH_ROWS, year=2022, month=1)
+    return str(path)
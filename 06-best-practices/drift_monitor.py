@@ -0,0 +1,299 @@
+import argparse
+import datetime
+import json
+import threading
+import time
+
+import numpy as np
+
+from encoder import NUM_ZONES
+
+NUM_BINS = 20
+TOP_K_PAIRS = 200
+WINDOW_SECONDS = 300
+# Jensen-Shannon distance, the threshold Evidently uses by default
+DRIFT_THRESHOLD = 0.1
+
+
+def jensenshannon(p, q):
+    """Jensen-Shannon distance of two count vectors, natural log like scipy."""
+    p = p / p.sum()
+    q = q / q.sum()
+    m = (p + q) / 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        divergence = (
+            np.where(p > 0, p * np.log(p / m), 0.0).sum()
+            + np.where(q > 0, q * np.log(q / m), 0.0).sum()
+        )
+    return float(np.sqrt(max(divergence / 2, 0.0)))
+
+
+def zone_pairs(pu_location_ids, do_location_ids):
+    return np.asarray(pu_location_ids, dtype=np.int64) * NUM_ZONES + np.asarray(
+        do_location_ids, dtype=np.int64
+    )
+
+
+def quantile_edges(values, num_bins):
+    """Inner bin edges that split values into num_bins equally sized bins.
+
+    The outer bins are open ended, so new values outside the reference range
+    still land in a bin.
+    """
+    values = values[np.isfinite(values)]
+    quantiles = np.linspace(0, 1, num_bins + 1)[1:-1]
+    return np.unique(np.quantile(values, quantiles))
+
+
+def bin_counts(edges, values):
+    return np.bincount(
+        np.searchsorted(edges, values, "right"), minlength=len(edges) + 1
+    )
+
+
+class ReferenceSketch:
+    """Binned reference distributions of trip_distance, prediction and PU_DO.
+
+    PU_DO keeps the counts of the top_k most frequent zone pairs and one more
+    count for all other pairs.
+    """
+
+    def __init__(
+        self,
+        trip_distance_edges,
+        trip_distance_counts,
+        prediction_edges,
+        prediction_counts,
+        top_pairs,
+        pair_counts,
+    ):
+        self.trip_distance_edges = np.asarray(trip_distance_edges, dtype=np.float64)
+        self.trip_distance_counts = np.asarray(trip_distance_counts, dtype=np.int64)
+        self.prediction_edges = np.asarray(prediction_edges, dtype=np.float64)
+        self.prediction_counts = np.asarray(prediction_counts, dtype=np.int64)
+        self.top_pairs = np.asarray(top_pairs, dtype=np.int64)
+        self.pair_counts = np.asarray(pair_counts, dtype=np.int64)
+
+    @classmethod
+    def fit(
+        cls,
+        pu_location_ids,
+        do_location_ids,
+        trip_distances,
+        predictions,
+        num_bins=NUM_BINS,
+        top_k=TOP_K_PAIRS,
+    ):
+        trip_distances = np.asarray(trip_distances, dtype=np.float64)
+        predictions = np.asarray(predictions, dtype=np.float64)
+        trip_distance_edges = quantile_edges(trip_distances, num_bins)
+        prediction_edges = quantile_edges(predictions, num_bins)
+
+        pairs, counts = np.unique(
+            zone_pairs(pu_location_ids, do_location_ids), return_counts=True
+        )
+        top = np.sort(np.argsort(counts, kind="stable")[::-1][:top_k])
+        pair_counts = np.append(counts[top], counts.sum() - counts[top].sum())
+
+        return cls(
+            trip_distance_edges,
+            bin_counts(trip_distance_edges, trip_distances),
+            prediction_edges,
+            bin_counts(prediction_edges, predictions),
+            pairs[top],
+            pair_counts,
+        )
+
+    def pair_bins(self, pu_location_ids, do_location_ids):
+        """Index of every ride's zone pair in top_pairs, len(top_pairs) if other."""
+        pairs = zone_pairs(pu_location_ids, do_location_ids)
+        bins = np.searchsorted(self.top_pairs, pairs)
+        found = np.take(self.top_pairs, bins, mode="clip") == pairs
+        bins[~found] = len(self.top_pairs)
+        return bins
+
+    def save(self, path):
+        with open(path, "w") as f_out:
+            json.dump(
+                {name: value.tolist() for name, value in vars(self).items()}, f_out
+            )
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f_in:
+            return cls(**json.load(f_in))
+
+
+def print_metrics(metrics):
+    # one JSON line per window, picked up by CloudWatch Logs in Lambda
+    print(json.dumps(metrics))
+
+
+class DriftMonitor:
+    """Drift of the scored rides against a ReferenceSketch over tumbling windows.
+
+    A window only holds bin counts, so memory stays constant, and every
+    batch is a few vectorized searchsorted and bincount calls. A window is
+    closed, and its metrics emitted, by the first batch after its end, or
+    by close_overdue when no batch follows. close() emits the open window
+    at shutdown.
+    """
+
+    def __init__(
+        self,
+        reference,
+        window_seconds=WINDOW_SECONDS,
+        emit=print_metrics,
+        clock=time.time,
+    ):
+        self.reference = reference
+        self.window_seconds = window_seconds
+        self.emit = emit
+        self.clock = clock
+        self.window_start = None
+        # batches and the timer thread both close windows
+        self.lock = threading.RLock()
+        self.stopped = None
+        self.reset()
+
+    def reset(self):
+        self.n_events = 0
+        self.trip_distance_counts = np.zeros_like(self.reference.trip_distance_counts)
+        self.prediction_counts = np.zeros_like(self.reference.prediction_counts)
+        self.pair_counts = np.zeros_like(self.reference.pair_counts)
+
+    def observe_batch(self, rides, predictions):
+        n_rides = len(rides)
+        pu_location_ids = np.fromiter(
+            (ride["PULocationID"] for ride in rides), dtype=np.int64, count=n_rides
+        )
+        do_location_ids = np.fromiter(
+            (ride["DOLocationID"] for ride in rides), dtype=np.int64, count=n_rides
+        )
+        trip_distances = np.fromiter(
+            (ride["trip_distance"] for ride in rides), dtype=np.float64, count=n_rides
+        )
+
+        reference = self.reference
+        trip_distance_counts = bin_counts(reference.trip_distance_edges, trip_distances)
+        prediction_counts = bin_counts(
+            reference.prediction_edges, np.asarray(predictions, dtype=np.float64)
+        )
+        pair_counts = np.bincount(
+            reference.pair_bins(pu_location_ids, do_location_ids),
+            minlength=len(self.pair_counts),
+        )
+
+        with self.lock:
+            self.close_overdue()
+            if self.window_start is None:
+                now = self.clock()
+                self.window_start = now - now % self.window_seconds
+            self.trip_distance_counts += trip_distance_counts
+            self.prediction_counts += prediction_counts
+            self.pair_counts += pair_counts
+            self.n_events += n_rides
+
+    def close_overdue(self):
+        """Close the current window if its end has passed."""
+        with self.lock:
+            if (
+                self.window_start is not None
+                and self.clock() >= self.window_start + self.window_seconds
+            ):
+                self.close_window()
+                self.window_start = None
+
+    def start_timer(self, interval=None):
+        """Run close_overdue every interval seconds from a daemon thread.
+
+        An idle service then still emits its last window, at most interval,
+        a tenth of the window by default, after its end. A frozen Lambda
+        container runs no threads, its window is closed by the next batch
+        or by close() at shutdown.
+        """
+        self.stopped = threading.Event()
+        threading.Thread(
+            target=self.run_timer,
+            args=(interval or self.window_seconds / 10,),
+            daemon=True,
+        ).start()
+
+    def run_timer(self, interval):
+        while not self.stopped.wait(interval):
+            self.close_overdue()
+
+    def close(self):
+        """Stop the timer and emit the open window, even if it is not over."""
+        if self.stopped is not None:
+            self.stopped.set()
+        with self.lock:
+            if self.window_start is not None:
+                self.close_window()
+                self.window_start = None
+
+    def drift_scores(self):
+        reference = self.reference
+        return {
+            "trip_distance": jensenshannon(
+                reference.trip_distance_counts, self.trip_distance_counts
+            ),
+            "prediction": jensenshannon(
+                reference.prediction_counts, self.prediction_counts
+            ),
+            "PU_DO": jensenshannon(reference.pair_counts, self.pair_counts),
+        }
+
+    def close_window(self):
+        if self.n_events > 0:
+            drift_scores = self.drift_scores()
+            self.emit(
+                {
+                    "window_start": datetime.datetime.fromtimestamp(
+                        self.window_start, datetime.timezone.utc
+                    ).isoformat(),
+                    "n_events": self.n_events,
+                    "drift_scores": drift_scores,
+                    "num_drifted_columns": sum(
+                        score >= DRIFT_THRESHOLD for score in drift_scores.values()
+                    ),
+                }
+            )
+        self.reset()
+
+
+if __name__ == "__main__":
+    import pandas as pd
+
+    from model_bundle import ModelBundle
+
+    parser = argparse.ArgumentParser(
+        description="Build the reference sketch of the streaming drift monitor"
+    )
+    parser.add_argument("--model_bundle", type=str, default="model.bundle")
+    parser.add_argument(
+        "--reference_data", type=str, help="trip parquet the model was trained on"
+    )
+    parser.add_argument("--output_path", type=str, default="drift_reference.json")
+    parser.add_argument("--num_bins", type=int, default=NUM_BINS)
+    parser.add_argument("--top_k", type=int, default=TOP_K_PAIRS)
+    args = parser.parse_args()
+
+    df = pd.read_parquet(
+        args.reference_data, columns=["PULocationID", "DOLocationID", "trip_distance"]
+    ).dropna()
+    bundle = ModelBundle.load(args.model_bundle)
+    predictions = bundle.predict_columns(
+        bundle.encoder.lookup(df["PULocationID"], df["DOLocationID"]),
+        df["trip_distance"].to_numpy(),
+    )
+
+    ReferenceSketch.fit(
+        df["PULocationID"],
+        df["DOLocationID"],
+        df["trip_distance"],
+        predictions,
+        num_bins=args.num_bins,
+        top_k=args.top_k,
+    ).save(args.output_path)
+    print(f"Reference sketch of {len(df)} rides written to {args.output_path}")
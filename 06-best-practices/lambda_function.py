@@ -1,16 +1,48 @@
 import os
+import signal
+import sys
 
 import model
 
 RUN_ID = os.getenv("RUN_ID")
 PREDICTIONS_STREAM_NAME = os.getenv("PREDICTIONS_STREAM_NAME", "ride-predictions")
 TEST_RUN = os.getenv("TEST_RUN", False) == "True"
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "500"))
+BUFFERED_OUTPUT = os.getenv("BUFFERED_OUTPUT", "True") == "True"
+FAST_ENCODER = os.getenv("FAST_ENCODER", "True") == "True"
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "0"))
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", "0")) or None
+MODEL_BUNDLE = os.getenv("MODEL_BUNDLE")
+ARRAY_ENGINE = os.getenv("ARRAY_ENGINE", "True") == "True"
+DRIFT_REFERENCE = os.getenv("DRIFT_REFERENCE")
+DRIFT_WINDOW_SECONDS = float(os.getenv("DRIFT_WINDOW_SECONDS", "300"))
 
 
 model_service = model.init(
-    prediction_stream_name=PREDICTIONS_STREAM_NAME, run_id=RUN_ID, test_run=TEST_RUN
+    prediction_stream_name=PREDICTIONS_STREAM_NAME,
+    run_id=RUN_ID,
+    test_run=TEST_RUN,
+    max_batch_size=MAX_BATCH_SIZE,
+    buffered_output=BUFFERED_OUTPUT,
+    fast_encoder=FAST_ENCODER,
+    prediction_cache_size=PREDICTION_CACHE_SIZE,
+    prediction_cache_ttl=PREDICTION_CACHE_TTL,
+    model_bundle=MODEL_BUNDLE,
+    array_engine=ARRAY_ENGINE,
+    drift_reference=DRIFT_REFERENCE,
+    drift_window_seconds=DRIFT_WINDOW_SECONDS,
 )
 
 
+def shutdown(signum, frame):
+    # Lambda sends SIGTERM before it shuts down a container with an extension,
+    # exiting runs the atexit handlers that emit the last drift window
+    sys.exit(0)
+
+
+if DRIFT_REFERENCE:
+    signal.signal(signal.SIGTERM, shutdown)
+
+
 def lambda_handler(event, context):
     return model_service.lambda_handler(event)
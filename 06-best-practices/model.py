@@ -1,21 +1,70 @@
-import base64
-import json
+import atexit
+import time
 
-import boto3
-import mlflow
+from drift_monitor import DriftMonitor, ReferenceSketch
+from encoder import ZonePairEncoder
+from kinesis_codec import decode_data, decode_records, json_dumps
+from model_bundle import ModelBundle, can_bundle
+from model_cache import load_sklearn_model, model_cache
+from prediction_cache import PredictionCache, features_key, ride_key
+
+# Kinesis PutRecords limits: 500 records and 5 MiB per request
+PUT_RECORDS_MAX_COUNT = 500
+PUT_RECORDS_MAX_BYTES = 5 * 1024 * 1024
 
 
 def base64_decode(encoded_data):
-    decoded_data = base64.b64decode(encoded_data).decode("utf-8")
-    ride_event = json.loads(decoded_data)
+    ride_event = decode_data(encoded_data)
     return ride_event
 
 
+def chunk_records(
+    records, max_count=PUT_RECORDS_MAX_COUNT, max_bytes=PUT_RECORDS_MAX_BYTES
+):
+    chunk = []
+    chunk_bytes = 0
+    for record in records:
+        record_bytes = len(record["Data"]) + len(record["PartitionKey"])
+        if chunk and (
+            len(chunk) == max_count or chunk_bytes + record_bytes > max_bytes
+        ):
+            yield chunk
+            chunk = []
+            chunk_bytes = 0
+        chunk.append(record)
+        chunk_bytes += record_bytes
+    if chunk:
+        yield chunk
+
+
 class ModelService:
-    def __init__(self, model, model_version=None, callbacks=None):
+    def __init__(
+        self,
+        model,
+        model_version=None,
+        callbacks=None,
+        max_batch_size=None,
+        flush_callbacks=None,
+        encoder=None,
+        cache=None,
+        monitors=None,
+    ):
         self.model = model
         self.model_version = model_version
         self.callbacks = callbacks or []
+        self.max_batch_size = max_batch_size
+        self.flush_callbacks = flush_callbacks or []
+        self.encoder = encoder
+        self.cache = cache
+        # observe_batch(rides, predictions) of every batch, e.g. DriftMonitor
+        self.monitors = monitors or []
+
+    def update_model(self, model, model_version=None, encoder=None):
+        self.model = model
+        self.model_version = model_version
+        self.encoder = encoder
+        if self.cache is not None:
+            self.cache.set_model_version(model_version)
 
     def prepare_features(self, ride):
         features = {}
@@ -24,23 +73,67 @@ class ModelService:
         return features
 
     def predict(self, features):
+        if self.cache is not None:
+            key = features_key(features)
+            prediction = self.cache.get(key)
+            if prediction is not None:
+                return prediction
+
         pred = self.model.predict(features)
-        return float(pred[0])
+        prediction = float(pred[0])
 
-    def lambda_handler(self, event):
-        predictions_events = []
+        if self.cache is not None:
+            self.cache.put(key, prediction)
+        return prediction
+
+    def prepare_features_batch(self, rides):
+        if self.encoder is not None:
+            return self.encoder.transform_rides(rides)
+        return [self.prepare_features(ride) for ride in rides]
+
+    def predict_batch(self, rides):
+        if self.cache is None:
+            return self.score_batch(rides)
 
-        for record in event["Records"]:
-            encoded_data = record["kinesis"]["data"]
-            ride_event = base64_decode(encoded_data)
+        keys = [ride_key(ride) for ride in rides]
+        predictions = [self.cache.get(key) for key in keys]
 
-            # print(ride_event)
-            ride = ride_event["ride"]
-            ride_id = ride_event["ride_id"]
+        # only the rides without a cached prediction go to the model
+        missing = [i for i, prediction in enumerate(predictions) if prediction is None]
+        if missing:
+            scored = self.score_batch([rides[i] for i in missing])
+            for i, prediction in zip(missing, scored):
+                predictions[i] = prediction
+                self.cache.put(keys[i], prediction)
+        return predictions
 
-            features = self.prepare_features(ride)
-            prediction = self.predict(features)
+    def score_batch(self, rides):
+        batch_size = self.max_batch_size or max(len(rides), 1)
 
+        predictions = []
+        for start in range(0, len(rides), batch_size):
+            features_batch = self.prepare_features_batch(
+                rides[start : start + batch_size]
+            )
+            preds = self.model.predict(features_batch)
+            predictions.extend(float(pred) for pred in preds)
+        return predictions
+
+    def close(self):
+        for monitor in self.monitors:
+            monitor.close()
+
+    def lambda_handler(self, event):
+        # malformed records are reported back instead of failing the batch
+        rides, ride_ids, failures = decode_records(event["Records"])
+
+        predictions_events = []
+        predictions = self.predict_batch(rides)
+
+        for monitor in self.monitors:
+            monitor.observe_batch(rides, predictions)
+
+        for ride_id, prediction in zip(ride_ids, predictions):
             prediction_event = {
                 "model": "ride_duration_prediction_model",
                 "version": self.model_version,
@@ -52,39 +145,191 @@ class ModelService:
 
             predictions_events.append(prediction_event)
 
+        for flush in self.flush_callbacks:
+            flush()
+
         return {
             "predictions": predictions_events,
+            "batchItemFailures": failures,
         }
 
 
 def load_model(run_id: str):
-    logged_model = f"s3://taxi-mlops/1/{run_id}/artifacts/model"
-    model = mlflow.pyfunc.load_model(logged_model)
+    # mlflow is only needed, and only imported, for the pyfunc path
+    import mlflow.pyfunc
+
+    # downloaded once into the local model cache, loaded once per process
+    model = model_cache.load(run_id, mlflow.pyfunc.load_model)
     return model
 
 
+def load_model_with_encoder(run_id: str, array_engine: bool = False):
+    """Split the logged DictVectorizer pipeline into an encoder and estimator.
+
+    A vocabulary the encoder cannot produce keeps the whole pipeline, with
+    no encoder, like the pyfunc path.
+
+    With array_engine, forests and linear models are scored from their
+    ModelBundle arrays instead, with the same predictions and without the
+    per-call validation and thread dispatch of sklearn.
+    """
+    pipeline = model_cache.load(run_id, load_sklearn_model)
+
+    dv = pipeline.steps[0][1]
+    if len(pipeline.steps) != 2 or not hasattr(dv, "vocabulary_"):
+        raise ValueError(
+            f"Expected a DictVectorizer + estimator pipeline, got {pipeline.steps}"
+        )
+
+    try:
+        encoder = ZonePairEncoder.from_dict_vectorizer(dv)
+    except ValueError:
+        # features other than PU_DO and trip_distance, the pipeline
+        # vectorizes the prepare_features dicts itself
+        return pipeline, None
+
+    model = pipeline.steps[-1][1]
+    if array_engine and can_bundle(model):
+        bundle = ModelBundle.from_pipeline(pipeline)
+        return bundle, bundle.encoder
+    return model, encoder
+
+
 class KinesisCallback:
-    def __init__(self, kinesis_client, prediction_stream_name):
-        self.kinesis_client = kinesis_client
+    def __init__(
+        self,
+        kinesis_client,
+        prediction_stream_name,
+        buffered=False,
+        max_retries=3,
+        backoff_seconds=0.1,
+    ):
+        # None creates the boto3 client when the first record is sent
+        self._kinesis_client = kinesis_client
         self.prediction_stream_name = prediction_stream_name
+        self.buffered = buffered
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.buffer = []
+
+    @property
+    def kinesis_client(self):
+        if self._kinesis_client is None:
+            import boto3
+
+            self._kinesis_client = boto3.client("kinesis")
+        return self._kinesis_client
 
     def put_record(self, prediction_event):
         ride_id = prediction_event["prediction"]["ride_id"]
+        if self.buffered:
+            self.buffer.append(
+                {
+                    "Data": json_dumps(prediction_event),
+                    "PartitionKey": str(ride_id),
+                }
+            )
+            return
+
         self.kinesis_client.put_record(
             StreamName=self.prediction_stream_name,
-            Data=json.dumps(prediction_event),
+            Data=json_dumps(prediction_event),
             PartitionKey=str(ride_id),
         )
 
+    def flush(self):
+        records, self.buffer = self.buffer, []
+        for chunk in chunk_records(records):
+            self.put_records(chunk)
+
+    def put_records(self, records):
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                time.sleep(self.backoff_seconds * 2 ** (attempt - 1))
+
+            response = self.kinesis_client.put_records(
+                StreamName=self.prediction_stream_name,
+                Records=records,
+            )
+            if response["FailedRecordCount"] == 0:
+                return
 
-def init(prediction_stream_name: str, run_id: str, test_run: bool):
-    model = load_model(run_id)
+            # only the entries with an ErrorCode need to be sent again
+            records = [
+                record
+                for record, result in zip(records, response["Records"])
+                if "ErrorCode" in result
+            ]
+
+        raise RuntimeError(
+            f"Failed to put {len(records)} records to {self.prediction_stream_name} "
+            f"after {self.max_retries} retries"
+        )
+
+
+def init(
+    prediction_stream_name: str,
+    run_id: str,
+    test_run: bool,
+    max_batch_size: int = None,
+    buffered_output: bool = True,
+    fast_encoder: bool = True,
+    prediction_cache_size: int = 0,
+    prediction_cache_ttl: float = None,
+    model_bundle: str = None,
+    array_engine: bool = True,
+    drift_reference: str = None,
+    drift_window_seconds: float = 300,
+):
+    if model_bundle:
+        # exported with `python model_bundle.py`, needs neither sklearn nor mlflow
+        model = ModelBundle.load(model_bundle)
+        encoder = model.encoder
+    elif fast_encoder:
+        try:
+            model, encoder = load_model_with_encoder(run_id, array_engine=array_engine)
+        except ValueError:
+            # not a DictVectorizer + estimator pipeline, pyfunc scores it
+            model, encoder = load_model(run_id), None
+    else:
+        model, encoder = load_model(run_id), None
 
     callbacks = []
+    flush_callbacks = []
 
     if not test_run:
-        kinesis_client = boto3.client("kinesis")
-        kinesis_callback = KinesisCallback(kinesis_client, prediction_stream_name)
+        kinesis_callback = KinesisCallback(
+            None, prediction_stream_name, buffered=buffered_output
+        )
         callbacks.append(kinesis_callback.put_record)
-    model_service = ModelService(model)
+        flush_callbacks.append(kinesis_callback.flush)
+
+    cache = None
+    if prediction_cache_size > 0:
+        cache = PredictionCache(
+            prediction_cache_size, prediction_cache_ttl, model_version=run_id
+        )
+
+    monitors = []
+    if drift_reference:
+        # built with `python drift_monitor.py`
+        monitor = DriftMonitor(
+            ReferenceSketch.load(drift_reference),
+            window_seconds=drift_window_seconds,
+        )
+        monitor.start_timer()
+        monitors.append(monitor)
+
+    model_service = ModelService(
+        model,
+        callbacks=callbacks,
+        max_batch_size=max_batch_size,
+        flush_callbacks=flush_callbacks,
+        encoder=encoder,
+        cache=cache,
+        monitors=monitors,
+    )
+    if monitors:
+        # emits the last drift window when the process exits
+        atexit.register(model_service.close)
     return model_service
@@ -0,0 +1,527 @@
+import argparse
+import json
+import os
+import pickle
+from collections.abc import Mapping
+
+import numpy as np
+
+from encoder import ZonePairEncoder
+
+FORMAT_VERSION = 1
+
+# (row, tree) pairs walked at once, bounds the memory of large batches
+TRAVERSAL_CHUNK_PAIRS = 1 << 20
+# beyond this size, trees are walked for every ride instead
+TRIP_DISTANCE_TABLE_MAX_BYTES = 64 * 1024 * 1024
+
+# estimators that average their trees or are a dot product with coef_
+FOREST_ESTIMATORS = ["RandomForestRegressor", "ExtraTreesRegressor"]
+LINEAR_ESTIMATORS = ["LinearRegression", "Lasso", "Ridge"]
+
+# arrays of every model type, tree ensembles are flattened into global node
+# ids with -1 children marking the leaves
+MODEL_ARRAYS = {
+    "linear": ["coef"],
+    "random_forest": [
+        "feature",
+        "threshold",
+        "children_left",
+        "children_right",
+        "value",
+        "roots",
+    ],
+    "xgboost": [
+        "feature",
+        "threshold",
+        "children_left",
+        "children_right",
+        "default_left",
+        "value",
+        "roots",
+    ],
+}
+
+
+def flatten_forest(forest):
+    """Concatenate the node arrays of all sklearn trees."""
+    arrays = {name: [] for name in MODEL_ARRAYS["random_forest"]}
+
+    offset = 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        is_leaf = tree.children_left == -1
+
+        arrays["feature"].append(tree.feature.astype(np.int32))
+        arrays["threshold"].append(tree.threshold.astype(np.float64))
+        arrays["children_left"].append(
+            np.where(is_leaf, -1, tree.children_left + offset).astype(np.int32)
+        )
+        arrays["children_right"].append(
+            np.where(is_leaf, -1, tree.children_right + offset).astype(np.int32)
+        )
+        arrays["value"].append(tree.value[:, 0, 0].astype(np.float64))
+        arrays["roots"].append(np.array([offset], dtype=np.int32))
+        offset += tree.node_count
+
+    return {name: np.concatenate(parts) for name, parts in arrays.items()}
+
+
+def flatten_booster(booster):
+    """Concatenate the trees of an XGBoost booster from its JSON dump.
+
+    Returns the node arrays and the base score. Leaves keep their value in
+    `split_conditions`, like in the JSON model.
+    """
+    model = json.loads(booster.save_raw("json"))
+    learner = model["learner"]
+    base_score = float(learner["learner_model_param"]["base_score"].strip("[]"))
+
+    arrays = {name: [] for name in MODEL_ARRAYS["xgboost"]}
+    offset = 0
+    for tree in learner["gradient_booster"]["model"]["trees"]:
+        children_left = np.array(tree["left_children"], dtype=np.int32)
+        children_right = np.array(tree["right_children"], dtype=np.int32)
+        is_leaf = children_left == -1
+        split_conditions = np.array(tree["split_conditions"], dtype=np.float32)
+
+        arrays["feature"].append(
+            np.where(is_leaf, -2, tree["split_indices"]).astype(np.int32)
+        )
+        arrays["threshold"].append(np.where(is_leaf, 0, split_conditions))
+        arrays["children_left"].append(
+            np.where(is_leaf, -1, children_left + offset).astype(np.int32)
+        )
+        arrays["children_right"].append(
+            np.where(is_leaf, -1, children_right + offset).astype(np.int32)
+        )
+        arrays["default_left"].append(np.array(tree["default_left"], dtype=bool))
+        arrays["value"].append(np.where(is_leaf, split_conditions, 0))
+        arrays["roots"].append(np.array([offset], dtype=np.int32))
+        offset += len(children_left)
+
+    arrays = {name: np.concatenate(parts) for name, parts in arrays.items()}
+    arrays["threshold"] = arrays["threshold"].astype(np.float32)
+    arrays["value"] = arrays["value"].astype(np.float32)
+    return arrays, base_score
+
+
+def can_bundle(estimator):
+    name = type(estimator).__name__
+    return name in FOREST_ESTIMATORS or name in LINEAR_ESTIMATORS
+
+
+class ModelBundle:
+    """A trained model as plain numpy arrays, loaded without sklearn or mlflow.
+
+    A bundle is a directory with a `manifest.json` and one `.npy` file per
+    array, so it can be memory-mapped and shared between worker processes.
+    It supports the three models of the course: the DictVectorizer +
+    LinearRegression of `lin_reg.bin`, the DictVectorizer +
+    RandomForestRegressor pipeline and the XGBoost booster with its
+    `preprocessor.b` DictVectorizer. Predictions are the same as the
+    original model's.
+    """
+
+    def __init__(self, model_type, encoder, arrays, params=None):
+        if model_type not in MODEL_ARRAYS:
+            raise ValueError(f"Unknown model type {model_type}")
+        self.model_type = model_type
+        self.encoder = encoder
+        self.arrays = arrays
+        self.params = params or {}
+        for name in MODEL_ARRAYS[model_type]:
+            setattr(self, name, arrays[name])
+        if model_type != "linear":
+            self.compile_trees()
+
+    @classmethod
+    def from_linear(cls, dv, model):
+        arrays = {"coef": np.ravel(model.coef_).astype(np.float64)}
+        params = {"intercept": float(np.ravel(model.intercept_)[0])}
+        return cls("linear", ZonePairEncoder.from_dict_vectorizer(dv), arrays, params)
+
+    @classmethod
+    def from_forest(cls, dv, forest):
+        arrays = flatten_forest(forest)
+        return cls("random_forest", ZonePairEncoder.from_dict_vectorizer(dv), arrays)
+
+    @classmethod
+    def from_booster(cls, dv, booster):
+        arrays, base_score = flatten_booster(booster)
+        params = {"base_score": base_score}
+        return cls("xgboost", ZonePairEncoder.from_dict_vectorizer(dv), arrays, params)
+
+    @classmethod
+    def from_pipeline(cls, pipeline):
+        """Bundle a logged DictVectorizer + estimator sklearn pipeline."""
+        dv = pipeline.steps[0][1]
+        estimator = pipeline.steps[-1][1]
+        if not can_bundle(estimator):
+            raise ValueError(f"Cannot bundle {type(estimator).__name__}")
+        if type(estimator).__name__ in FOREST_ESTIMATORS:
+            return cls.from_forest(dv, estimator)
+        return cls.from_linear(dv, estimator)
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, "pu_do_columns.npy"), self.encoder.pu_do_columns)
+        for name in MODEL_ARRAYS[self.model_type]:
+            np.save(os.path.join(path, f"{name}.npy"), self.arrays[name])
+
+        manifest = {
+            "format_version": FORMAT_VERSION,
+            "model_type": self.model_type,
+            "trip_distance_column": int(self.encoder.trip_distance_column),
+            "n_features": int(self.encoder.n_features),
+            "sparse": bool(self.encoder.sparse),
+            "params": self.params,
+        }
+        with open(os.path.join(path, "manifest.json"), "w") as f_out:
+            json.dump(manifest, f_out)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        mmap_mode = "r" if mmap else None
+        with open(os.path.join(path, "manifest.json")) as f_in:
+            manifest = json.load(f_in)
+        if manifest["format_version"] != FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported bundle format version {manifest['format_version']}"
+            )
+
+        encoder = ZonePairEncoder(
+            pu_do_columns=np.load(
+                os.path.join(path, "pu_do_columns.npy"), mmap_mode=mmap_mode
+            ),
+            trip_distance_column=manifest["trip_distance_column"],
+            n_features=manifest["n_features"],
+            sparse=manifest["sparse"],
+        )
+        model_type = manifest["model_type"]
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in MODEL_ARRAYS[model_type]
+        }
+        return cls(model_type, encoder, arrays, manifest["params"])
+
+    def split_features(self, X):
+        """PU_DO column and trip_distance of every row of X.
+
+        X is what the original model takes: the DictVectorizer output (the
+        encoder's), or a feature dict or list of dicts.
+        """
+        if isinstance(X, Mapping):
+            X = [X]
+        if isinstance(X, list):
+            pu_location_ids = np.full(len(X), -1, dtype=np.int64)
+            do_location_ids = np.full(len(X), -1, dtype=np.int64)
+            for i, features in enumerate(X):
+                pu_id, _, do_id = str(features.get("PU_DO", "")).partition("_")
+                if pu_id.isdigit() and do_id.isdigit():
+                    pu_location_ids[i] = int(pu_id)
+                    do_location_ids[i] = int(do_id)
+            trip_distances = np.array(
+                [features.get("trip_distance", 0.0) for features in X],
+                dtype=np.float64,
+            )
+            pu_do_columns = self.encoder.lookup(pu_location_ids, do_location_ids)
+            return pu_do_columns, trip_distances
+
+        if hasattr(X, "tocsr"):
+            X = X.tocsr()
+            rows = np.repeat(np.arange(X.shape[0]), np.diff(X.indptr))
+            columns, values = X.indices, X.data
+        else:
+            X = np.asarray(X)
+            rows, columns = np.nonzero(X)
+            values = X[rows, columns]
+
+        is_trip_distance = columns == self.encoder.trip_distance_column
+        pu_do_columns = np.full(X.shape[0], -1, dtype=np.int32)
+        pu_do_columns[rows[~is_trip_distance]] = columns[~is_trip_distance]
+        trip_distances = np.zeros(X.shape[0], dtype=np.float64)
+        trip_distances[rows[is_trip_distance]] = values[is_trip_distance]
+        return pu_do_columns, trip_distances
+
+    def compile_trees(self):
+        """Lookup tables derived from the node arrays when the bundle is loaded.
+
+        - `children[2 * node + go_right]` is the next node, leaves point at
+          themselves so all pairs can be walked down `max_depth` levels
+        - a tree that does not split on the ride's own PU_DO column sees all
+          one-hot features as 0 and its leaf only depends on trip_distance:
+          `trip_distance_leaves[rank]` is that leaf for every tree, rank being
+          the position of trip_distance among the sorted `split_values`
+        - `split_columns` and `split_trees` list the (column, tree) pairs of
+          the one-hot splits, the only pairs that have to be walked
+        """
+        n_trees = len(self.roots)
+        trip_distance_column = self.encoder.trip_distance_column
+
+        is_leaf = self.children_left == -1
+        nodes = np.arange(len(is_leaf), dtype=np.int32)
+        self.children = np.stack(
+            [
+                np.where(is_leaf, nodes, self.children_left),
+                np.where(is_leaf, nodes, self.children_right),
+            ],
+            axis=1,
+        ).ravel()
+
+        self.max_depth = 0
+        level = np.asarray(self.roots)
+        while True:
+            level = level[~is_leaf[level]]
+            if len(level) == 0:
+                break
+            level = np.concatenate(
+                [self.children_left[level], self.children_right[level]]
+            )
+            self.max_depth += 1
+
+        tree_of_node = np.repeat(
+            np.arange(n_trees), np.diff(np.append(self.roots, len(self.feature)))
+        )
+        is_one_hot = (self.feature >= 0) & (self.feature != trip_distance_column)
+        pairs = np.unique(
+            self.feature[is_one_hot].astype(np.int64) * n_trees
+            + tree_of_node[is_one_hot]
+        )
+        self.split_columns = pairs // n_trees
+        self.split_trees = pairs % n_trees
+
+        self.split_values = np.unique(
+            self.threshold[self.feature == trip_distance_column]
+        )
+        self.trip_distance_leaves = None
+        n_ranks = len(self.split_values) + 1
+        if n_ranks * n_trees * 4 > TRIP_DISTANCE_TABLE_MAX_BYTES:
+            return
+
+        # one trip_distance per rank, behaving like every value of that rank
+        if self.model_type == "xgboost":
+            values = np.concatenate([[-np.inf], self.split_values])
+        else:
+            values = np.concatenate([self.split_values, [np.inf]])
+        self.trip_distance_leaves = self.walk(
+            np.tile(self.roots, n_ranks),
+            np.full(n_ranks * n_trees, -1),
+            np.repeat(values, n_trees),
+        ).reshape(n_ranks, n_trees)
+
+    def walk(self, node, pu_do_columns, trip_distances):
+        """Leaf reached from every node, given one ride per node."""
+        if len(node) > TRAVERSAL_CHUNK_PAIRS:
+            return np.concatenate(
+                [
+                    self.walk(
+                        node[start : start + TRAVERSAL_CHUNK_PAIRS],
+                        pu_do_columns[start : start + TRAVERSAL_CHUNK_PAIRS],
+                        trip_distances[start : start + TRAVERSAL_CHUNK_PAIRS],
+                    )
+                    for start in range(0, len(node), TRAVERSAL_CHUNK_PAIRS)
+                ]
+            )
+
+        for _ in range(self.max_depth):
+            # a row only has the PU_DO one-hot and trip_distance set
+            feature = self.feature[node]
+            is_pu_do = feature == pu_do_columns
+            is_trip_distance = feature == self.encoder.trip_distance_column
+            x = np.where(is_trip_distance, trip_distances, is_pu_do)
+
+            if self.model_type == "xgboost":
+                # the other one-hot columns are missing in the sparse DMatrix
+                present = (is_pu_do | is_trip_distance) & ~np.isnan(x)
+                go_left = np.where(
+                    present, x < self.threshold[node], self.default_left[node]
+                )
+            else:
+                go_left = x <= self.threshold[node]
+
+            node = self.children[2 * node + ~go_left]
+        return node
+
+    def leaves(self, pu_do_columns, trip_distances):
+        """Leaf reached in every tree, shape (n_rows, n_trees)."""
+        n_rows = len(pu_do_columns)
+        n_trees = len(self.roots)
+        pu_do_columns = np.asarray(pu_do_columns)
+        # both libraries compare float32 inputs against the thresholds
+        trip_distances = np.asarray(trip_distances, dtype=np.float32)
+
+        if self.trip_distance_leaves is None:
+            rows = np.repeat(np.arange(n_rows), n_trees)
+            node = self.walk(
+                np.tile(self.roots, n_rows),
+                pu_do_columns[rows],
+                trip_distances[rows],
+            )
+            return node.reshape(n_rows, n_trees)
+
+        # XGBoost goes left below the threshold, sklearn up to and including it
+        side = "right" if self.model_type == "xgboost" else "left"
+        ranks = np.searchsorted(self.split_values, trip_distances, side=side)
+        leaves = self.trip_distance_leaves[ranks]
+
+        # walk the trees that split on the ride's PU_DO column
+        start = np.searchsorted(self.split_columns, pu_do_columns, side="left")
+        counts = np.searchsorted(self.split_columns, pu_do_columns, side="right")
+        counts -= start
+        rows = np.repeat(np.arange(n_rows), counts)
+        offsets = np.repeat(start - np.cumsum(counts) + counts, counts)
+        trees = self.split_trees[np.arange(len(rows)) + offsets]
+
+        if self.model_type == "xgboost":
+            # a missing trip_distance takes the default branches, walk it all
+            missing = np.flatnonzero(np.isnan(trip_distances))
+            rows = np.concatenate([rows, np.repeat(missing, n_trees)])
+            trees = np.concatenate([trees, np.tile(np.arange(n_trees), len(missing))])
+
+        if len(rows) > 0:
+            leaves[rows, trees] = self.walk(
+                self.roots[trees], pu_do_columns[rows], trip_distances[rows]
+            )
+        return leaves
+
+    def predict_columns(self, pu_do_columns, trip_distances):
+        if self.model_type == "linear":
+            trip_distances = np.asarray(trip_distances, dtype=np.float64)
+            pu_do_coef = np.where(
+                pu_do_columns >= 0, self.coef[np.maximum(pu_do_columns, 0)], 0.0
+            )
+            slope = 0.0
+            if self.encoder.trip_distance_column >= 0:
+                slope = self.coef[self.encoder.trip_distance_column]
+            # same summation order as the sparse dot product in LinearRegression
+            return pu_do_coef + slope * trip_distances + self.params["intercept"]
+
+        leaf_values = self.value[self.leaves(pu_do_columns, trip_distances)]
+
+        if self.model_type == "xgboost":
+            # XGBoost adds the trees up in float32, starting from the base score
+            total = np.full(
+                len(leaf_values), self.params["base_score"], dtype=np.float32
+            )
+            for tree_values in leaf_values.T:
+                total += tree_values
+            return total
+
+        # add the trees up one by one, in the same order as sklearn
+        total = np.zeros(len(leaf_values), dtype=np.float64)
+        for tree_values in leaf_values.T:
+            total += tree_values
+        return total / len(self.roots)
+
+    def predict(self, X):
+        return self.predict_columns(*self.split_features(X))
+
+    def predict_rides(self, rides):
+        n_rides = len(rides)
+        pu_location_ids = np.fromiter(
+            (ride["PULocationID"] for ride in rides), dtype=np.int64, count=n_rides
+        )
+        do_location_ids = np.fromiter(
+            (ride["DOLocationID"] for ride in rides), dtype=np.int64, count=n_rides
+        )
+        trip_distances = np.fromiter(
+            (ride["trip_distance"] for ride in rides), dtype=np.float64, count=n_rides
+        )
+        pu_do_columns = self.encoder.lookup(pu_location_ids, do_location_ids)
+        return self.predict_columns(pu_do_columns, trip_distances)
+
+    def predict_ride(self, ride):
+        return float(self.predict_rides([ride])[0])
+
+
+def load_run(run_id, flavor):
+    """The logged model of run_id and a function scoring a list of rides."""
+    import mlflow
+
+    artifact_uri = f"s3://taxi-mlops/1/{run_id}/artifacts"
+
+    if flavor == "xgboost":
+        import xgboost as xgb
+
+        booster = mlflow.xgboost.load_model(f"{artifact_uri}/models_mlflow")
+        preprocessor_path = mlflow.artifacts.download_artifacts(
+            f"{artifact_uri}/preprocessor/preprocessor.b"
+        )
+        with open(preprocessor_path, "rb") as f_in:
+            dv = pickle.load(f_in)
+
+        def predict(rides):
+            X = dv.transform([prepare_features(ride) for ride in rides])
+            return booster.predict(xgb.DMatrix(X))
+
+        return ModelBundle.from_booster(dv, booster), predict
+
+    pipeline = mlflow.sklearn.load_model(f"{artifact_uri}/model")
+
+    def predict(rides):
+        return pipeline.predict([prepare_features(ride) for ride in rides])
+
+    return ModelBundle.from_pipeline(pipeline), predict
+
+
+def prepare_features(ride):
+    return {
+        "PU_DO": f"{ride['PULocationID']}_{ride['DOLocationID']}",
+        "trip_distance": ride["trip_distance"],
+    }
+
+
+def read_reference_rides(path):
+    import pandas as pd
+
+    df = pd.read_parquet(
+        path, columns=["PULocationID", "DOLocationID", "trip_distance"]
+    )
+    return df.dropna().to_dict(orient="records")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export a trained model as a dependency-free ModelBundle"
+    )
+    parser.add_argument("--run_id", type=str, help="MLflow run id for model in S3")
+    parser.add_argument(
+        "--flavor",
+        choices=["sklearn", "xgboost"],
+        default="sklearn",
+        help="sklearn pipeline under model/, or booster + preprocessor.b",
+    )
+    parser.add_argument(
+        "--lin_reg", type=str, help="pickled (dv, model) pair, e.g. lin_reg.bin"
+    )
+    parser.add_argument("--output_path", type=str, default="model.bundle")
+    parser.add_argument(
+        "--reference_data",
+        type=str,
+        help="trip parquet whose predictions must match the original model",
+    )
+    parser.add_argument("--tolerance", type=float, default=1e-5)
+    args = parser.parse_args()
+
+    if args.lin_reg:
+        with open(args.lin_reg, "rb") as f_in:
+            dv, model = pickle.load(f_in)
+        bundle = ModelBundle.from_linear(dv, model)
+
+        def original_predict(rides):
+            return model.predict(dv.transform([prepare_features(r) for r in rides]))
+
+    else:
+        bundle, original_predict = load_run(args.run_id, args.flavor)
+
+    bundle.save(args.output_path)
+
+    if args.reference_data:
+        rides = read_reference_rides(args.reference_data)
+        expected = np.asarray(original_predict(rides), dtype=np.float64)
+        actual = ModelBundle.load(args.output_path).predict_rides(rides)
+        max_diff = float(np.max(np.abs(actual - expected), initial=0.0))
+        print(f"{len(rides)} reference rides, max abs difference {max_diff:.3g}")
+        if max_diff > args.tolerance:
+            raise SystemExit(f"Bundle differs from the original by {max_diff}")
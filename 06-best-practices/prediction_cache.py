@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+def ride_key(ride, distance_precision=2):
+    """Normalized (PULocationID, DOLocationID, trip_distance bucket) tuple.
+
+    Rides that fall in the same trip_distance bucket share one cached
+    prediction; the taxi data itself has two decimals.
+    """
+    return (
+        int(ride["PULocationID"]),
+        int(ride["DOLocationID"]),
+        round(float(ride["trip_distance"]), distance_precision),
+    )
+
+
+def features_key(features, distance_precision=2):
+    """ride_key of an already prepared {"PU_DO", "trip_distance"}.
+
+    The same ride gets the same key whether it is predicted on its own or
+    in a batch, so both share one cached prediction.
+    """
+    pu_location_id, _, do_location_id = features["PU_DO"].partition("_")
+    ride = {
+        "PULocationID": float(pu_location_id),
+        "DOLocationID": float(do_location_id),
+        "trip_distance": features["trip_distance"],
+    }
+    return ride_key(ride, distance_precision)
+
+
+class PredictionCache:
+    """Thread-safe LRU cache of predictions with an optional TTL.
+
+    Entries belong to one model version, switching to another version
+    empties the cache.
+    """
+
+    def __init__(self, max_size=10000, ttl_seconds=None, model_version=None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.model_version = model_version
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                prediction, expires_at = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return prediction
+                del self.entries[key]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, prediction):
+        expires_at = None
+        if self.ttl_seconds is not None:
+            expires_at = time.monotonic() + self.ttl_seconds
+
+        with self.lock:
+            self.entries[key] = (prediction, expires_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def set_model_version(self, model_version):
+        with self.lock:
+            if model_version != self.model_version:
+                self.entries.clear()
+                self.model_version = model_version
+
+    def stats(self):
+        with self.lock:
+            return {
+                "model_version": self.model_version,
+                "size": len(self.entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
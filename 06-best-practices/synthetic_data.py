@@ -0,0 +1,432 @@
+"""Synthetic green taxi trips and Kinesis ride events, for offline scale tests.
+
+The trips have the schema of the NYC TLC green taxi parquet files, so
+`score.py`, `orchestrate.py`, `preprocess_data.py` and the monitoring
+scripts read them unchanged. Zones have fixed coordinates and a skewed
+popularity, most trips stay close to their pickup zone, and durations
+follow the distance and the time of day. Files are written one chunk at
+a time, so a billion rows take no more memory than one chunk.
+
+    python synthetic_data.py trips --year 2022 --month 2 --n_rows 1000000
+    python synthetic_data.py kinesis --n_rides 10000 --output_path events.jsonl
+"""
+
+import argparse
+import base64
+import calendar
+import json
+import os
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+NUM_ZONES = 265
+CHUNK_SIZE = 1_000_000
+
+GREEN_TAXI_SCHEMA = pa.schema(
+    [
+        ("VendorID", pa.int64()),
+        ("lpep_pickup_datetime", pa.timestamp("us")),
+        ("lpep_dropoff_datetime", pa.timestamp("us")),
+        ("store_and_fwd_flag", pa.string()),
+        ("RatecodeID", pa.float64()),
+        ("PULocationID", pa.int64()),
+        ("DOLocationID", pa.int64()),
+        ("passenger_count", pa.float64()),
+        ("trip_distance", pa.float64()),
+        ("fare_amount", pa.float64()),
+        ("extra", pa.float64()),
+        ("mta_tax", pa.float64()),
+        ("tip_amount", pa.float64()),
+        ("tolls_amount", pa.float64()),
+        ("ehail_fee", pa.float64()),
+        ("improvement_surcharge", pa.float64()),
+        ("total_amount", pa.float64()),
+        ("payment_type", pa.float64()),
+        ("trip_type", pa.float64()),
+        ("congestion_surcharge", pa.float64()),
+    ]
+)
+
+# relative number of pickups per hour of the day
+HOURLY_PICKUPS = np.array(
+    [3, 2, 1, 1, 1, 2, 4, 7, 9, 8, 7, 7, 7, 7, 8, 9, 10, 10, 9, 8, 7, 6, 5, 4],
+    dtype=np.float64,
+)
+# average speed in mph per hour of the day, slow at rush hours
+HOURLY_SPEED = np.array(
+    [18, 19, 20, 20, 19, 17, 14, 10, 8, 9, 11, 11]
+    + [11, 11, 10, 9, 8, 8, 9, 11, 13, 15, 16, 17],
+    dtype=np.float64,
+)
+# share of trips with the passenger_count, RatecodeID, payment_type,
+# trip_type and congestion_surcharge columns missing, like street hails
+# recorded without the meter details
+MISSING_SHARE = 0.05
+
+
+class ZoneModel:
+    """Pickup and dropoff zone distribution of a synthetic city.
+
+    Zone popularity is Zipf-distributed, the dropoff zone is drawn from the
+    popular zones near the pickup zone. `drift` moves part of the
+    popularity to other zones and makes trips longer and slower.
+    """
+
+    def __init__(self, seed=42, drift=0.0, zipf_exponent=1.1, trip_scale_miles=1.5):
+        rng = np.random.default_rng(seed)
+        # zones on a 20 x 10 mile area
+        self.coordinates = rng.uniform((0, 0), (20, 10), size=(NUM_ZONES, 2))
+
+        popularity = 1.0 / np.arange(1, NUM_ZONES + 1) ** zipf_exponent
+        popularity = popularity[rng.permutation(NUM_ZONES)]
+        if drift > 0:
+            shifted = popularity[rng.permutation(NUM_ZONES)]
+            popularity = (1 - drift) * popularity + drift * shifted
+        self.pickup_probability = popularity / popularity.sum()
+
+        self.distances = np.linalg.norm(
+            self.coordinates[:, None, :] - self.coordinates[None, :, :], axis=2
+        )
+        dropoff_weights = popularity[None, :] * np.exp(
+            -self.distances / trip_scale_miles
+        )
+        dropoff_cdf = np.cumsum(dropoff_weights, axis=1)
+        dropoff_cdf /= dropoff_cdf[:, -1:]
+        # row i spans [i, i + 1], so one searchsorted samples every row
+        self.dropoff_cdf = (dropoff_cdf + np.arange(NUM_ZONES)[:, None]).ravel()
+
+        self.distance_scale = 1.0 + drift
+        self.speed_scale = 1.0 - drift / 2
+
+    def sample_zones(self, rng, n_rows):
+        """0-based pickup and dropoff zone indexes."""
+        pickup = rng.choice(NUM_ZONES, size=n_rows, p=self.pickup_probability)
+        u = rng.random(n_rows)
+        dropoff = np.searchsorted(self.dropoff_cdf, pickup + u, side="right")
+        dropoff = np.minimum(dropoff - pickup * NUM_ZONES, NUM_ZONES - 1)
+        return pickup, dropoff
+
+    def sample_distances(self, rng, pickup, dropoff):
+        # streets are longer than the straight line, same-zone trips are short
+        distance = self.distances[pickup, dropoff] * 1.3
+        same_zone = pickup == dropoff
+        distance[same_zone] = rng.uniform(0.3, 1.5, same_zone.sum())
+        distance *= rng.lognormal(0.0, 0.25, len(distance)) * self.distance_scale
+        return distance.round(2)
+
+
+def pickup_seconds(rng, n_rows, days, start_share, end_share):
+    """Sorted pickup times in seconds from the start of the month.
+
+    The times follow HOURLY_PICKUPS and only cover the [start_share,
+    end_share) part of all the pickups of the month, so consecutive chunks
+    are sorted among themselves too.
+    """
+    weights = np.tile(HOURLY_PICKUPS, days)
+    cdf = np.cumsum(weights) / weights.sum()
+    u = np.sort(rng.uniform(start_share, end_share, n_rows))
+    hour = np.minimum(np.searchsorted(cdf, u, side="right"), len(cdf) - 1)
+    hour_start = np.concatenate([[0.0], cdf])[hour]
+    within_hour = (u - hour_start) / (cdf[hour] - hour_start)
+    return (hour * 3600 + np.clip(within_hour, 0, 1) * 3599).astype(np.int64)
+
+
+def generate_chunk(
+    rng,
+    n_rows,
+    year,
+    month,
+    start_share,
+    end_share,
+    zone_model,
+    drifted_model=None,
+    drift_start_day=None,
+):
+    """One pyarrow table of trips, see pickup_seconds for the shares."""
+    days = calendar.monthrange(year, month)[1]
+    seconds = pickup_seconds(rng, n_rows, days, start_share, end_share)
+    hour = (seconds // 3600) % 24
+
+    pickup, dropoff = zone_model.sample_zones(rng, n_rows)
+    trip_distance = zone_model.sample_distances(rng, pickup, dropoff)
+    speed = HOURLY_SPEED[hour] * zone_model.speed_scale
+
+    if drifted_model is not None:
+        drifted = seconds >= drift_start_day * 86400
+        n_drifted = int(drifted.sum())
+        pickup[drifted], dropoff[drifted] = drifted_model.sample_zones(rng, n_drifted)
+        trip_distance[drifted] = drifted_model.sample_distances(
+            rng, pickup[drifted], dropoff[drifted]
+        )
+        speed[drifted] = HOURLY_SPEED[hour[drifted]] * drifted_model.speed_scale
+
+    duration = trip_distance / (speed * rng.lognormal(0.0, 0.3, n_rows)) * 3600
+    duration += rng.gamma(2.0, 30.0, n_rows)
+    # meter glitches and forgotten meters, filtered out by the pipelines
+    outlier = rng.random(n_rows)
+    duration[outlier < 0.01] = rng.uniform(0, 60, (outlier < 0.01).sum())
+    duration[outlier > 0.99] = rng.uniform(3600, 5 * 3600, (outlier > 0.99).sum())
+    duration = duration.astype(np.int64)
+
+    missing = rng.random(n_rows) < MISSING_SHARE
+    payment_type = rng.choice([1.0, 2.0, 3.0, 4.0], n_rows, p=[0.6, 0.37, 0.02, 0.01])
+    fare_amount = (2.5 + 2.5 * trip_distance + 0.5 * duration / 60).round(2)
+    extra = np.where((hour >= 16) & (hour < 20), 1.0, np.where(hour >= 20, 0.5, 0.0))
+    mta_tax = np.full(n_rows, 0.5)
+    tip_amount = np.where(
+        payment_type == 1.0, fare_amount * rng.uniform(0.1, 0.25, n_rows), 0.0
+    ).round(2)
+    tolls_amount = np.where(rng.random(n_rows) < 0.03, 6.55, 0.0)
+    improvement_surcharge = np.full(n_rows, 0.3)
+    congestion_surcharge = np.where(rng.random(n_rows) < 0.15, 2.75, 0.0)
+    total_amount = (
+        fare_amount
+        + extra
+        + mta_tax
+        + tip_amount
+        + tolls_amount
+        + improvement_surcharge
+        + np.where(missing, 0.0, congestion_surcharge)
+    ).round(2)
+
+    month_start = np.datetime64(f"{year:04d}-{month:02d}-01T00:00:00", "us")
+    pickup_datetime = month_start + seconds.astype("timedelta64[s]")
+    dropoff_datetime = pickup_datetime + duration.astype("timedelta64[s]")
+
+    columns = {
+        "VendorID": rng.choice([1, 2], n_rows, p=[0.15, 0.85]),
+        "lpep_pickup_datetime": pickup_datetime,
+        "lpep_dropoff_datetime": dropoff_datetime,
+        "store_and_fwd_flag": pa.array(
+            np.where(rng.random(n_rows) < 0.005, "Y", "N"), mask=missing
+        ),
+        "RatecodeID": pa.array(
+            rng.choice([1.0, 5.0, 2.0], n_rows, p=[0.97, 0.02, 0.01]), mask=missing
+        ),
+        "PULocationID": pickup + 1,
+        "DOLocationID": dropoff + 1,
+        "passenger_count": pa.array(
+            rng.choice(
+                [1.0, 2.0, 3.0, 5.0, 0.0], n_rows, p=[0.85, 0.08, 0.03, 0.03, 0.01]
+            ),
+            mask=missing,
+        ),
+        "trip_distance": trip_distance,
+        "fare_amount": fare_amount,
+        "extra": extra,
+        "mta_tax": mta_tax,
+        "tip_amount": tip_amount,
+        "tolls_amount": tolls_amount,
+        "ehail_fee": pa.nulls(n_rows, pa.float64()),
+        "improvement_surcharge": improvement_surcharge,
+        "total_amount": total_amount,
+        "payment_type": pa.array(payment_type, mask=missing),
+        "trip_type": pa.array(
+            rng.choice([1.0, 2.0], n_rows, p=[0.97, 0.03]), mask=missing
+        ),
+        "congestion_surcharge": pa.array(congestion_surcharge, mask=missing),
+    }
+    return pa.table(columns, schema=GREEN_TAXI_SCHEMA)
+
+
+def generate_trips(
+    n_rows,
+    year=2022,
+    month=1,
+    seed=42,
+    chunk_size=CHUNK_SIZE,
+    drift=0.0,
+    drift_start_day=None,
+):
+    """Yield the trips of a month as pyarrow tables of at most chunk_size rows.
+
+    With drift, the trips picked up from `drift_start_day` (0-based day of
+    the month, the whole month when None) come from a drifted ZoneModel.
+    """
+    zone_model = ZoneModel(seed=seed)
+    drifted_model = None
+    if drift > 0:
+        drifted_model = ZoneModel(seed=seed, drift=drift)
+        drift_start_day = drift_start_day or 0
+
+    n_chunks = max(-(-n_rows // chunk_size), 1)
+    for chunk in range(n_chunks):
+        start = n_rows * chunk // n_chunks
+        end = n_rows * (chunk + 1) // n_chunks
+        rng = np.random.default_rng([seed, chunk])
+        yield generate_chunk(
+            rng,
+            end - start,
+            year,
+            month,
+            chunk / n_chunks,
+            (chunk + 1) / n_chunks,
+            zone_model,
+            drifted_model,
+            drift_start_day,
+        )
+
+
+def write_trips(output_path, n_rows, **kwargs):
+    """Write generate_trips to one parquet file, one row group per chunk."""
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with pq.ParquetWriter(output_path, GREEN_TAXI_SCHEMA) as writer:
+        for table in generate_trips(n_rows, **kwargs):
+            writer.write_table(table)
+
+
+def generate_rides(n_rides, seed=42, drift=0.0):
+    """Ride dicts as sent by the backend to the ride_events stream."""
+    rng = np.random.default_rng(seed)
+    zone_model = ZoneModel(seed=seed, drift=drift)
+    pickup, dropoff = zone_model.sample_zones(rng, n_rides)
+    trip_distance = zone_model.sample_distances(rng, pickup, dropoff)
+    return [
+        {
+            "PULocationID": int(pu_location_id),
+            "DOLocationID": int(do_location_id),
+            "trip_distance": float(distance),
+        }
+        for pu_location_id, do_location_id, distance in zip(
+            pickup + 1, dropoff + 1, trip_distance
+        )
+    ]
+
+
+def ride_features(rides):
+    """The DictVectorizer feature dicts of the rides, as in training."""
+    return [
+        {
+            "PU_DO": f"{ride['PULocationID']}_{ride['DOLocationID']}",
+            "trip_distance": ride["trip_distance"],
+        }
+        for ride in rides
+    ]
+
+
+def ride_durations(rides, seed=42):
+    """A duration target for rides, to train models of a realistic shape."""
+    rng = np.random.default_rng(seed)
+    return np.array(
+        [
+            ride["trip_distance"] * 4 + ride["PULocationID"] % 7 + rng.normal()
+            for ride in rides
+        ]
+    )
+
+
+def kinesis_record(data, partition_key, sequence_number, arrival_timestamp):
+    return {
+        "kinesis": {
+            "kinesisSchemaVersion": "1.0",
+            "partitionKey": partition_key,
+            "sequenceNumber": str(sequence_number),
+            "data": base64.b64encode(data).decode("utf-8"),
+            "approximateArrivalTimestamp": arrival_timestamp,
+        },
+        "eventSource": "aws:kinesis",
+        "eventVersion": "1.0",
+        "eventID": f"shardId-000000000000:{sequence_number}",
+        "eventName": "aws:kinesis:record",
+        "awsRegion": "eu-west-1",
+        "eventSourceARN": "arn:aws:kinesis:eu-west-1:000000000000:stream/ride_events",
+    }
+
+
+def kinesis_event(rides, first_ride_id=0, malformed_share=0.0, seed=42):
+    """Lambda event of one ride_events record per ride.
+
+    A malformed_share of the records carries truncated JSON, like a poison
+    record from a broken producer.
+    """
+    rng = np.random.default_rng([seed, first_ride_id])
+    malformed = rng.random(len(rides)) < malformed_share
+
+    records = []
+    for i, ride in enumerate(rides):
+        ride_id = first_ride_id + i
+        data = json.dumps({"ride": ride, "ride_id": ride_id}).encode("utf-8")
+        if malformed[i]:
+            data = data[: len(data) // 2]
+        records.append(
+            kinesis_record(data, str(ride_id), 10**20 + ride_id, 1654161514.132)
+        )
+    return {"Records": records}
+
+
+def generate_kinesis_events(
+    n_rides, batch_size=100, malformed_share=0.0, seed=42, drift=0.0
+):
+    """Yield Lambda events of batch_size records, the Kinesis trigger default."""
+    rides = generate_rides(n_rides, seed=seed, drift=drift)
+    for start in range(0, n_rides, batch_size):
+        yield kinesis_event(
+            rides[start : start + batch_size],
+            first_ride_id=start,
+            malformed_share=malformed_share,
+            seed=seed,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument(
+        "--drift",
+        type=float,
+        default=0.0,
+        help="0 for none up to 1, shifts zone popularity, distances and speeds",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    trips_parser = subparsers.add_parser("trips", help="green taxi parquet file")
+    trips_parser.add_argument("--year", type=int, default=2022)
+    trips_parser.add_argument("--month", type=int, default=1)
+    trips_parser.add_argument("--n_rows", type=int, default=CHUNK_SIZE)
+    trips_parser.add_argument("--chunk_size", type=int, default=CHUNK_SIZE)
+    trips_parser.add_argument(
+        "--drift_start_day",
+        type=float,
+        help="0-based day of the month the drift starts, the whole month when empty",
+    )
+    trips_parser.add_argument(
+        "--output_path", type=str, help="data/green_tripdata_YYYY-MM.parquet by default"
+    )
+
+    kinesis_parser = subparsers.add_parser(
+        "kinesis", help="newline-delimited Lambda events for the streaming handler"
+    )
+    kinesis_parser.add_argument("--n_rides", type=int, default=10_000)
+    kinesis_parser.add_argument("--batch_size", type=int, default=100)
+    kinesis_parser.add_argument("--malformed_share", type=float, default=0.0)
+    kinesis_parser.add_argument("--output_path", type=str, default="events.jsonl")
+
+    args = parser.parse_args()
+
+    if args.command == "trips":
+        output_path = (
+            args.output_path
+            or f"data/green_tripdata_{args.year:04d}-{args.month:02d}.parquet"
+        )
+        write_trips(
+            output_path,
+            args.n_rows,
+            year=args.year,
+            month=args.month,
+            seed=args.seed,
+            chunk_size=args.chunk_size,
+            drift=args.drift,
+            drift_start_day=args.drift_start_day,
+        )
+    else:
+        with open(args.output_path, "w") as f_out:
+            for event in generate_kinesis_events(
+                args.n_rides,
+                batch_size=args.batch_size,
+                malformed_share=args.malformed_share,
+                seed=args.seed,
+                drift=args.drift,
+            ):
+                f_out.write(json.dumps(event) + "\n")
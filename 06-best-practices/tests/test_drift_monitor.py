@@ -0,0 +1,150 @@
+import json
+import threading
+
+import numpy as np
+from scipy.spatial import distance
+
+import model
+import synthetic_data
+from drift_monitor import DriftMonitor, ReferenceSketch, jensenshannon
+
+
+class ModelMock:
+    def predict(self, X):
+        return [10.0] * len(X)
+
+
+class Clock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def fit_sketch(rides, top_k=50):
+    return ReferenceSketch.fit(
+        [ride["PULocationID"] for ride in rides],
+        [ride["DOLocationID"] for ride in rides],
+        [ride["trip_distance"] for ride in rides],
+        [ride["trip_distance"] * 4 for ride in rides],
+        top_k=top_k,
+    )
+
+
+def test_jensenshannon_matches_scipy():
+    p = np.array([10, 0, 5, 85])
+    q = np.array([3, 7, 0, 90])
+    assert np.isclose(jensenshannon(p, q), distance.jensenshannon(p, q))
+
+
+def test_reference_sketch_round_trip(tmp_path):
+    rides = synthetic_data.generate_rides(5000)
+    sketch = fit_sketch(rides)
+    assert sketch.pair_counts.sum() == len(rides)
+    assert len(sketch.top_pairs) == 50
+
+    sketch.save(str(tmp_path / "drift_reference.json"))
+    loaded = ReferenceSketch.load(str(tmp_path / "drift_reference.json"))
+    for name, value in vars(sketch).items():
+        np.testing.assert_array_equal(getattr(loaded, name), value)
+
+
+def test_tumbling_windows_detect_drift():
+    rides = synthetic_data.generate_rides(25_000)
+    sketch = fit_sketch(rides[:20_000])
+    windows = []
+    clock = Clock()
+    monitor = DriftMonitor(sketch, window_seconds=60, emit=windows.append, clock=clock)
+
+    for window_rides in [
+        rides[20_000:],
+        synthetic_data.generate_rides(5000, drift=1.0),
+    ]:
+        for start in range(0, len(window_rides), 500):
+            batch = window_rides[start : start + 500]
+            monitor.observe_batch(batch, [ride["trip_distance"] * 4 for ride in batch])
+        clock.now += 60
+    monitor.observe_batch([], [])
+
+    assert [window["window_start"][-14:] for window in windows] == [
+        "00:00:00+00:00",
+        "00:01:00+00:00",
+    ]
+    assert [window["n_events"] for window in windows] == [5000, 5000]
+    assert windows[0]["num_drifted_columns"] == 0
+    assert windows[1]["drift_scores"]["trip_distance"] > 0.1
+    assert monitor.n_events == 0
+    json.dumps(windows)
+
+
+def test_model_service_feeds_monitors():
+    sketch = fit_sketch(synthetic_data.generate_rides(1000))
+    monitor = DriftMonitor(sketch, emit=None)
+    model_service = model.ModelService(ModelMock(), monitors=[monitor])
+
+    event = synthetic_data.kinesis_event(synthetic_data.generate_rides(100))
+    model_service.lambda_handler(event)
+
+    assert monitor.n_events == 100
+    assert monitor.prediction_counts.sum() == 100
+
+
+def test_idle_monitor_closes_overdue_window():
+    rides = synthetic_data.generate_rides(1000)
+    windows = []
+    clock = Clock()
+    monitor = DriftMonitor(
+        fit_sketch(rides), window_seconds=60, emit=windows.append, clock=clock
+    )
+    monitor.observe_batch(rides[:100], [10.0] * 100)
+
+    clock.now = 59
+    monitor.close_overdue()
+    assert windows == []
+
+    # no batch comes in after the window ends
+    clock.now = 60
+    monitor.close_overdue()
+    monitor.close_overdue()
+    assert [window["n_events"] for window in windows] == [100]
+
+    clock.now = 130
+    monitor.observe_batch(rides[100:150], [10.0] * 50)
+    assert monitor.window_start == 120
+    assert monitor.n_events == 50
+
+
+def test_timer_closes_window_of_idle_monitor():
+    rides = synthetic_data.generate_rides(1000)
+    windows = []
+    emitted = threading.Event()
+    clock = Clock()
+
+    def emit(metrics):
+        windows.append(metrics)
+        emitted.set()
+
+    monitor = DriftMonitor(fit_sketch(rides), window_seconds=60, emit=emit, clock=clock)
+    monitor.start_timer(interval=0.01)
+    monitor.observe_batch(rides[:100], [10.0] * 100)
+
+    clock.now = 60
+    assert emitted.wait(5)
+    monitor.close()
+    assert [window["n_events"] for window in windows] == [100]
+
+
+def test_close_emits_open_window():
+    rides = synthetic_data.generate_rides(1000)
+    windows = []
+    monitor = DriftMonitor(
+        fit_sketch(rides), window_seconds=60, emit=windows.append, clock=Clock()
+    )
+    model_service = model.ModelService(ModelMock(), monitors=[monitor])
+    monitor.observe_batch(rides[:100], [10.0] * 100)
+
+    model_service.close()
+    model_service.close()
+
+    assert [window["n_events"] for window in windows] == [100]
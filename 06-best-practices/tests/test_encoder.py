@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+from sklearn.feature_extraction import DictVectorizer
+
+from encoder import ZonePairEncoder
+
+RIDES = [
+    {"PULocationID": 130, "DOLocationID": 205, "trip_distance": 3.66},
+    {"PULocationID": 43, "DOLocationID": 151, "trip_distance": 1.01},
+    {"PULocationID": 1, "DOLocationID": 265, "trip_distance": 0.0},
+    # pairs the DictVectorizer has never seen
+    {"PULocationID": 10, "DOLocationID": 50, "trip_distance": 40.0},
+    {"PULocationID": 999, "DOLocationID": 50, "trip_distance": 2.5},
+]
+
+
+def prepare_features(ride):
+    return {
+        "PU_DO": f"{ride['PULocationID']}_{ride['DOLocationID']}",
+        "trip_distance": ride["trip_distance"],
+    }
+
+
+def fit_dict_vectorizer(sparse=True):
+    dv = DictVectorizer(sparse=sparse)
+    dv.fit([prepare_features(ride) for ride in RIDES[:3]])
+    return dv
+
+
+def test_transform_rides_matches_dict_vectorizer():
+    dv = fit_dict_vectorizer()
+    encoder = ZonePairEncoder.from_dict_vectorizer(dv)
+
+    expected = dv.transform([prepare_features(ride) for ride in RIDES])
+    actual = encoder.transform_rides(RIDES)
+
+    assert actual.shape == expected.shape
+    assert np.array_equal(actual.indptr, expected.indptr)
+    assert np.array_equal(actual.indices, expected.indices)
+    assert np.array_equal(actual.data, expected.data)
+
+
+def test_transform_ride_matches_dict_vectorizer():
+    dv = fit_dict_vectorizer()
+    encoder = ZonePairEncoder.from_dict_vectorizer(dv)
+
+    for ride in RIDES:
+        expected = dv.transform(prepare_features(ride))
+        actual = encoder.transform_ride(ride)
+
+        assert np.array_equal(actual.indices, expected.indices)
+        assert np.array_equal(actual.data, expected.data)
+
+
+def test_transform_rides_dense():
+    dv = fit_dict_vectorizer(sparse=False)
+    encoder = ZonePairEncoder.from_dict_vectorizer(dv)
+
+    expected = dv.transform([prepare_features(ride) for ride in RIDES])
+    actual = encoder.transform_rides(RIDES)
+
+    assert np.array_equal(actual, expected)
+
+
+def test_save_and_load(tmp_path):
+    encoder = ZonePairEncoder.from_dict_vectorizer(fit_dict_vectorizer())
+    path = tmp_path / "encoder.npz"
+
+    encoder.save(path)
+    loaded_encoder = ZonePairEncoder.load(path)
+
+    expected = encoder.transform_rides(RIDES).toarray()
+    actual = loaded_encoder.transform_rides(RIDES).toarray()
+    assert np.array_equal(actual, expected)
+
+
+def test_fit_matches_dict_vectorizer():
+    dv = DictVectorizer()
+    expected = dv.fit_transform([prepare_features(ride) for ride in RIDES])
+
+    encoder = ZonePairEncoder.fit(
+        [ride["PULocationID"] for ride in RIDES],
+        [ride["DOLocationID"] for ride in RIDES],
+    )
+    actual = encoder.transform_rides(RIDES)
+
+    assert encoder.to_dict_vectorizer().feature_names_ == dv.feature_names_
+    assert encoder.to_dict_vectorizer().vocabulary_ == dv.vocabulary_
+    assert np.array_equal(actual.indptr, expected.indptr)
+    assert np.array_equal(actual.indices, expected.indices)
+    assert np.array_equal(actual.data, expected.data)
+
+
+def test_from_dict_vectorizer_rejects_unknown_features():
+    dv = DictVectorizer()
+    dv.fit(
+        [
+            {"PULocationID": "130", "DOLocationID": "205", "trip_distance": 3.66},
+            {"PU_DO": "43_151", "trip_distance": 1.01},
+        ]
+    )
+
+    with pytest.raises(ValueError, match="cannot produce"):
+        ZonePairEncoder.from_dict_vectorizer(dv)
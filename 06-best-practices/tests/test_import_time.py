@@ -0,0 +1,90 @@
+import os
+import pickle
+import subprocess
+import sys
+
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.feature_extraction import DictVectorizer
+from sklearn.pipeline import make_pipeline
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# cold start of the lambda: importing lambda_function, which loads the model
+IMPORT_TIME_BUDGET_SECONDS = float(os.getenv("IMPORT_TIME_BUDGET_SECONDS", "3"))
+# packages the scoring path must not pull in at import time
+HEAVY_PACKAGES = ["mlflow", "boto3"]
+
+
+def parse_importtime(stderr):
+    """(name, depth, self_us, cumulative_us) of every `-X importtime` line."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return imports
+
+
+def import_report(imports, top=10):
+    slowest = sorted(imports, key=lambda entry: entry[2], reverse=True)[:top]
+    return "\n".join(
+        f"{self_us / 1000:8.1f} ms  {name}" for name, _, self_us, _ in slowest
+    )
+
+
+def save_logged_model(model_dir):
+    """The layout of mlflow.sklearn.save_model, without importing mlflow."""
+    rides = [
+        {"PU_DO": "130_205", "trip_distance": 3.66},
+        {"PU_DO": "43_151", "trip_distance": 1.01},
+    ]
+    pipeline = make_pipeline(
+        DictVectorizer(), RandomForestRegressor(n_estimators=10, random_state=0)
+    )
+    pipeline.fit(rides, [14.0, 8.0])
+
+    os.makedirs(model_dir)
+    with open(os.path.join(model_dir, "MLmodel"), "w") as f_out:
+        f_out.write(
+            "flavors:\n"
+            "  sklearn:\n"
+            "    pickled_model: model.pkl\n"
+            "    serialization_format: cloudpickle\n"
+        )
+    with open(os.path.join(model_dir, "model.pkl"), "wb") as f_out:
+        pickle.dump(pipeline, f_out)
+
+
+def test_lambda_cold_start_import_time(tmp_path):
+    artifact_root = tmp_path / "artifacts"
+    save_logged_model(str(artifact_root / "run1" / "artifacts" / "model"))
+
+    env = dict(
+        os.environ,
+        RUN_ID="run1",
+        TEST_RUN="True",
+        MODEL_ARTIFACT_ROOT=str(artifact_root),
+        MODEL_CACHE_DIR=str(tmp_path / "cache"),
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import lambda_function"],
+        cwd=SERVICE_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports = parse_importtime(result.stderr)
+    report = import_report(imports)
+
+    heavy = sorted(
+        {name for name, _, _, _ in imports if name.split(".")[0] in HEAVY_PACKAGES}
+    )
+    assert not heavy, f"cold start imports {heavy}\n{report}"
+
+    cold_start_us = sum(
+        cumulative_us for _, depth, _, cumulative_us in imports if depth == 0
+    )
+    assert cold_start_us / 1e6 < IMPORT_TIME_BUDGET_SECONDS, report
@@ -0,0 +1,133 @@
+import base64
+import json
+
+import pytest
+from sklearn.feature_extraction import DictVectorizer
+
+import kinesis_codec
+import model
+import synthetic_data
+from encoder import ZonePairEncoder
+
+
+class ModelMock:
+    def predict(self, X):
+        return [10.0] * (X.shape[0] if hasattr(X, "shape") else len(X))
+
+
+def encode(data):
+    return base64.b64encode(data).decode("utf-8")
+
+
+def test_malformed_records_are_reported():
+    event = synthetic_data.kinesis_event(
+        synthetic_data.generate_rides(200), malformed_share=0.2
+    )
+
+    rides, ride_ids, failures = kinesis_codec.decode_records(event["Records"])
+
+    failed = {failure["itemIdentifier"] for failure in failures}
+    assert 0 < len(failed) < 200
+    assert len(rides) == len(ride_ids) == 200 - len(failed)
+    for record in event["Records"]:
+        sequence_number = record["kinesis"]["sequenceNumber"]
+        ride_id = int(record["kinesis"]["partitionKey"])
+        assert (sequence_number in failed) != (ride_id in ride_ids)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        "not base64!",
+        encode(b"\xff\xfe"),
+        encode(b'{"ride_id": 1}'),
+        encode(b'{"ride": [], "ride_id": 1}'),
+        encode(b'{"ride": {"PULocationID": 130}, "ride_id": 1}'),
+        encode(b"[1, 2]"),
+        encode(
+            b'{"ride": {"PULocationID": null, "DOLocationID": 205,'
+            b' "trip_distance": 3.66}, "ride_id": 1}'
+        ),
+        encode(
+            b'{"ride": {"PULocationID": 130, "DOLocationID": 205,'
+            b' "trip_distance": "3.66"}, "ride_id": 1}'
+        ),
+        encode(
+            b'{"ride": {"PULocationID": 130, "DOLocationID": true,'
+            b' "trip_distance": 3.66}, "ride_id": 1}'
+        ),
+    ],
+)
+def test_poison_records(data):
+    records = [{"kinesis": {"data": data, "sequenceNumber": "1"}}]
+
+    rides, ride_ids, failures = kinesis_codec.decode_records(records)
+
+    assert rides == ride_ids == []
+    assert failures == [{"itemIdentifier": "1"}]
+
+
+def test_poison_record_without_sequence_number_is_dropped():
+    ride_event = {"ride": synthetic_data.generate_rides(1)[0], "ride_id": 7}
+    records = [
+        {"kinesis": {"data": "not base64!"}},
+        {"kinesis": {"data": encode(json.dumps(ride_event).encode("utf-8"))}},
+    ]
+
+    rides, ride_ids, failures = kinesis_codec.decode_records(records)
+
+    assert rides == [ride_event["ride"]]
+    assert ride_ids == [7]
+    assert failures == []
+
+
+def test_lambda_handler_reports_batch_item_failures():
+    event = synthetic_data.kinesis_event(
+        synthetic_data.generate_rides(100), malformed_share=0.1
+    )
+
+    result = model.ModelService(ModelMock()).lambda_handler(event)
+
+    assert len(result["batchItemFailures"]) > 0
+    assert len(result["predictions"]) + len(result["batchItemFailures"]) == 100
+
+
+@pytest.mark.parametrize(
+    "field, value", [("PULocationID", None), ("trip_distance", "3.66")]
+)
+def test_bad_typed_ride_fails_only_its_record(field, value):
+    rides = synthetic_data.generate_rides(10)
+    rides[4][field] = value
+    event = synthetic_data.kinesis_event(rides)
+    dv = DictVectorizer()
+    dv.fit(synthetic_data.ride_features(rides[:4] + rides[5:]))
+    model_service = model.ModelService(
+        ModelMock(), encoder=ZonePairEncoder.from_dict_vectorizer(dv)
+    )
+
+    result = model_service.lambda_handler(event)
+
+    assert result["batchItemFailures"] == [
+        {"itemIdentifier": event["Records"][4]["kinesis"]["sequenceNumber"]}
+    ]
+    assert [
+        prediction_event["prediction"]["ride_id"]
+        for prediction_event in result["predictions"]
+    ] == [0, 1, 2, 3, 5, 6, 7, 8, 9]
+
+
+def test_json_fallback(monkeypatch):
+    monkeypatch.setattr(kinesis_codec, "json_loads", json.loads)
+    ride_event = {"ride": synthetic_data.generate_rides(1)[0], "ride_id": 7}
+    data = encode(json.dumps(ride_event).encode("utf-8"))
+
+    assert kinesis_codec.decode_data(data) == ride_event
+
+
+def test_json_dumps_returns_bytes():
+    prediction_event = {"prediction": {"ride_duration": 10.5, "ride_id": 7}}
+
+    data = kinesis_codec.json_dumps(prediction_event)
+
+    assert isinstance(data, bytes)
+    assert json.loads(data) == prediction_event
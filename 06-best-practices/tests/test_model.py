@@ -1,4 +1,13 @@
+import base64
+import json
+
+from sklearn.feature_extraction import DictVectorizer
+from sklearn.linear_model import LinearRegression
+from sklearn.pipeline import make_pipeline
+
 import model
+from encoder import ZonePairEncoder
+from prediction_cache import PredictionCache
 
 
 def test_prepare_features():
@@ -24,12 +33,18 @@ def test_base64_decode():
 class ModelMock:
     def __init__(self, value):
         self.value = value
+        self.calls = 0
 
     def predict(self, X):
-        n = len(X)
+        self.calls += 1
+        n = X.shape[0] if hasattr(X, "shape") else len(X)
         return [self.value] * n
 
 
+def encode_ride_event(ride_event):
+    return base64.b64encode(json.dumps(ride_event).encode("utf-8")).decode("utf-8")
+
+
 def test_predict():
     model_mock = ModelMock(10.0)
     model_service = model.ModelService(model_mock)
@@ -65,7 +80,225 @@ def test_lambda_handler():
                 "version": "Test123",
                 "prediction": {"ride_duration": 10.0, "ride_id": 256},
             }
-        ]
+        ],
+        "batchItemFailures": [],
     }
 
     assert actual_predictions == expected_predictions
+
+
+def test_lambda_handler_batches_predictions():
+    model_mock = ModelMock(10.0)
+    model_service = model.ModelService(model_mock, "Test123", max_batch_size=2)
+
+    ride = {"PULocationID": 130, "DOLocationID": 205, "trip_distance": 3.66}
+    event = {
+        "Records": [
+            {"kinesis": {"data": encode_ride_event({"ride": ride, "ride_id": i})}}
+            for i in range(5)
+        ]
+    }
+
+    actual_predictions = model_service.lambda_handler(event)
+    actual_ride_ids = [
+        prediction_event["prediction"]["ride_id"]
+        for prediction_event in actual_predictions["predictions"]
+    ]
+
+    assert model_mock.calls == 3
+    assert actual_ride_ids == [0, 1, 2, 3, 4]
+
+
+def test_lambda_handler_with_encoder():
+    dv = DictVectorizer()
+    dv.fit([{"PU_DO": "130_205", "trip_distance": 3.66}])
+    model_mock = ModelMock(10.0)
+    model_service = model.ModelService(
+        model_mock, encoder=ZonePairEncoder.from_dict_vectorizer(dv)
+    )
+
+    ride = {"PULocationID": 130, "DOLocationID": 205, "trip_distance": 3.66}
+    event = {
+        "Records": [
+            {"kinesis": {"data": encode_ride_event({"ride": ride, "ride_id": i})}}
+            for i in range(3)
+        ]
+    }
+    actual_predictions = model_service.lambda_handler(event)
+
+    assert model_mock.calls == 1
+    assert len(actual_predictions["predictions"]) == 3
+
+
+def test_load_model_with_encoder_keeps_pipeline_of_other_features(monkeypatch):
+    # separate zone id features, like lin_reg.bin, the encoder has no columns for
+    dicts = [
+        {"PULocationID": str(pu_id), "DOLocationID": str(do_id)}
+        for pu_id in range(1, 10)
+        for do_id in range(1, 10)
+    ]
+    pipeline = make_pipeline(DictVectorizer(), LinearRegression()).fit(
+        dicts, list(range(len(dicts)))
+    )
+    monkeypatch.setattr(model.model_cache, "load", lambda run_id, loader: pipeline)
+
+    for array_engine in [False, True]:
+        loaded, encoder = model.load_model_with_encoder("Test123", array_engine)
+        assert loaded is pipeline
+        assert encoder is None
+
+    model_service = model.ModelService(loaded, encoder=encoder)
+    ride = {"PULocationID": 3, "DOLocationID": 4, "trip_distance": 1.0}
+    assert model_service.predict_batch([ride]) == [
+        pipeline.predict([model_service.prepare_features(ride)])[0]
+    ]
+
+
+def test_init_falls_back_to_pyfunc(monkeypatch):
+    def load_model_with_encoder(run_id, array_engine):
+        raise ValueError("Expected a DictVectorizer + estimator pipeline")
+
+    pyfunc_model = ModelMock(10.0)
+    monkeypatch.setattr(model, "load_model_with_encoder", load_model_with_encoder)
+    monkeypatch.setattr(model, "load_model", lambda run_id: pyfunc_model)
+
+    model_service = model.init("ride-predictions", "Test123", test_run=True)
+
+    assert model_service.model is pyfunc_model
+    assert model_service.encoder is None
+
+
+def test_predict_batch_skips_model_on_cache_hits():
+    model_mock = ModelMock(10.0)
+    model_service = model.ModelService(
+        model_mock, cache=PredictionCache(max_size=10, model_version="Test123")
+    )
+    rides = [
+        {"PULocationID": 130, "DOLocationID": 205, "trip_distance": 3.66},
+        {"PULocationID": 43, "DOLocationID": 151, "trip_distance": 1.01},
+    ]
+
+    model_service.predict_batch(rides[:1])
+    actual_predictions = model_service.predict_batch(rides)
+
+    assert actual_predictions == [10.0, 10.0]
+    assert model_mock.calls == 2
+    assert model_service.cache.stats()["hits"] == 1
+
+    model_service.update_model(ModelMock(20.0), "Test456")
+    assert model_service.predict_batch(rides) == [20.0, 20.0]
+
+
+def test_predict_and_predict_batch_share_cache_entries():
+    model_mock = ModelMock(10.0)
+    model_service = model.ModelService(
+        model_mock, cache=PredictionCache(max_size=10, model_version="Test123")
+    )
+    ride = {"PULocationID": 130, "DOLocationID": 205, "trip_distance": 3.66}
+
+    model_service.predict(model_service.prepare_features(ride))
+    actual_predictions = model_service.predict_batch([ride])
+
+    assert actual_predictions == [10.0]
+    assert model_mock.calls == 1
+    assert model_service.cache.stats()["size"] == 1
+
+    model_service.predict_batch([{**ride, "PULocationID": 43}])
+    model_service.predict(model_service.prepare_features({**ride, "PULocationID": 43}))
+
+    assert model_mock.calls == 2
+    assert model_service.cache.stats()["hits"] == 2
+
+
+class KinesisClientStub:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.put_records_calls = []
+
+    def put_records(self, StreamName, Records):
+        self.put_records_calls.append(Records)
+
+        results = []
+        failed_record_count = 0
+        for _ in Records:
+            if self.failures > 0:
+                self.failures -= 1
+                failed_record_count += 1
+                results.append({"ErrorCode": "ProvisionedThroughputExceededException"})
+            else:
+                results.append({"SequenceNumber": "1", "ShardId": "shardId-0"})
+
+        return {"FailedRecordCount": failed_record_count, "Records": results}
+
+
+def make_prediction_event(ride_id):
+    return {
+        "model": "ride_duration_prediction_model",
+        "version": "Test123",
+        "prediction": {"ride_duration": 10.0, "ride_id": ride_id},
+    }
+
+
+def test_kinesis_callback_buffers_until_flush():
+    kinesis_client = KinesisClientStub()
+    kinesis_callback = model.KinesisCallback(
+        kinesis_client, "ride-predictions", buffered=True
+    )
+
+    for ride_id in range(1200):
+        kinesis_callback.put_record(make_prediction_event(ride_id))
+
+    assert kinesis_client.put_records_calls == []
+
+    kinesis_callback.flush()
+
+    actual_chunk_sizes = [len(records) for records in kinesis_client.put_records_calls]
+    assert actual_chunk_sizes == [500, 500, 200]
+    assert kinesis_callback.buffer == []
+
+
+def test_kinesis_callback_retries_failed_records():
+    kinesis_client = KinesisClientStub(failures=2)
+    kinesis_callback = model.KinesisCallback(
+        kinesis_client, "ride-predictions", buffered=True, backoff_seconds=0
+    )
+
+    for ride_id in range(3):
+        kinesis_callback.put_record(make_prediction_event(ride_id))
+    kinesis_callback.flush()
+
+    first_call, retry_call = kinesis_client.put_records_calls
+    assert len(first_call) == 3
+    assert [record["PartitionKey"] for record in retry_call] == ["0", "1"]
+
+
+def test_chunk_records_respects_byte_limit():
+    records = [{"Data": b"x" * 99, "PartitionKey": "1"} for _ in range(5)]
+
+    actual_chunks = list(model.chunk_records(records, max_bytes=250))
+
+    assert [len(chunk) for chunk in actual_chunks] == [2, 2, 1]
+
+
+def test_lambda_handler_flushes_callbacks():
+    kinesis_client = KinesisClientStub()
+    kinesis_callback = model.KinesisCallback(
+        kinesis_client, "ride-predictions", buffered=True
+    )
+    model_service = model.ModelService(
+        ModelMock(10.0),
+        callbacks=[kinesis_callback.put_record],
+        flush_callbacks=[kinesis_callback.flush],
+    )
+
+    ride = {"PULocationID": 130, "DOLocationID": 205, "trip_distance": 3.66}
+    event = {
+        "Records": [
+            {"kinesis": {"data": encode_ride_event({"ride": ride, "ride_id": i})}}
+            for i in range(3)
+        ]
+    }
+    model_service.lambda_handler(event)
+
+    assert len(kinesis_client.put_records_calls) == 1
+    assert len(kinesis_client.put_records_calls[0]) == 3
@@ -0,0 +1,166 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.feature_extraction import DictVectorizer
+from sklearn.linear_model import LinearRegression
+from sklearn.pipeline import make_pipeline
+
+import model
+from model_bundle import ModelBundle
+
+
+def generate_rides(n_rides, max_location_id, seed):
+    rng = np.random.default_rng(seed)
+    return [
+        {
+            "PULocationID": int(pu_location_id),
+            "DOLocationID": int(do_location_id),
+            "trip_distance": float(trip_distance),
+        }
+        for pu_location_id, do_location_id, trip_distance in zip(
+            rng.integers(1, max_location_id, n_rides),
+            rng.integers(1, max_location_id, n_rides),
+            rng.gamma(2.0, 1.5, n_rides).round(2),
+        )
+    ]
+
+
+def prepare_dictionaries(rides):
+    return [
+        {
+            "PU_DO": f"{ride['PULocationID']}_{ride['DOLocationID']}",
+            "trip_distance": ride["trip_distance"],
+        }
+        for ride in rides
+    ]
+
+
+def training_data():
+    rides = generate_rides(2000, 30, seed=0)
+    y = np.array(
+        [ride["trip_distance"] * 4 + ride["PULocationID"] % 7 for ride in rides]
+    )
+    return prepare_dictionaries(rides), y
+
+
+# unseen zone pairs included
+REFERENCE_RIDES = generate_rides(500, 40, seed=1)
+
+
+def assert_same_predictions(bundle, path, expected):
+    bundle.save(str(path))
+    loaded = ModelBundle.load(str(path))
+    dicts = prepare_dictionaries(REFERENCE_RIDES)
+
+    np.testing.assert_array_equal(loaded.predict_rides(REFERENCE_RIDES), expected)
+    np.testing.assert_array_equal(loaded.predict(dicts), expected)
+    np.testing.assert_array_equal(
+        loaded.predict(loaded.encoder.transform_rides(REFERENCE_RIDES)), expected
+    )
+    assert loaded.predict_ride(REFERENCE_RIDES[0]) == expected[0]
+
+
+def test_linear_bundle(tmp_path):
+    dicts, y = training_data()
+    dv = DictVectorizer()
+    lr = LinearRegression().fit(dv.fit_transform(dicts), y)
+
+    expected = lr.predict(dv.transform(prepare_dictionaries(REFERENCE_RIDES)))
+    bundle = ModelBundle.from_linear(dv, lr)
+    assert_same_predictions(bundle, tmp_path / "bundle", expected)
+
+
+def test_random_forest_bundle(tmp_path):
+    dicts, y = training_data()
+    pipeline = make_pipeline(
+        DictVectorizer(),
+        RandomForestRegressor(n_estimators=10, max_depth=8, random_state=0),
+    )
+    pipeline.fit(dicts, y)
+
+    expected = pipeline.predict(prepare_dictionaries(REFERENCE_RIDES))
+    bundle = ModelBundle.from_pipeline(pipeline)
+    assert_same_predictions(bundle, tmp_path / "bundle", expected)
+
+
+def test_random_forest_at_split_values():
+    dicts, y = training_data()
+    pipeline = make_pipeline(
+        DictVectorizer(),
+        RandomForestRegressor(n_estimators=10, max_depth=8, random_state=0),
+    )
+    pipeline.fit(dicts, y)
+    bundle = ModelBundle.from_pipeline(pipeline)
+
+    # trip distances on and right above the thresholds, as float32 sees them
+    split_values = bundle.split_values.astype(np.float32)
+    trip_distances = np.concatenate(
+        [split_values, np.nextafter(split_values, np.float32(np.inf))]
+    )
+    rides = [
+        dict(ride, trip_distance=float(trip_distance))
+        for ride, trip_distance in zip(
+            REFERENCE_RIDES * (len(trip_distances) // len(REFERENCE_RIDES) + 1),
+            trip_distances,
+        )
+    ]
+
+    expected = pipeline.predict(prepare_dictionaries(rides))
+    np.testing.assert_array_equal(bundle.predict_rides(rides), expected)
+
+
+def test_bundle_rejects_unknown_features():
+    # the features of lin_reg.bin, which the bundle has no columns for
+    rides = generate_rides(200, 30, seed=0)
+    dicts = [
+        {
+            "PULocationID": str(ride["PULocationID"]),
+            "DOLocationID": str(ride["DOLocationID"]),
+            "trip_distance": ride["trip_distance"],
+        }
+        for ride in rides
+    ]
+    y = np.array([ride["trip_distance"] * 4 for ride in rides])
+    pipeline = make_pipeline(DictVectorizer(), LinearRegression()).fit(dicts, y)
+
+    with pytest.raises(ValueError, match="cannot produce"):
+        ModelBundle.from_pipeline(pipeline)
+
+
+def test_xgboost_bundle(tmp_path):
+    xgb = pytest.importorskip("xgboost")
+
+    dicts, y = training_data()
+    dv = DictVectorizer()
+    X = dv.fit_transform(dicts)
+    booster = xgb.train(
+        {"max_depth": 6, "objective": "reg:squarederror", "seed": 42},
+        xgb.DMatrix(X, label=y),
+        num_boost_round=10,
+    )
+
+    X_reference = dv.transform(prepare_dictionaries(REFERENCE_RIDES))
+    expected = booster.predict(xgb.DMatrix(X_reference))
+    bundle = ModelBundle.from_booster(dv, booster)
+    assert_same_predictions(bundle, tmp_path / "bundle", expected)
+
+
+def test_model_service_with_bundle(tmp_path):
+    dicts, y = training_data()
+    pipeline = make_pipeline(
+        DictVectorizer(),
+        RandomForestRegressor(n_estimators=10, max_depth=8, random_state=0),
+    )
+    pipeline.fit(dicts, y)
+    ModelBundle.from_pipeline(pipeline).save(str(tmp_path / "bundle"))
+
+    model_service = model.init(
+        prediction_stream_name=None,
+        run_id="run1",
+        test_run=True,
+        model_bundle=str(tmp_path / "bundle"),
+    )
+
+    expected = pipeline.predict(prepare_dictionaries(REFERENCE_RIDES)).tolist()
+    assert model_service.predict_batch(REFERENCE_RIDES) == expected
+    assert model_service.predict(dicts[0]) == pipeline.predict([dicts[0]])[0]
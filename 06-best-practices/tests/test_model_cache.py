@@ -0,0 +1,73 @@
+import os
+import shutil
+
+from model_cache import ModelCache
+
+
+def make_run(artifact_root, run_id, content):
+    model_dir = artifact_root / run_id / "artifacts" / "model"
+    model_dir.mkdir(parents=True)
+    (model_dir / "MLmodel").write_text(f"run_id: {run_id}\n")
+    (model_dir / "model.pkl").write_bytes(content)
+    return model_dir
+
+
+def read_model(path):
+    with open(os.path.join(path, "model.pkl"), "rb") as f_in:
+        return f_in.read()
+
+
+def test_model_is_downloaded_once(tmp_path):
+    artifact_root = tmp_path / "artifacts"
+    make_run(artifact_root, "run1", b"model one")
+
+    cache = ModelCache(cache_dir=str(tmp_path / "cache"), artifact_root=artifact_root)
+    assert read_model(cache.get_path("run1")) == b"model one"
+
+    # a new process finds it on disk without the artifact store
+    shutil.rmtree(artifact_root)
+    cache = ModelCache(cache_dir=str(tmp_path / "cache"), artifact_root=artifact_root)
+    assert read_model(cache.get_path("run1")) == b"model one"
+
+
+def test_load_is_memoized(tmp_path):
+    artifact_root = tmp_path / "artifacts"
+    make_run(artifact_root, "run1", b"model one")
+    cache = ModelCache(cache_dir=str(tmp_path / "cache"), artifact_root=artifact_root)
+
+    calls = []
+
+    def loader(path):
+        calls.append(path)
+        return read_model(path)
+
+    assert cache.load("run1", loader) == b"model one"
+    assert cache.load("run1", loader) == b"model one"
+    assert len(calls) == 1
+
+
+def test_corrupted_files_are_downloaded_again(tmp_path):
+    artifact_root = tmp_path / "artifacts"
+    make_run(artifact_root, "run1", b"model one")
+    cache = ModelCache(cache_dir=str(tmp_path / "cache"), artifact_root=artifact_root)
+
+    path = cache.get_path("run1")
+    with open(os.path.join(path, "model.pkl"), "wb") as f_out:
+        f_out.write(b"truncated")
+
+    assert read_model(cache.get_path("run1")) == b"model one"
+
+
+def test_least_recently_used_models_are_evicted(tmp_path):
+    artifact_root = tmp_path / "artifacts"
+    make_run(artifact_root, "run1", b"1" * 1000)
+    make_run(artifact_root, "run2", b"2" * 1000)
+    cache = ModelCache(
+        cache_dir=str(tmp_path / "cache"), max_bytes=1500, artifact_root=artifact_root
+    )
+
+    path1 = cache.get_path("run1")
+    path2 = cache.get_path("run2")
+
+    assert not os.path.exists(path1)
+    assert read_model(path2) == b"2" * 1000
@@ -0,0 +1,57 @@
+from prediction_cache import PredictionCache, features_key, ride_key
+
+
+def test_ride_key_buckets_trip_distance():
+    ride = {"PULocationID": 130, "DOLocationID": 205, "trip_distance": 3.6612}
+
+    assert ride_key(ride) == (130, 205, 3.66)
+    assert ride_key(ride, distance_precision=1) == (130, 205, 3.7)
+
+
+def test_features_key_is_the_ride_key():
+    ride = {"PULocationID": 130.0, "DOLocationID": 205, "trip_distance": 3.6612}
+    features = {"PU_DO": "130_205", "trip_distance": 3.66}
+
+    assert features_key(features) == ride_key(ride)
+
+
+def test_get_counts_hits_and_misses():
+    cache = PredictionCache(max_size=10)
+
+    assert cache.get((130, 205, 3.66)) is None
+    cache.put((130, 205, 3.66), 21.3)
+
+    assert cache.get((130, 205, 3.66)) == 21.3
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 1, 1)
+
+
+def test_put_evicts_least_recently_used():
+    cache = PredictionCache(max_size=2)
+    cache.put("a", 1.0)
+    cache.put("b", 2.0)
+    cache.get("a")
+    cache.put("c", 3.0)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1.0
+    assert cache.stats()["evictions"] == 1
+
+
+def test_expired_entries_are_misses():
+    cache = PredictionCache(max_size=10, ttl_seconds=-1)
+    cache.put("a", 1.0)
+
+    assert cache.get("a") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_set_model_version_invalidates():
+    cache = PredictionCache(max_size=10, model_version="v1")
+    cache.put("a", 1.0)
+
+    cache.set_model_version("v1")
+    assert cache.get("a") == 1.0
+
+    cache.set_model_version("v2")
+    assert cache.get("a") is None
@@ -0,0 +1,42 @@
+import os
+
+import pytest
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(SERVICE_DIR)
+
+# modules every week folder that needs them keeps a copy of, the copies in
+# this folder (taxi_data in batch_deployment, batcher in web-service) are
+# the tested originals
+SHARED_MODULES = {
+    "encoder.py": SERVICE_DIR,
+    "model_bundle.py": SERVICE_DIR,
+    "model_cache.py": SERVICE_DIR,
+    "prediction_cache.py": SERVICE_DIR,
+    "kinesis_codec.py": SERVICE_DIR,
+    "taxi_data.py": os.path.join(REPO_DIR, "04-deployment", "batch_deployment"),
+    "batcher.py": os.path.join(REPO_DIR, "04-deployment", "web-service"),
+}
+
+
+def module_copies(file_name):
+    for directory, dirs, files in os.walk(REPO_DIR):
+        dirs[:] = [name for name in dirs if not name.startswith(".")]
+        if file_name in files:
+            yield os.path.join(directory, file_name)
+
+
+@pytest.mark.parametrize("file_name", sorted(SHARED_MODULES))
+def test_copies_are_identical(file_name):
+    original = os.path.join(SHARED_MODULES[file_name], file_name)
+    with open(original, "rb") as f_in:
+        source = f_in.read()
+
+    copies = [path for path in module_copies(file_name) if path != original]
+    assert copies
+    for path in copies:
+        with open(path, "rb") as f_in:
+            assert f_in.read() == source, (
+                f"{os.path.relpath(path, REPO_DIR)} differs from "
+                f"{os.path.relpath(original, REPO_DIR)}, copy the original over it"
+            )
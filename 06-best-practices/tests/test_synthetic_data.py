@@ -0,0 +1,88 @@
+import base64
+import json
+
+import numpy as np
+import pyarrow.parquet as pq
+
+import model
+import synthetic_data
+
+
+def test_trips_have_green_taxi_schema(tmp_path):
+    path = str(tmp_path / "green_tripdata_2022-02.parquet")
+    synthetic_data.write_trips(path, 10_000, year=2022, month=2, chunk_size=3_000)
+
+    parquet_file = pq.ParquetFile(path)
+    assert parquet_file.schema_arrow == synthetic_data.GREEN_TAXI_SCHEMA
+    assert parquet_file.metadata.num_rows == 10_000
+    assert parquet_file.metadata.num_row_groups == 4
+
+    df = parquet_file.read().to_pandas()
+    # chunks cover consecutive parts of the month
+    assert df["lpep_pickup_datetime"].is_monotonic_increasing
+    assert df["lpep_pickup_datetime"].min().month == 2
+    assert df["lpep_pickup_datetime"].max().month == 2
+    assert (df["lpep_dropoff_datetime"] >= df["lpep_pickup_datetime"]).all()
+    assert df["PULocationID"].between(1, synthetic_data.NUM_ZONES).all()
+    assert df["DOLocationID"].between(1, synthetic_data.NUM_ZONES).all()
+
+
+def test_trips_are_reproducible():
+    first = next(synthetic_data.generate_trips(1_000, seed=7))
+    second = next(synthetic_data.generate_trips(1_000, seed=7))
+    assert first.equals(second)
+
+
+def test_zone_pairs_are_skewed():
+    table = next(synthetic_data.generate_trips(50_000))
+    pairs = (
+        table.group_by(["PULocationID", "DOLocationID"])
+        .aggregate([("PULocationID", "count")])
+        .column("PULocationID_count")
+        .to_numpy()
+    )
+    top = np.sort(pairs)[::-1][: len(pairs) // 100]
+    assert top.sum() > 0.2 * table.num_rows
+
+
+def test_drift_starts_on_drift_start_day():
+    table = next(synthetic_data.generate_trips(50_000, drift=1.0, drift_start_day=14))
+    df = table.to_pandas()
+    before = df["lpep_pickup_datetime"].dt.day <= 14
+
+    assert (
+        df.loc[~before, "trip_distance"].median()
+        > 1.5 * df.loc[before, "trip_distance"].median()
+    )
+
+
+def test_kinesis_events_run_through_the_handler():
+    events = list(synthetic_data.generate_kinesis_events(250, batch_size=100))
+    assert [len(event["Records"]) for event in events] == [100, 100, 50]
+
+    record = events[1]["Records"][0]
+    ride_event = model.base64_decode(record["kinesis"]["data"])
+    assert ride_event["ride_id"] == 100
+    assert record["kinesis"]["partitionKey"] == "100"
+
+    class ModelMock:
+        def predict(self, X):
+            return [10.0] * len(X)
+
+    result = model.ModelService(ModelMock()).lambda_handler(events[2])
+    assert len(result["predictions"]) == 50
+
+
+def test_malformed_records():
+    event = synthetic_data.kinesis_event(
+        synthetic_data.generate_rides(200), malformed_share=0.5
+    )
+
+    malformed = 0
+    for record in event["Records"]:
+        data = base64.b64decode(record["kinesis"]["data"])
+        try:
+            json.loads(data)
+        except ValueError:
+            malformed += 1
+    assert 50 < malformed < 150